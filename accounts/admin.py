@@ -7,16 +7,16 @@ from .models import CustomUser
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
-    list_display = ['username', 'email', 'role', 'is_active', 'created_at']
-    list_filter = ['role', 'is_active', 'created_at']
+    list_display = ['username', 'email', 'role', 'club', 'is_district', 'is_active', 'created_at']
+    list_filter = ['role', 'club', 'is_district', 'is_active', 'created_at']
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Information', {
-            'fields': ('role', 'phone')
+            'fields': ('role', 'club', 'is_district', 'phone')
         }),
     )
     add_fieldsets = UserAdmin.add_fieldsets + (
         ('Additional Information', {
-            'fields': ('role', 'phone', 'email')
+            'fields': ('role', 'club', 'is_district', 'phone', 'email')
         }),
     )
 
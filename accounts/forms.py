@@ -6,9 +6,9 @@ from .models import CustomUser
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
         model = CustomUser
-        fields = ('username', 'email', 'role', 'phone')
+        fields = ('username', 'email', 'role', 'club', 'phone')
 
 class CustomUserChangeForm(UserChangeForm):
     class Meta:
         model = CustomUser
-        fields = ('username', 'email', 'role', 'phone')
\ No newline at end of file
+        fields = ('username', 'email', 'role', 'club', 'phone')
\ No newline at end of file
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('ledger', '0017_club_tenancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='club',
+            field=models.ForeignKey(blank=True, help_text='Leave empty for district officers, who can switch between clubs.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='ledger.club'),
+        ),
+    ]
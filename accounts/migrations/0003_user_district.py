@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_main_club(apps, schema_editor):
+    # Users without a club were treated as district officers; they belong to the main club
+    Club = apps.get_model('ledger', 'Club')
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    main = Club.objects.filter(slug='main').first() or Club.objects.order_by('pk').first()
+    if main is not None:
+        CustomUser.objects.filter(club__isnull=True).update(club=main)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_club'),
+        ('ledger', '0017_club_tenancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='is_district',
+            field=models.BooleanField(default=False, help_text='District officers (and superusers) can switch between clubs.', verbose_name='district officer'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='club',
+            field=models.ForeignKey(blank=True, help_text='The club whose books this user works on. Defaults to the main club.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='ledger.club'),
+        ),
+        migrations.RunPython(assign_main_club, migrations.RunPython.noop),
+    ]
@@ -13,12 +13,31 @@ class CustomUser(AbstractUser):
     
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='viewer')
     phone = models.CharField(max_length=15, blank=True)
+    club = models.ForeignKey(
+        'ledger.Club', on_delete=models.PROTECT, null=True, blank=True, related_name='users',
+        help_text='The club whose books this user works on. Defaults to the main club.'
+    )
+    is_district = models.BooleanField(
+        default=False, verbose_name='district officer',
+        help_text='District officers (and superusers) can switch between clubs.'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
+    @property
+    def can_switch_clubs(self):
+        return self.is_district or self.is_superuser
+
+    def save(self, *args, **kwargs):
+        # A user outside the district office always belongs to a club; never infer access from a missing one
+        if self.club_id is None and not self.is_district:
+            from ledger.models import Club
+            self.club_id = Club.objects.default_id()
+        super().save(*args, **kwargs)
+
     class Meta:
         permissions = [
             ("can_view_reports", "Can view financial reports"),
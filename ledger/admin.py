@@ -1,12 +1,30 @@
 # ledger/admin.py
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 from .models import *
 
+# Club Admin (each admin page shows the club chosen in the navigation bar)
+@admin.register(Club)
+class ClubAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    search_fields = ['name', 'slug']
+    prepopulated_fields = {'slug': ['name']}
+
 # ExpenseType Admin
 @admin.register(ExpenseType)
 class ExpenseTypeAdmin(admin.ModelAdmin):
     list_display = ['name', 'is_active']
     list_filter = ['is_active']
+    search_fields = ['name']
 
 # Member Admin
 @admin.register(Member)
@@ -35,18 +53,67 @@ class AccountAdmin(admin.ModelAdmin):
     list_filter = ['account_type', 'is_active']
     search_fields = ['name']
 
+# Reconciliation Run Admin
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'mode', 'accounts_checked', 'drifted_accounts', 'total_drift', 'repaired']
+    list_filter = ['mode', 'repaired']
+    readonly_fields = [f.name for f in ReconciliationRun._meta.fields]
+
+# Accounting Period Admin (deleting a period reopens it)
+class PeriodTotalInline(admin.TabularInline):
+    model = PeriodTotal
+    extra = 0
+    can_delete = False
+    readonly_fields = ['dimension', 'label', 'total_in', 'total_out', 'closing_balance']
+    fields = readonly_fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(AccountingPeriod)
+class AccountingPeriodAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'period_type', 'start_date', 'end_date', 'closed_at', 'closed_by']
+    list_filter = ['period_type']
+    readonly_fields = ['period_type', 'start_date', 'end_date', 'closed_at', 'closed_by']
+    inlines = [PeriodTotalInline]
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'period_type', 'start_date', 'revenue_type', 'expense_type', 'amount']
+    list_filter = ['period_type', 'revenue_type', 'expense_type']
+    date_hierarchy = 'start_date'
+
+class ClosedPeriodAdminMixin:
+    """Payments dated in a closed period are read-only in the admin."""
+
+    def is_closed(self, obj):
+        return obj is not None and AccountingPeriod.all_clubs.filter(
+            tenant_id=obj.tenant_id, start_date__lte=obj.payment_date, end_date__gte=obj.payment_date
+        ).exists()
+
+    def has_change_permission(self, request, obj=None):
+        return super().has_change_permission(request, obj) and not self.is_closed(obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return super().has_delete_permission(request, obj) and not self.is_closed(obj)
+
 # Payment In Admin
 @admin.register(PaymentIn)
-class PaymentInAdmin(admin.ModelAdmin):
+class PaymentInAdmin(ClosedPeriodAdminMixin, admin.ModelAdmin):
     list_display = ['receipt_number', 'payer_name', 'amount', 'payment_date', 'payment_method', 'account']
     list_filter = ['payment_date', 'payment_method', 'revenue_type', 'account']
     search_fields = ['payer_name', 'receipt_number', 'payer_member__name']
 
 # Payment Out Admin
 @admin.register(PaymentOut)
-class PaymentOutAdmin(admin.ModelAdmin):
-    list_display = ['receipt_number', 'payee_name', 'amount', 'payment_date', 'payment_method', 'account']
-    list_filter = ['payment_date', 'payment_method', 'account', 'payee_supplier']
+class PaymentOutAdmin(ClosedPeriodAdminMixin, admin.ModelAdmin):
+    list_display = ['receipt_number', 'payee_name', 'expense_type', 'amount', 'payment_date', 'payment_method', 'account']
+    list_filter = ['payment_date', 'payment_method', 'account', 'expense_type', 'payee_supplier']
+    list_select_related = ['expense_type', 'account']
     search_fields = ['payee_name', 'receipt_number', 'payee_supplier__name']
 
 # Audit Log Admin
@@ -55,3 +122,123 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['user', 'action', 'object_type', 'timestamp']
     list_filter = ['action', 'object_type', 'timestamp']
     readonly_fields = ['user', 'action', 'object_type', 'object_id', 'description', 'ip_address', 'timestamp']
+
+
+# Request Profile Admin
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'peak_memory_kb', 'user', 'downloads']
+    list_filter = ['url_name', 'created_at']
+    search_fields = ['path', 'url_name']
+    readonly_fields = [f.name for f in RequestProfile._meta.fields] + ['downloads']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/<str:kind>/',
+                self.admin_site.admin_view(self.download_view),
+                name='ledger_requestprofile_download',
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description='Downloads')
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">profile (.prof)</a> | <a href="{}">allocations (.txt)</a>',
+            reverse('admin:ledger_requestprofile_download', args=[obj.pk, 'profile']),
+            reverse('admin:ledger_requestprofile_download', args=[obj.pk, 'allocations']),
+        )
+
+    def download_view(self, request, pk, kind):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        filenames = {'profile': profile.profile_file, 'allocations': profile.allocations_file}
+        if kind not in filenames:
+            raise Http404
+        file_path = Path(settings.LEDGER_PROFILE_DIR) / filenames[kind]
+        if not file_path.is_file():
+            raise Http404("The profile file is no longer on disk.")
+        return FileResponse(file_path.open('rb'), as_attachment=True, filename=filenames[kind])
+
+# Export Job Admin
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'status', 'requested_by', 'rows_written', 'rows_total', 'file_size']
+    list_filter = ['status', 'created_at']
+    readonly_fields = [f.name for f in ExportJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+# Payment API token Admin (create tokens with `manage.py create_api_token`)
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ['name', 'prefix', 'user', 'is_active', 'created_at', 'last_used_at']
+    list_filter = ['is_active']
+    readonly_fields = ['prefix', 'created_at', 'last_used_at']
+    actions = ['revoke']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Revoke selected tokens')
+    def revoke(self, request, queryset):
+        revoked = queryset.update(is_active=False)
+        self.message_user(request, f"Revoked {revoked} token(s).")
+
+# Background Job Admin
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'priority', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    readonly_fields = ['attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status='running').update(status='queued', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"Requeued {count} job(s).")
+
+
+@admin.register(Schedule)
+class ScheduleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'cron', 'task', 'priority', 'enabled', 'next_run_at', 'last_run_at']
+    list_filter = ['enabled']
+    readonly_fields = ['last_run_at']
+    actions = ['run_now']
+
+    @admin.action(description='Run selected schedules now')
+    def run_now(self, request, queryset):
+        from .jobs import enqueue
+        for schedule in queryset:
+            enqueue(schedule.task, priority=schedule.priority, **schedule.kwargs)
+        self.message_user(request, f"Queued {queryset.count()} job(s).")
+
+    def save_model(self, request, obj, form, change):
+        if 'cron' in form.changed_data:
+            obj.next_run_at = None
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(EmailDelivery)
+class EmailDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'kind', 'recipient', 'status', 'sent_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['recipient', 'payment__receipt_number', 'member__name']
+    readonly_fields = [f.name for f in EmailDelivery._meta.fields]
+    actions = ['resend']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Send selected emails again')
+    def resend(self, request, queryset):
+        from .mail import schedule_send
+        count = queryset.exclude(status='sending').update(status='queued', batch='', error='')
+        schedule_send()
+        self.message_user(request, f"Queued {count} email(s).")
@@ -0,0 +1,132 @@
+# ledger/analytics.py
+"""Revenue trends for the dashboard.
+
+Income for the club's whole history is read in one grouped query (month x
+revenue type) and laid out as flat arrays of floats, one per revenue type
+plus their total, indexed by months since the January the history starts
+in. Every statistic below is then computed on whole arrays: slices of 12
+are years, a stride of 12 is one calendar month across the years, and the
+prefix sums give rolling averages of any window in a single pass. Ten years
+is 120 slots per series, so the dashboard's cost doesn't grow with the
+number of payments or of buckets.
+"""
+from array import array
+from datetime import date
+from itertools import accumulate
+from math import fsum
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import CharField, Sum
+from django.db.models.functions import Cast, Substr
+
+from .models import PaymentIn
+
+# The yearly chart and its comparison need this many years even for a new club
+MIN_YEARS = 10
+ROLLING_WINDOWS = (3, 12)
+
+
+def month_index(day, origin):
+    return (day.year - origin.year) * 12 + day.month - origin.month
+
+
+def zeros(length):
+    return array('d', bytes(8 * length))
+
+
+def revenue_by_month(today):
+    """(origin, {revenue type: monthly array}, total array) covering the history up to this month."""
+    # "YYYY-MM" from the ISO date; SQLite's TruncMonth is a Python function called once per row
+    rows = [
+        (date(int(month[:4]), int(month[5:7]), 1), name, total)
+        for month, name, total in PaymentIn.objects.filter(payment_date__lte=today)
+        .annotate(month=Substr(Cast('payment_date', CharField()), 1, 7))
+        .values_list('month', 'revenue_type__name')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    ]
+    first_year = min((month.year for month, _, _ in rows), default=today.year)
+    origin = date(min(first_year, today.year - MIN_YEARS + 1), 1, 1)
+    length = month_index(today, origin) + 1
+
+    series = {}
+    for month, name, total in rows:
+        values = series.get(name)
+        if values is None:
+            values = series[name] = zeros(length)
+        values[month_index(month, origin)] += float(total)
+    total = array('d', map(fsum, zip(*series.values()))) if series else zeros(length)
+    return origin, series, total
+
+
+def rolling_mean(values, window):
+    """Mean of the last `window` slots at each position (fewer at the start)."""
+    prefix = [0.0, *accumulate(values)]
+    return [(prefix[i] - prefix[max(0, i - window)]) / min(window, i) for i in range(1, len(prefix))]
+
+
+def yearly(values):
+    return [fsum(values[i:i + 12]) for i in range(0, len(values), 12)]
+
+
+def change(current, previous):
+    delta = current - previous
+    return {
+        'current': current,
+        'previous': previous,
+        'change': delta,
+        'change_pct': delta / previous * 100 if previous else None,
+    }
+
+
+def seasonality(values, complete_years):
+    """Per calendar month: the average over complete years and its ratio to the average month."""
+    if not complete_years:
+        return []
+    history = values[:complete_years * 12]
+    overall = fsum(history) / len(history)
+    months = []
+    for month in range(12):
+        average = fsum(history[month::12]) / complete_years
+        months.append({
+            'label': date(2000, month + 1, 1).strftime('%b'),
+            'average': average,
+            'index': average / overall if overall else None,
+        })
+    return months
+
+
+def breakdown(series, end):
+    """Each revenue type's last 12 months against the 12 before, largest first."""
+    current = {name: fsum(values[max(0, end - 12):end]) for name, values in series.items()}
+    grand_total = fsum(current.values())
+    lines = []
+    for name, values in series.items():
+        line = change(current[name], fsum(values[max(0, end - 24):max(0, end - 12)]))
+        line['name'] = name
+        line['share'] = current[name] / grand_total * 100 if grand_total else None
+        lines.append(line)
+    return sorted(lines, key=lambda line: (-line['current'], line['name']))
+
+
+def revenue_trends(today):
+    """Everything the dashboard charts and summarises about income, from a single query."""
+    origin, series, total = revenue_by_month(today)
+    end = len(total)  # one past this month
+    this_year = month_index(date(today.year, 1, 1), origin)
+    years = yearly(total)
+    rolling = {window: rolling_mean(total, window) for window in ROLLING_WINDOWS}
+
+    return {
+        'origin': origin,
+        'monthly': list(total),
+        'month_labels': [(origin + relativedelta(months=i)).strftime('%b %Y') for i in range(end)],
+        'rolling': rolling,
+        'years': [origin.year + i for i in range(len(years))],
+        'yearly': years,
+        'month': change(total[-1], total[-13]),
+        'year_to_date': change(fsum(total[this_year:end]), fsum(total[this_year - 12:end - 12])),
+        'rolling_12': change(rolling[12][-1], rolling[12][-13]),
+        'breakdown': breakdown(series, end),
+        'seasonality': seasonality(total, this_year // 12),
+    }
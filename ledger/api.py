@@ -0,0 +1,441 @@
+# ledger/api.py
+"""JSON API for posting payments from other systems, e.g. mobile-money confirmations.
+
+Clients send `Authorization: Bearer <key>` for an ApiToken, which also fixes
+the club the payments go to. A request may carry an Idempotency-Key header:
+the response to the first successful request with a key is stored and
+replayed to retries with the same body, so a client that timed out can post
+again without double-posting. A batch is validated up front against one
+prefetched lookup per related table, then written in a single transaction:
+bulk inserts, and one balance UPDATE per account however many payments
+the batch holds. Either the whole batch is posted or none of it is.
+"""
+import hashlib
+import hmac
+import json
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from . import caching, metrics, tenancy
+from .imports import allocate_receipt_numbers
+from .models import (
+    Account, AccountingPeriod, ApiToken, CategoryTotal, ExpenseType, IdempotencyKey, Member, PaymentIn,
+    PaymentOut, RevenueType, Supplier,
+)
+from .permissions import is_ledger_staff
+
+# last_used_at is only written when it is older than this, not on every request
+TOUCH_INTERVAL = timedelta(minutes=1)
+
+PAYMENT_IN_FIELDS = {
+    'member': 'Member id; or give member_rid, or payer_name for a non-member',
+    'member_rid': "Member's RID",
+    'payer_name': 'Payer name when the payer is not a member',
+    'contact': 'Payer phone number (optional)',
+    'email': 'Payer email (optional; members default to theirs)',
+    'revenue_type': 'Revenue type id or name',
+    'amount': 'Amount, e.g. "15000.00"',
+    'payment_date': 'YYYY-MM-DD (default today)',
+    'payment_method': 'cash, bank, mobile or cheque',
+    'account': 'Account id',
+    'notes': 'Free text, e.g. the mobile-money transaction id (optional)',
+}
+
+PAYMENT_OUT_FIELDS = {
+    'supplier': 'Supplier id; or give payee_name',
+    'payee_name': 'Payee name when the payee is not a supplier',
+    'contact': 'Payee phone number (optional)',
+    'expense_type': 'Expense type name (created if new) or id',
+    'amount': 'Amount, e.g. "15000.00"',
+    'payment_date': 'YYYY-MM-DD (default today)',
+    'payment_method': 'cash, bank or cheque',
+    'account': 'Account id',
+    'reason': 'What the payment was for',
+    'invoice_number': 'Supplier invoice number (optional, unique per club)',
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def authenticate(request):
+    """The active token named by the Authorization header, or None."""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not key.strip():
+        return None
+    digest = ApiToken.digest(key.strip())
+    token = ApiToken.all_clubs.select_related('user').filter(key_digest=digest, is_active=True).first()
+    # The lookup is by digest; compare again in constant time before trusting it
+    if token is None or not hmac.compare_digest(token.key_digest, digest) or not is_ledger_staff(token.user):
+        return None
+    now = timezone.now()
+    if token.last_used_at is None or now - token.last_used_at > TOUCH_INTERVAL:
+        ApiToken.all_clubs.filter(pk=token.pk).update(last_used_at=now)
+    return token
+
+
+def as_pk(value):
+    """Ids may be sent as numbers or numeric strings."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def by_id_or_name(rows, value):
+    pk = as_pk(value)
+    if pk is not None:
+        return next((row for row in rows if row.pk == pk), None)
+    if isinstance(value, str):
+        name = ' '.join(value.split()).casefold()
+        return next((row for row in rows if ' '.join(row.name.split()).casefold() == name), None)
+    return None
+
+
+def clean_instance(instance, data, fields, errors):
+    """Copy the plain fields from `data` onto `instance` and validate them without touching the database."""
+    for name in fields:
+        if name in data and data[name] is not None:
+            setattr(instance, name, data[name] if not isinstance(data[name], (int, float)) else str(data[name]))
+    if not instance.payment_date:
+        instance.payment_date = timezone.localdate()
+    try:
+        instance.clean_fields(exclude=['tenant', 'receipt_number', 'created_by', 'account', 'revenue_type',
+                                       'payer_member', 'expense_type', 'payee_supplier'])
+    except ValidationError as exc:
+        errors.update(exc.message_dict)
+
+
+class PaymentInBatch:
+    model = PaymentIn
+    category = 'revenue_type'
+    plain_fields = ['payer_name', 'contact', 'email', 'amount', 'payment_date', 'payment_method', 'notes']
+
+    def __init__(self, items, user):
+        self.items = items
+        self.user = user
+
+    def prefetch(self):
+        ids = {as_pk(item.get('member')) for item in self.items} - {None}
+        rids = {str(item['member_rid']) for item in self.items if item.get('member_rid')}
+        members = Member.objects.filter(Q(pk__in=ids) | Q(rid__in=rids)) if ids or rids else []
+        self.members_by_id = {member.pk: member for member in members}
+        self.members_by_rid = {member.rid: member for member in self.members_by_id.values()}
+        self.revenue_types = list(RevenueType.objects.filter(is_active=True))
+        self.accounts = {account.pk: account for account in Account.objects.filter(is_active=True)}
+
+    def build(self, item, errors):
+        payment = PaymentIn(created_by=self.user)
+        clean_instance(payment, item, self.plain_fields, errors)
+
+        member = None
+        if item.get('member') is not None:
+            member = self.members_by_id.get(as_pk(item['member']))
+            if member is None:
+                errors['member'] = ['No such member.']
+        elif item.get('member_rid'):
+            member = self.members_by_rid.get(str(item['member_rid']))
+            if member is None:
+                errors['member_rid'] = [f"No member has RID {item['member_rid']}."]
+        if member is not None:
+            payment.payer_member = member
+            payment.payer_name = member.name
+            payment.contact = payment.contact or member.contact
+            payment.email = payment.email or member.email
+            errors.pop('payer_name', None)
+        elif 'member' not in errors and 'member_rid' not in errors and not payment.payer_name:
+            errors['payer_name'] = ['Give a member, member_rid or payer_name.']
+
+        payment.revenue_type = by_id_or_name(self.revenue_types, item.get('revenue_type'))
+        if payment.revenue_type_id is None:
+            errors['revenue_type'] = ['No such active revenue type.']
+        payment.account = self.accounts.get(as_pk(item.get('account')))
+        if payment.account_id is None:
+            errors['account'] = ['No such active account.']
+        return payment
+
+    def allocate(self, payments):
+        by_month = defaultdict(list)
+        for payment in payments:
+            by_month[payment.payment_date.replace(day=1)].append(payment)
+        for month, group in by_month.items():
+            for payment, number in zip(group, allocate_receipt_numbers(month, len(group))):
+                payment.receipt_number = number
+
+    def direction(self, amount):
+        return amount
+
+    def save_related(self, payments):
+        pass
+
+    def after_commit(self, payments, tenant_id):
+        caching.bump_version('payment_in', tenant_id)
+
+    def serialize(self, payment):
+        return {
+            'id': payment.pk,
+            'receipt_number': payment.receipt_number,
+            'payer_name': payment.payer_name,
+            'amount': str(payment.amount),
+            'payment_date': payment.payment_date.isoformat(),
+            'account': payment.account_id,
+        }
+
+
+class PaymentOutBatch(PaymentInBatch):
+    model = PaymentOut
+    category = 'expense_type'
+    plain_fields = ['payee_name', 'contact', 'reason', 'amount', 'payment_date', 'payment_method', 'invoice_number']
+
+    def prefetch(self):
+        ids = {as_pk(item.get('supplier')) for item in self.items} - {None}
+        self.suppliers = Supplier.objects.in_bulk(ids) if ids else {}
+        self.accounts = {account.pk: account for account in Account.objects.filter(is_active=True)}
+        invoices = {str(item['invoice_number']) for item in self.items if item.get('invoice_number')}
+        self.taken_invoices = set(
+            PaymentOut.objects.filter(invoice_number__in=invoices).values_list('invoice_number', flat=True)
+        ) if invoices else set()
+        self.spent = defaultdict(Decimal)
+        # Unsaved expense types by key, created only if the whole batch is accepted
+        self.new_expense_types = {}
+
+    def build(self, item, errors):
+        payment = PaymentOut(created_by=self.user)
+        clean_instance(payment, item, self.plain_fields, errors)
+        payment.invoice_number = payment.invoice_number or None
+
+        if item.get('supplier') is not None:
+            payment.payee_supplier = self.suppliers.get(as_pk(item['supplier']))
+            if payment.payee_supplier_id is None:
+                errors['supplier'] = ['No such supplier.']
+            else:
+                payment.payee_name = payment.payee_supplier.name
+                payment.contact = payment.contact or payment.payee_supplier.contact
+                errors.pop('payee_name', None)
+        elif not payment.payee_name:
+            errors['payee_name'] = ['Give a supplier or payee_name.']
+
+        expense_type = item.get('expense_type')
+        if as_pk(expense_type) is not None:
+            expense_type = ExpenseType.objects.get_cached(as_pk(expense_type))
+        elif isinstance(expense_type, str) and expense_type.split():
+            expense_type = ExpenseType.objects.resolve(expense_type)
+            if expense_type.pk is None:
+                expense_type = self.new_expense_types.setdefault(expense_type.key, expense_type)
+        else:
+            expense_type = None
+        if expense_type is None:
+            errors['expense_type'] = ['Give an expense type name or id.']
+        else:
+            payment.expense_type = expense_type
+
+        if payment.invoice_number:
+            if payment.invoice_number in self.taken_invoices:
+                errors['invoice_number'] = [f"Invoice {payment.invoice_number} has already been paid."]
+            self.taken_invoices.add(payment.invoice_number)
+
+        payment.account = self.accounts.get(as_pk(item.get('account')))
+        if payment.account_id is None:
+            errors['account'] = ['No such active account.']
+        elif 'amount' not in errors:
+            # Like the form, refuse to overdraw; within a batch earlier payments count too
+            self.spent[payment.account.pk] += payment.amount
+            if payment.account.balance < self.spent[payment.account.pk]:
+                errors['amount'] = [f"Account '{payment.account.name}' does not have enough balance for this payment."]
+        return payment
+
+    def allocate(self, payments):
+        last = PaymentOut.objects.order_by('-id').values_list('receipt_number', flat=True).first()
+        try:
+            number = int(last.split('-')[-1]) if last else 0
+        except ValueError:
+            number = 0
+        for payment in payments:
+            number += 1
+            payment.receipt_number = f"PY-{payment.payment_date:%Y%m}-{number:04d}"
+
+    def direction(self, amount):
+        return -amount
+
+    def save_related(self, payments):
+        saved = {key: ExpenseType.objects.persist(t) for key, t in self.new_expense_types.items()}
+        for payment in payments:
+            if payment.expense_type.pk is None:
+                payment.expense_type = saved[payment.expense_type.key]
+
+    def after_commit(self, payments, tenant_id):
+        pass
+
+    def serialize(self, payment):
+        return {
+            'id': payment.pk,
+            'receipt_number': payment.receipt_number,
+            'payee_name': payment.payee_name,
+            'amount': str(payment.amount),
+            'payment_date': payment.payment_date.isoformat(),
+            'account': payment.account_id,
+        }
+
+
+def record_posting(batch, payments, tenant_id):
+    batch.after_commit(payments, tenant_id)
+    direction = 'in' if batch.model is PaymentIn else 'out'
+    counts = defaultdict(int)
+    for payment in payments:
+        counts[payment.account_id] += 1
+    for account_id, count in counts.items():
+        metrics.inc('ledger_payments_posted_total', count, account=account_id, direction=direction)
+
+
+def post_batch(batch, token):
+    """Validate and post every item of `batch`, or none. Returns (status, response body)."""
+    batch.prefetch()
+    payments, errors = [], {}
+    for index, item in enumerate(batch.items):
+        if not isinstance(item, dict):
+            errors[str(index)] = {'__all__': ['Each payment must be a JSON object.']}
+            continue
+        item_errors = {}
+        payments.append(batch.build(item, item_errors))
+        if item_errors:
+            errors[str(index)] = item_errors
+
+    closed = AccountingPeriod.closed_periods([p.payment_date for p in payments])
+    for index, payment in enumerate(payments):
+        if payment.payment_date in closed:
+            message = AccountingPeriod.closed_message(closed[payment.payment_date], payment.payment_date)
+            errors.setdefault(str(index), {})['payment_date'] = [message]
+    if errors:
+        return 400, {'errors': errors}
+
+    with transaction.atomic():
+        batch.save_related(payments)
+        batch.allocate(payments)
+        batch.model.objects.bulk_create(payments, batch_size=500)
+        totals = defaultdict(Decimal)
+        for payment in payments:
+            totals[payment.account_id] += payment.amount
+        for account_id, total in totals.items():
+            Account.adjust_balance(account_id, batch.direction(total))
+        CategoryTotal.adjust_for(batch.category, payments)
+        if batch.model is PaymentIn and settings.LEDGER_EMAIL_RECEIPTS:
+            from .mail import queue_receipts
+            queue_receipts(payments)
+
+    # bulk_create skips post_save, so do what the payment signals would have done once the batch commits
+    transaction.on_commit(lambda: record_posting(batch, payments, token.tenant_id))
+    return 201, {
+        'count': len(payments),
+        'total': str(sum(totals.values(), Decimal('0'))),
+        'payments': [batch.serialize(payment) for payment in payments],
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PaymentApiView(View):
+    """POST one payment (or, with `batch`, {"payments": [...]}); GET describes the fields."""
+    batch_class = PaymentInBatch
+    fields = PAYMENT_IN_FIELDS
+    batch = False
+
+    def get(self, request):
+        token = authenticate(request)
+        if token is None and not is_ledger_staff(request.user):
+            return JsonResponse({'error': 'Send an API token as "Authorization: Bearer <key>".'}, status=401)
+        body = {'fields': self.fields}
+        if self.batch:
+            body['batch_limit'] = settings.LEDGER_API_BATCH_LIMIT
+        return JsonResponse(body)
+
+    def post(self, request):
+        token = authenticate(request)
+        if token is None:
+            return JsonResponse({'error': 'Send an API token as "Authorization: Bearer <key>".'}, status=401)
+        # Payments go to the token's club, whatever the session says
+        with tenancy.scoped(token.tenant_id):
+            try:
+                return self.respond(request, token)
+            except ApiError as exc:
+                return JsonResponse({'error': str(exc)}, status=exc.status)
+
+    def parse(self, request):
+        try:
+            data = json.loads(request.body or b'null')
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError(400, 'The request body must be JSON.')
+        if not self.batch:
+            if not isinstance(data, dict):
+                raise ApiError(400, 'Send one payment as a JSON object.')
+            return [data]
+        items = data.get('payments') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ApiError(400, 'Send {"payments": [...]} with at least one payment.')
+        if len(items) > settings.LEDGER_API_BATCH_LIMIT:
+            raise ApiError(400, f"A batch may hold at most {settings.LEDGER_API_BATCH_LIMIT} payments.")
+        return items
+
+    def respond(self, request, token):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ApiError(400, 'Idempotency-Key is too long.')
+        digest = hashlib.sha256(request.path.encode() + b'\n' + request.body).hexdigest()
+        if key:
+            stored = IdempotencyKey.objects.filter(token=token, key=key).first()
+            if stored is not None:
+                return self.replay(stored, digest)
+
+        items = self.parse(request)
+        try:
+            with transaction.atomic():
+                status, body = post_batch(self.batch_class(items, token.user), token)
+                if not self.batch and status == 201:
+                    body = body['payments'][0]
+                elif not self.batch:
+                    body = {'errors': body['errors']['0']}
+                if key and status == 201:
+                    IdempotencyKey.objects.create(
+                        token=token, key=key, request_digest=digest, status_code=status, response=body
+                    )
+        except IntegrityError:
+            # A concurrent retry with the same key got there first; nothing of ours was kept
+            stored = IdempotencyKey.objects.filter(token=token, key=key).first() if key else None
+            if stored is None:
+                raise
+            return self.replay(stored, digest)
+        return JsonResponse(body, status=status)
+
+    def replay(self, stored, digest):
+        if not hmac.compare_digest(stored.request_digest, digest):
+            raise ApiError(422, 'This Idempotency-Key was already used for a different request.')
+        response = JsonResponse(stored.response, status=stored.status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class PaymentOutApiView(PaymentApiView):
+    batch_class = PaymentOutBatch
+    fields = PAYMENT_OUT_FIELDS
+
+
+def purge_idempotency_keys(now=None):
+    """Forget stored responses older than LEDGER_API_IDEMPOTENCY_HOURS. Returns how many were removed."""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.LEDGER_API_IDEMPOTENCY_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
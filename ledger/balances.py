@@ -0,0 +1,107 @@
+# ledger/balances.py
+"""Daily closing balances of accounts over a date range.
+
+The movements come from one query. Payments in and out (negated) for the
+accounts are combined with UNION ALL and summed per account and day, and a
+running SUM() OVER (PARTITION BY account ORDER BY day) turns them into the
+balance after each day that had a movement. Payments dated before the range
+are folded into a single day just before it, so the first running total is
+the opening movement and the query returns one row per active day in the
+range, however old the ledger is.
+
+Days without movements carry the previous closing balance forward. The
+range is then cut into at most `points` equal buckets, each reported with
+its closing, lowest and highest balance, so a chart over ten years stays a
+few hundred points per account.
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import DateField, F, Value
+from django.db.models.functions import Greatest
+
+from .models import PaymentIn, PaymentOut
+
+MAX_POINTS = 400
+
+HISTORY_SQL = '''
+SELECT account_id, day, SUM(movement) OVER (PARTITION BY account_id ORDER BY day)
+FROM (
+    SELECT account_id, day, SUM(signed) AS movement
+    FROM ({payments_in} UNION ALL {payments_out}) AS payments
+    GROUP BY account_id, day
+) AS movements
+ORDER BY account_id, day
+'''
+
+
+def movements(model, accounts, start, end, sign):
+    """(account_id, day, signed amount) rows of one payment table, with earlier days folded into start - 1."""
+    return (
+        model.objects.filter(account__in=accounts, payment_date__lte=end)
+        .annotate(day=Greatest('payment_date', Value(start - timedelta(days=1), output_field=DateField())),
+                  signed=F('amount') * sign)
+        .values_list('account_id', 'day', 'signed')
+        .order_by()
+    )
+
+
+def running_balances(accounts, start, end):
+    """{account_id: ([day ordinal], [balance])} after each day with a movement, from one query."""
+    # The tenant filter is applied by the managers; the window query wraps their SQL
+    in_sql, in_params = movements(PaymentIn, accounts, start, end, 1).query.sql_with_params()
+    out_sql, out_params = movements(PaymentOut, accounts, start, end, -1).query.sql_with_params()
+    opening = {account.pk: Decimal(str(account.opening_balance)) for account in accounts}
+    history = {account.pk: ([], []) for account in accounts}
+    with connection.cursor() as cursor:
+        cursor.execute(HISTORY_SQL.format(payments_in=in_sql, payments_out=out_sql), (*in_params, *out_params))
+        for account_id, day, total in cursor.fetchall():
+            days, balances = history[account_id]
+            # SQLite hands back the folded day as ISO text
+            days.append((day if isinstance(day, date) else date.fromisoformat(day)).toordinal())
+            balances.append(opening[account_id] + Decimal(str(total)).quantize(Decimal('0.01')))
+    return opening, history
+
+
+def buckets(start, end, points):
+    """[(first ordinal, last ordinal)] splitting [start, end] into at most `points` equal runs of days."""
+    first, last = start.toordinal(), end.toordinal()
+    step = -(-(last - first + 1) // max(1, points))
+    return step, [(day, min(day + step - 1, last)) for day in range(first, last + 1, step)]
+
+
+def downsample(days, balances, opening, spans):
+    """(closing, low, high) per span, carrying the last balance across days without movements."""
+    points = []
+    index = bisect_right(days, spans[0][0] - 1)
+    balance = balances[index - 1] if index else opening
+    for first, last in spans:
+        low = high = balance
+        while index < len(days) and days[index] <= last:
+            balance = balances[index]
+            low, high = min(low, balance), max(high, balance)
+            index += 1
+        points.append((last, balance, low, high))
+    return points
+
+
+def balance_history(accounts, start, end, points=MAX_POINTS):
+    """Per account, the closing balance series for [start, end] in at most `points` points."""
+    accounts = list(accounts)
+    points = min(points, MAX_POINTS)
+    opening, history = running_balances(accounts, start, end) if accounts else ({}, {})
+    step, spans = buckets(start, end, points)
+    series = []
+    for account in accounts:
+        days, balances = history[account.pk]
+        series.append({
+            'id': account.pk,
+            'name': account.name,
+            'points': [
+                {'date': date.fromordinal(day), 'balance': balance, 'low': low, 'high': high}
+                for day, balance, low, high in downsample(days, balances, opening[account.pk], spans)
+            ],
+        })
+    return {'start': start, 'end': end, 'step_days': step, 'accounts': series}
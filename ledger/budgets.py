@@ -0,0 +1,110 @@
+# ledger/budgets.py
+"""Budget against actual income and spending for a month or a year.
+
+Actuals are read from CategoryTotal, which the payment writes keep current,
+so a report is three small indexed reads (the budgets starting in the year,
+the category totals of the period's months and the names of any categories
+spent on without a budget) whatever the size of the ledger.
+
+A month without its own budget for a category gets a twelfth of the
+category's annual budget; a year without an annual budget adds up its
+monthly ones.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import Budget, CategoryTotal, ExpenseType, RevenueType
+from .periods import period_bounds
+
+SECTIONS = [('revenue_type', 'income'), ('expense_type', 'expenses')]
+
+
+def period_budgets(period_type, year, month):
+    """{(kind, category id): (category, amount, prorated)} for the period, from one query."""
+    budgets = Budget.objects.filter(
+        start_date__range=period_bounds('year', year)
+    ).select_related('revenue_type', 'expense_type')
+    annual, monthly, categories = {}, defaultdict(Decimal), {}
+    for budget in budgets:
+        key = (budget.kind, budget.category.pk)
+        categories[key] = budget.category
+        if budget.period_type == 'year':
+            annual[key] = budget.amount
+        elif period_type == 'year' or budget.start_date.month == month:
+            monthly[key] += budget.amount
+
+    result = {}
+    for key, category in categories.items():
+        if period_type == 'year':
+            if key in annual:
+                result[key] = (category, annual[key], False)
+            elif key in monthly:
+                result[key] = (category, monthly[key], False)
+        elif key in monthly:
+            result[key] = (category, monthly[key], False)
+        elif key in annual:
+            result[key] = (category, (annual[key] / 12).quantize(Decimal('0.01')), True)
+    return result
+
+
+def period_actuals(start, end):
+    """{(kind, category id): total} summed from the maintained monthly totals."""
+    rows = (
+        CategoryTotal.objects.filter(month__range=(start, end))
+        .values_list('kind', 'category_id')
+        .annotate(total=Sum('total'))
+        .order_by()
+    )
+    return {(kind, category_id): total for kind, category_id, total in rows if total}
+
+
+def category_names(keys):
+    names = {}
+    revenue_ids = [pk for kind, pk in keys if kind == 'revenue_type']
+    if revenue_ids:
+        for pk, name in RevenueType.objects.filter(pk__in=revenue_ids).values_list('pk', 'name'):
+            names['revenue_type', pk] = name
+    for kind, pk in keys:
+        if kind == 'expense_type':
+            expense_type = ExpenseType.objects.get_cached(pk)
+            names[kind, pk] = expense_type.name if expense_type else f"Expense type {pk}"
+    return names
+
+
+def budget_line(name, budget, actual, prorated=False):
+    return {
+        'name': name,
+        'budget': budget,
+        'actual': actual,
+        'difference': actual - budget if budget is not None else None,
+        'used_pct': actual / budget * 100 if budget else None,
+        'prorated': prorated,
+    }
+
+
+def budget_report(period_type, year, month=None):
+    start, end = period_bounds(period_type, year, month)
+    budgets = period_budgets(period_type, year, month)
+    actuals = period_actuals(start, end)
+    names = category_names([key for key in actuals if key not in budgets])
+
+    report = {'period_type': period_type, 'start': start, 'end': end}
+    for kind, section in SECTIONS:
+        lines = []
+        for key, (category, amount, prorated) in budgets.items():
+            if key[0] == kind:
+                lines.append(budget_line(category.name, amount, actuals.get(key, Decimal('0')), prorated))
+        for key, actual in actuals.items():
+            if key[0] == kind and key not in budgets:
+                lines.append(budget_line(names[key], None, actual))
+        lines.sort(key=lambda line: line['name'].casefold())
+        budgeted = sum((line['budget'] for line in lines if line['budget'] is not None), Decimal('0'))
+        total = budget_line('Total', budgeted, sum((line['actual'] for line in lines), Decimal('0')))
+        report[section] = {'lines': lines, 'total': total}
+    report['net'] = budget_line(
+        'Net', report['income']['total']['budget'] - report['expenses']['total']['budget'],
+        report['income']['total']['actual'] - report['expenses']['total']['actual'],
+    )
+    return report
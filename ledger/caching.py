@@ -0,0 +1,87 @@
+# ledger/caching.py
+"""Versioned cache keys for ledger data.
+
+Each cached family (e.g. ``payment_in``) has a version number stored in the
+cache. Keys embed the current version, so bumping it on a write makes every
+older entry unreachable at once without having to find and delete them.
+Versions start from the clock rather than 1, so a version key that is culled
+or cleared never brings back entries cached under an earlier version.
+
+Entries are partitioned by club: keys name the active club (or "-" when none
+is), and a family's version has a shared part, bumped for changes that affect
+every club, and a per-club part, so a payment posted in one club leaves the
+other clubs' cached lists alone.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+from . import metrics, tenancy
+
+TIMEOUT = 60 * 60
+
+
+UNSCOPED = '-'
+
+
+def partition():
+    club_id = tenancy.current_club_id()
+    return UNSCOPED if club_id is None else str(club_id)
+
+
+def version_key(family, club=None):
+    if club is None:
+        return f'ledger:{family}:version'
+    return f'ledger:{family}:{club}:version'
+
+
+def new_version():
+    return time.time_ns() // 1000
+
+
+def get_version(family):
+    """The family's version for the active club: "<shared part>.<club part>"."""
+    keys = [version_key(family), version_key(family, partition())]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            start = new_version()
+            # Another process may have started it first
+            found[key] = start if cache.add(key, start, None) else (cache.get(key) or start)
+    return '.'.join(str(found[key]) for key in keys)
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+
+def bump_version(family, club_id=None):
+    """Invalidate a family for one club, or for every club when `club_id` is None."""
+    if club_id is None:
+        _incr(version_key(family))
+        return
+    _incr(version_key(family, club_id))
+    # Unscoped readers see every club's rows
+    _incr(version_key(family, UNSCOPED))
+
+
+def cache_key(family, *parts):
+    """Key for `parts` under the family's current version; parts are hashed so any JSON-able value works."""
+    digest = hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'ledger:{family}:{partition()}:{get_version(family)}:{digest}'
+
+
+def cached(family, parts, compute, timeout=TIMEOUT):
+    """Return the cached value for `parts`, computing and storing it on a miss."""
+    key = cache_key(family, *parts)
+    value = cache.get(key)
+    metrics.record_cache_lookup(family, value is not None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
@@ -0,0 +1,12 @@
+# ledger/context_processors.py
+from .models import Club
+
+
+def clubs(request):
+    """The current club, and the clubs a district user may switch to."""
+    club = getattr(request, 'club', None)
+    user = getattr(request, 'user', None)
+    choices = []
+    if user is not None and user.is_authenticated and user.can_switch_clubs:
+        choices = [c for c in Club.objects.cached().values() if c.is_active]
+    return {'current_club': club, 'club_choices': choices if len(choices) > 1 else []}
@@ -0,0 +1,98 @@
+# ledger/cron.py
+"""Five-field cron expressions (minute hour day-of-month month day-of-week).
+
+Supports `*`, single values, ranges (`1-5`), steps (`*/15`, `0-30/10`), comma
+lists and the @hourly/@daily/@weekly/@monthly/@yearly shorthands. As in cron,
+when both day fields are restricted a day matching either one qualifies.
+Times are evaluated in the project's local time zone.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+
+# (name, lowest, highest)
+FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day of month', 1, 31),
+    ('month', 1, 12),
+    ('day of week', 0, 7),
+]
+
+# Give up looking for a match after this long (e.g. "0 0 31 2 *" never fires)
+SEARCH_LIMIT = timedelta(days=5 * 366)
+
+
+def parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        range_text, _, step_text = part.partition('/')
+        try:
+            step = int(step_text) if step_text else 1
+            if range_text == '*':
+                first, last = low, high
+            elif '-' in range_text:
+                first, last = (int(v) for v in range_text.split('-', 1))
+            else:
+                first = last = int(range_text)
+                if step_text:
+                    last = high
+        except ValueError:
+            raise ValidationError(f"'{part}' is not a valid {name} field.")
+        if step < 1 or not low <= first <= last <= high:
+            raise ValidationError(f"'{part}' is out of range for {name} ({low}-{high}).")
+        values.update(range(first, last + 1, step))
+    return values
+
+
+class Cron:
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValidationError(f"'{expression}' must have five fields: minute hour day month weekday.")
+        parsed = [parse_field(text, *spec) for text, spec in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # cron counts Sunday as 0 (or 7); Python's weekday() counts Monday as 0
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def __str__(self):
+        return self.expression
+
+    def day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment):
+        """The first matching minute strictly after `moment` (an aware datetime)."""
+        local = timezone.localtime(moment).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = local + SEARCH_LIMIT
+        while local < limit:
+            if local.month not in self.months:
+                year, month = divmod(local.month, 12)
+                local = datetime(local.year + year, month + 1, 1)
+            elif not self.day_matches(local):
+                local = datetime.combine(local.date() + timedelta(days=1), time())
+            elif local.hour not in self.hours:
+                local = local.replace(minute=0) + timedelta(hours=1)
+            elif local.minute not in self.minutes:
+                local += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(local)
+        raise ValidationError(f"'{self.expression}' never matches.")
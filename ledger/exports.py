@@ -0,0 +1,120 @@
+# ledger/exports.py
+"""Full-ledger archive export for auditors.
+
+Each table is streamed into its own CSV member of a deflated zip archive:
+rows come from a chunked server-side iterator and are written through to
+the compressor as they arrive, so memory use stays flat however large the
+tables get. Progress is written back to the ExportJob row once per chunk.
+The archive is built under a temporary name and renamed when complete.
+Each archive holds one club's rows; the shared revenue and expense types
+are included whole.
+"""
+import csv
+import io
+import json
+import logging
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import tenancy
+from .models import (
+    Account, AuditLog, Club, ExpenseType, ExportJob, Member, PaymentIn, PaymentOut, RevenueType, Supplier,
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+
+# (archive member name, model); lookup tables come first so the ids in the payment files resolve
+EXPORT_TABLES = [
+    ('accounts.csv', Account),
+    ('revenue_types.csv', RevenueType),
+    ('expense_types.csv', ExpenseType),
+    ('members.csv', Member),
+    ('suppliers.csv', Supplier),
+    ('payments_in.csv', PaymentIn),
+    ('payments_out.csv', PaymentOut),
+    ('audit_log.csv', AuditLog),
+]
+
+
+def export_dir():
+    path = Path(settings.LEDGER_EXPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def archive_path(job):
+    return Path(settings.LEDGER_EXPORT_DIR) / job.file_name
+
+
+def table_columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def write_table(archive, name, model, job, chunk_size=CHUNK_SIZE):
+    """Stream one table into the archive, reporting progress per chunk. Returns the row count."""
+    columns = table_columns(model)
+    rows = model.objects.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    count = 0
+    with archive.open(name, 'w', force_zip64=True) as member:
+        text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count % chunk_size == 0:
+                text.flush()
+                ExportJob.objects.filter(pk=job.pk).update(rows_written=job.rows_written + count)
+        text.flush()
+        text.detach()
+    job.rows_written += count
+    ExportJob.objects.filter(pk=job.pk).update(rows_written=job.rows_written)
+    return count
+
+
+def run_export(job, chunk_size=CHUNK_SIZE):
+    """Build the archive for `job` from its club's rows, recording progress and the outcome on the row."""
+    with tenancy.scoped(job.tenant_id):
+        return build_archive(job, chunk_size)
+
+
+def build_archive(job, chunk_size):
+    job.status = 'running'
+    job.started_at = timezone.now()
+    job.rows_total = sum(model.objects.count() for _, model in EXPORT_TABLES)
+    job.rows_written = 0
+    job.file_name = f"ledger-{job.started_at:%Y%m%d-%H%M%S}-{job.pk}.zip"
+    job.save(update_fields=['status', 'started_at', 'rows_total', 'rows_written', 'file_name'])
+
+    final = export_dir() / job.file_name
+    partial = final.with_suffix('.zip.part')
+    try:
+        club = Club.objects.cached().get(job.tenant_id)
+        manifest = {'generated_at': job.started_at.isoformat(), 'club': club and club.slug, 'tables': {}}
+        with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, model in EXPORT_TABLES:
+                ExportJob.objects.filter(pk=job.pk).update(current_table=name)
+                manifest['tables'][name] = write_table(archive, name, model, job, chunk_size)
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+        partial.replace(final)
+    except Exception as exc:
+        logger.exception("Ledger export %s failed", job.pk)
+        partial.unlink(missing_ok=True)
+        job.status = 'failed'
+        job.error = str(exc)
+        job.file_name = ''
+    else:
+        job.status = 'done'
+        job.file_size = final.stat().st_size
+    job.current_table = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'status', 'error', 'file_name', 'file_size', 'current_table', 'rows_written', 'finished_at',
+    ])
+    return job
+
@@ -1,13 +1,18 @@
 # ledger/forms.py
 from django import forms
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Row, Column, Div, HTML, Field
-from .models import Member, RevenueType, Account, PaymentIn, Supplier, PaymentOut, ExpenseType
+from .layouts import CachedLayoutMixin
+from .models import Member, RevenueType, Account, PaymentIn, Supplier, PaymentOut, ExpenseType, payment_fingerprint
+from datetime import date
 from decimal import Decimal
+from .reports import GRANULARITIES
+from .balances import MAX_POINTS
 
 # ------------------ Member Forms ------------------ #
-class MemberForm(forms.ModelForm):
+class MemberForm(CachedLayoutMixin, forms.ModelForm):
     CLUB_CHOICES = [
         ('rotaract', 'Rotaract Club'),
         ('rotary', 'Rotary Club'),
@@ -30,15 +35,9 @@ class MemberForm(forms.ModelForm):
             'email': forms.EmailInput(attrs={'placeholder': 'Enter email address'}),
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.form_class = 'form-horizontal'
-        self.helper.label_class = 'col-md-3'
-        self.helper.field_class = 'col-md-9'
-        
-        self.helper.layout = Layout(
+    @classmethod
+    def build_layout(cls, variant):
+        return Layout(
             HTML('<h4>Member Information</h4>'),
             Row(Column('name', css_class='form-group col-md-6'),
                 Column('rid', css_class='form-group col-md-6')),
@@ -91,6 +90,69 @@ class MemberForm(forms.ModelForm):
         return cleaned_data
 
 
+class MemberImportForm(forms.Form):
+    csv_file = forms.FileField(label='CSV File', help_text='Columns: name, rid, email, contact, residence, club, '
+                                                          'other_club_name, buddy_group and optionally registration_fee')
+    dry_run = forms.BooleanField(required=False, label='Check only (do not import)')
+    pay_registration_fee = forms.BooleanField(required=False, initial=False, label='Post registration fees')
+    revenue_type = forms.ModelChoiceField(queryset=RevenueType.objects.filter(is_active=True), required=False, label='Fee Type')
+    amount = forms.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0, label='Default Amount',
+                                help_text='Used for rows without a registration_fee value')
+    payment_method = forms.ChoiceField(choices=PaymentIn.PAYMENT_METHODS, required=False, label='Payment Method')
+    account = forms.ModelChoiceField(queryset=Account.objects.filter(is_active=True), required=False, label='Account')
+    payment_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}), label='Payment Date')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.form_tag = True
+        self.helper.attrs = {'enctype': 'multipart/form-data'}
+
+        self.helper.layout = Layout(
+            'csv_file',
+            'dry_run',
+            HTML('<hr><h5>Registration Fees (Optional)</h5>'),
+            'pay_registration_fee',
+            Div(
+                Row(Column('revenue_type', css_class='form-group col-md-4'),
+                    Column('amount', css_class='form-group col-md-4'),
+                    Column('payment_method', css_class='form-group col-md-4')),
+                Row(Column('account', css_class='form-group col-md-6'),
+                    Column('payment_date', css_class='form-group col-md-6')),
+                css_id='payment-fields',
+                css_class='border p-3 rounded bg-light'
+            ),
+            Div(
+                Submit('submit', 'Import Members', css_class='btn-primary'),
+                HTML('<a href="{% url "member_list" %}" class="btn btn-secondary">Cancel</a>'),
+                css_class='form-group mt-4'
+            )
+        )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('pay_registration_fee'):
+            for field in ('revenue_type', 'payment_method', 'account', 'payment_date'):
+                if not cleaned_data.get(field):
+                    self.add_error(field, 'This field is required when posting registration fees.')
+        return cleaned_data
+
+    def fee(self):
+        """The fee settings for ledger.imports.import_members, or None."""
+        data = self.cleaned_data
+        if not data.get('pay_registration_fee'):
+            return None
+        amount = data['amount'] if data['amount'] is not None else data['revenue_type'].amount_default
+        return {
+            'revenue_type': data['revenue_type'],
+            'account': data['account'],
+            'payment_method': data['payment_method'],
+            'payment_date': data['payment_date'],
+            'amount': amount,
+        }
+
+
 class MemberSearchForm(forms.Form):
     name = forms.CharField(required=False, label='Search by Name')
     rid = forms.CharField(required=False, label='Search by RID')
@@ -99,7 +161,7 @@ class MemberSearchForm(forms.Form):
 
 
 # ------------------ Supplier Forms ------------------ #
-class SupplierForm(forms.ModelForm):
+class SupplierForm(CachedLayoutMixin, forms.ModelForm):
     class Meta:
         model = Supplier
         fields = ['name', 'supplier_id', 'contact', 'email', 'address', 'bank_details']
@@ -108,15 +170,9 @@ class SupplierForm(forms.ModelForm):
             'bank_details': forms.Textarea(attrs={'rows': 3}),
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.form_class = 'form-horizontal'
-        self.helper.label_class = 'col-md-3'
-        self.helper.field_class = 'col-md-9'
-
-        self.helper.layout = Layout(
+    @classmethod
+    def build_layout(cls, variant):
+        return Layout(
             HTML('<h4>Supplier Information</h4>'),
             Row(Column('name', css_class='form-group col-md-6'),
                 Column('supplier_id', css_class='form-group col-md-6')),
@@ -133,7 +189,7 @@ class SupplierForm(forms.ModelForm):
 
 
 # ------------------ Payment Out Form (Updated) ------------------ #
-class PaymentOutForm(forms.ModelForm):
+class PaymentOutForm(CachedLayoutMixin, forms.ModelForm):
     supplier = forms.ModelChoiceField(
         queryset=Supplier.objects.all(),
         required=False,
@@ -144,18 +200,19 @@ class PaymentOutForm(forms.ModelForm):
     new_supplier_contact = forms.CharField(required=False, label="New Supplier Contact")
     new_supplier_email = forms.EmailField(required=False, label="New Supplier Email")
     
-    # Change expense_type to CharField for free-text
+    # Typed names are matched to an ExpenseType, created on save if new; known types are suggested
     expense_type = forms.CharField(
         required=True,
+        max_length=100,
         label="Expense Type",
-        widget=forms.TextInput(attrs={'placeholder': 'Enter expense type'})
+        widget=forms.TextInput(attrs={'placeholder': 'Enter expense type', 'list': 'expense-type-options'})
     )
 
     class Meta:
         model = PaymentOut
         fields = [
             'supplier', 'new_supplier_name', 'new_supplier_contact', 'new_supplier_email',
-            'expense_type', 'amount', 'payment_date', 'payment_method', 'account', 'reason', 'invoice_number'
+            'amount', 'payment_date', 'payment_method', 'account', 'reason', 'invoice_number'
         ]
         widgets = {
             'payment_date': forms.DateInput(attrs={'type': 'date'}),
@@ -166,13 +223,15 @@ class PaymentOutForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.form_class = 'form-horizontal'
-        self.helper.label_class = 'col-md-3'
-        self.helper.field_class = 'col-md-9'
-
-        self.helper.layout = Layout(
+        expense_types = ExpenseType.objects.cached()
+        self.expense_type_names = [t.name for t in expense_types if t.is_active]
+        if self.instance.expense_type_id:
+            expense_type = ExpenseType.objects.get_cached(self.instance.expense_type_id) or self.instance.expense_type
+            self.initial['expense_type'] = expense_type.name
+
+    @classmethod
+    def build_layout(cls, variant):
+        return Layout(
             HTML('<h4>Record Payment Out</h4>'),
             HTML('<h5>Payee Information</h5>'),
             Row(Column('supplier', css_class='form-group col-md-6'),
@@ -194,6 +253,18 @@ class PaymentOutForm(forms.ModelForm):
             )
         )
 
+    def clean_expense_type(self):
+        name = self.cleaned_data['expense_type']
+        if not ' '.join(name.split()):
+            raise ValidationError("Enter an expense type.")
+        return ExpenseType.objects.resolve(name)
+
+    def save(self, commit=True):
+        # expense_type is left out of Meta.fields: a new type has no row until now
+        with transaction.atomic():
+            self.instance.expense_type = ExpenseType.objects.persist(self.cleaned_data['expense_type'])
+            return super().save(commit)
+
     def clean(self):
         cleaned_data = super().clean()
         supplier = cleaned_data.get('supplier')
@@ -248,13 +319,119 @@ class PaymentInSearchForm(forms.Form):
         label='To Date'
     )
 
+class PaymentOutSearchForm(forms.Form):
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.all(),
+        required=False,
+        label='Filter by Supplier'
+    )
+    expense_type = forms.TypedChoiceField(
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label='Filter by Expense Type'
+    )
+    account = forms.ModelChoiceField(
+        queryset=Account.objects.filter(is_active=True),
+        required=False,
+        label='Filter by Account'
+    )
+    payment_method = forms.ChoiceField(
+        choices=[('', 'All Methods')] + PaymentOut.PAYMENT_METHODS,
+        required=False,
+        label='Payment Method'
+    )
+    payment_date_range = forms.ChoiceField(
+        choices=[('', 'All Time')] + PaymentInSearchForm.PAYMENT_DATE_RANGE,
+        required=False,
+        label='Date Range'
+    )
+    start_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        label='From Date'
+    )
+    end_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        label='To Date'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['expense_type'].choices = [('', '---------')] + [
+            (t.id, t.name) for t in ExpenseType.objects.cached()
+        ]
+
+# ------------------ Report Forms ------------------ #
+class IncomeStatementForm(forms.Form):
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), label='From Date')
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), label='To Date')
+    granularity = forms.ChoiceField(choices=GRANULARITIES, required=False, initial='auto', label='Columns')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'The end date must be on or after the start date.')
+        return cleaned_data
+
+class BalanceHistoryForm(forms.Form):
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), label='From Date')
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), label='To Date')
+    account = forms.ModelMultipleChoiceField(
+        queryset=Account.objects.filter(is_active=True), required=False, label='Accounts',
+        help_text='Leave empty for every active account',
+    )
+    points = forms.IntegerField(min_value=2, max_value=MAX_POINTS, required=False, label='Chart Points',
+                                help_text=f'Longer ranges are downsampled to this many points (at most {MAX_POINTS})')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'The end date must be on or after the start date.')
+        return cleaned_data
+
+class BudgetReportForm(forms.Form):
+    MONTHS = [('', 'Whole year')] + [(str(m), date(2000, m, 1).strftime('%B')) for m in range(1, 13)]
+
+    year = forms.IntegerField(min_value=2000, max_value=2100, label='Year')
+    month = forms.TypedChoiceField(choices=MONTHS, coerce=int, empty_value=None, required=False, label='Month')
+
+class StatementReconcileForm(forms.Form):
+    account = forms.ModelChoiceField(
+        queryset=Account.objects.filter(is_active=True, account_type__in=['bank', 'mobile']), label='Account'
+    )
+    csv_file = forms.FileField(label='Statement (CSV)', help_text='Columns: date, amount (or money in / money out) '
+                                                                 'and optionally reference or description')
+    window = forms.IntegerField(min_value=0, max_value=31, initial=3, label='Date Window (days)',
+                                help_text='How many days either side of the statement date a payment may fall')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = 'post'
+        self.helper.form_tag = True
+        self.helper.attrs = {'enctype': 'multipart/form-data'}
+        self.helper.layout = Layout(
+            Row(Column('account', css_class='form-group col-md-5'),
+                Column('csv_file', css_class='form-group col-md-5'),
+                Column('window', css_class='form-group col-md-2')),
+            Submit('submit', 'Match Statement', css_class='btn-primary'),
+        )
+
  # ------------------ Supplier Search Form ------------------ #
 class SupplierSearchForm(forms.Form):
     name = forms.CharField(required=False, label='Search by Name')
     supplier_id = forms.CharField(required=False, label='Search by Supplier ID')
     contact = forms.CharField(required=False, label='Search by Contact')   
 
-class PaymentInForm(forms.ModelForm):
+# The cached layout saves nothing measurable here (its fields dominate the render);
+# it stays for the shared confirm_duplicate variant handling.
+class PaymentInForm(CachedLayoutMixin, forms.ModelForm):
     member = forms.ModelChoiceField(
         queryset=Member.objects.all(),
         required=False,
@@ -268,6 +445,12 @@ class PaymentInForm(forms.ModelForm):
         help_text="Use if payer is not a registered member"
     )
 
+    # Only shown once the payment looks like one already recorded
+    confirm_duplicate = forms.BooleanField(
+        required=False,
+        label="This is a separate payment, record it anyway",
+    )
+
     class Meta:
         model = PaymentIn
         fields = [
@@ -283,30 +466,12 @@ class PaymentInForm(forms.ModelForm):
             'notes': 'Notes',
         }
         
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        # Check if member ID is passed in initial data
-        if 'initial' in kwargs and 'member' in kwargs['initial']:
-            member_id = kwargs['initial']['member']
-            try:
-                member = Member.objects.get(pk=member_id)
-                self.fields['member'].initial = member
-            except Member.DoesNotExist:
-                pass
-        self.helper = FormHelper()
+    # Set by check_duplicate to show the confirm_duplicate box
+    confirming_duplicate = False
 
-        
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.helper = FormHelper()
-        self.helper.form_method = 'post'
-        self.helper.form_class = 'form-horizontal'
-        self.helper.label_class = 'col-md-3'
-        self.helper.field_class = 'col-md-9'
-        
-        self.helper.layout = Layout(
+    @classmethod
+    def build_layout(cls, variant):
+        return Layout(
             HTML('<h4>Record Payment In</h4>'),
             HTML('<h5>Payer Information</h5>'),
             Row(
@@ -326,6 +491,7 @@ class PaymentInForm(forms.ModelForm):
                 Column('account', css_class='form-group col-md-6'),
             ),
             'notes',
+            *variant,
             Div(
                 Submit('submit', 'Record Payment', css_class='btn-primary'),
                 HTML('<a href="{% url "payment_in_list" %}" class="btn btn-secondary">Cancel</a>'),
@@ -333,6 +499,9 @@ class PaymentInForm(forms.ModelForm):
             )
         )
 
+    def layout_variant(self):
+        return ('confirm_duplicate',) if self.confirming_duplicate else ()
+
     def clean(self):
         cleaned_data = super().clean()
         member = cleaned_data.get('member')
@@ -346,9 +515,27 @@ class PaymentInForm(forms.ModelForm):
         if member and manual_payer_name:
             self.add_error('manual_payer_name', 
                          "Please use either member selection OR manual entry, not both.")
-        
+
+        self.check_duplicate(manual_payer_name or (member.name if member else ''), cleaned_data)
         return cleaned_data
 
+    def check_duplicate(self, payer_name, cleaned_data):
+        """Stop a payment matching one already posted (same payer, amount, date and account) unless confirmed."""
+        amount, payment_date, account = (cleaned_data.get(f) for f in ('amount', 'payment_date', 'account'))
+        if not (payer_name and amount and payment_date and account) or cleaned_data.get('confirm_duplicate'):
+            return
+        fingerprint = payment_fingerprint(payer_name, amount, payment_date, account.pk)
+        receipt = (
+            PaymentIn.objects.duplicates_of(fingerprint, exclude_pk=self.instance.pk)
+            .values_list('receipt_number', flat=True).first()
+        )
+        if receipt:
+            self.confirming_duplicate = True
+            raise forms.ValidationError(
+                f"{payer_name} already paid {amount:,.2f} into {account} on {payment_date:%d %b %Y} "
+                f"(receipt {receipt}). If this is a separate payment, tick the box below and submit again."
+            )
+
     def save(self, commit=True):
         payment = super().save(commit=False)
         manual_payer_name = self.cleaned_data.get('manual_payer_name')
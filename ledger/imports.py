@@ -0,0 +1,174 @@
+# ledger/imports.py
+"""Bulk member intake from spreadsheet exports (CSV).
+
+Rows are validated in memory against one prefetched set of the RIDs and
+emails already on file, then every valid member is inserted with a single
+bulk_create. Optional registration fees are posted in the same transaction:
+one bulk insert of payments and one balance update for the fee account.
+Invalid rows are reported and skipped; they don't stop the rest of the batch.
+Everything is checked against and added to the active club.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import caching, metrics
+from .mail import queue_receipts
+from .models import Account, AccountingPeriod, CategoryTotal, Member, PaymentIn
+
+MEMBER_COLUMNS = ['name', 'rid', 'contact', 'email', 'residence', 'club', 'other_club_name', 'buddy_group']
+FEE_COLUMN = 'registration_fee'
+BATCH_SIZE = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.members = []
+        self.payments = []
+        self.errors = []  # (line number, message)
+
+    @property
+    def fees_total(self):
+        return sum((payment.amount for payment in self.payments), Decimal('0'))
+
+
+def normalize_header(name):
+    return '_'.join((name or '').strip().lower().replace('-', ' ').split())
+
+
+def read_rows(stream):
+    """Yield (line number, row dict) from a CSV text stream, with normalized column names."""
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [normalize_header(name) for name in reader.fieldnames or []]
+    missing = {'name', 'rid', 'email'} - set(reader.fieldnames)
+    if missing:
+        raise ValidationError(f"Missing required column(s): {', '.join(sorted(missing))}.")
+    for row in reader:
+        yield reader.line_num, {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def club_value(text):
+    """Accept either the stored value or its label ('rotary' or 'Rotary Club')."""
+    lookup = {}
+    for value, label in Member.CLUB_CHOICES:
+        lookup[value] = lookup[label.lower()] = value
+    return lookup.get(text.lower(), text) if text else 'rotaract'
+
+
+def parse_fee(text, default):
+    if not text:
+        return default
+    try:
+        amount = Decimal(text.replace(',', ''))
+    except InvalidOperation:
+        raise ValidationError(f"Registration fee '{text}' is not a number.")
+    if amount < 0:
+        raise ValidationError("Registration fee cannot be negative.")
+    return amount
+
+
+def allocate_receipt_numbers(payment_date, count):
+    """`count` consecutive free receipt numbers in the payment month, using the same format as PaymentIn.save()."""
+    prefix = f"RC-{payment_date.strftime('%Y%m')}-"
+    last = (
+        PaymentIn.objects.filter(receipt_number__startswith=prefix)
+        .order_by('-id').values_list('receipt_number', flat=True).first()
+    )
+    try:
+        start = int(last.split('-')[-1]) + 1 if last else 1
+    except ValueError:
+        start = 1
+    while True:
+        numbers = [f"{prefix}{n:04d}" for n in range(start, start + count)]
+        taken = set(PaymentIn.objects.filter(receipt_number__in=numbers).values_list('receipt_number', flat=True))
+        if not taken:
+            return numbers
+        start += count
+
+
+def import_members(rows, user=None, fee=None, dry_run=False):
+    """Validate and insert members from `rows` (an iterable of (line number, dict)).
+
+    `fee`, when given, is a dict with revenue_type, account, payment_method,
+    payment_date and amount. Each imported member then pays the row's
+    registration_fee column, or `amount` when that column is blank; a fee
+    of 0 posts no payment.
+    """
+    result = ImportResult()
+    taken_rids, taken_emails = set(), set()
+    for rid, email in Member.objects.values_list('rid', 'email'):
+        taken_rids.add(rid.lower())
+        taken_emails.add(email.lower())
+
+    fees = []
+    for line, row in rows:
+        result.rows += 1
+        values = {column: row.get(column, '') for column in MEMBER_COLUMNS}
+        values['club'] = club_value(values['club'])
+        values['other_club_name'] = values['other_club_name'] or None
+        member = Member(created_by=user, **values)
+
+        problems = []
+        try:
+            member.full_clean(exclude=['created_by'], validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            problems += [f"{field}: {' '.join(messages)}" for field, messages in exc.message_dict.items()]
+        if member.club == 'other' and not member.other_club_name:
+            problems.append("other_club_name: Please specify the name of the other club.")
+        if member.rid.lower() in taken_rids:
+            problems.append(f"rid: RID {member.rid} already exists.")
+        if member.email and member.email.lower() in taken_emails:
+            problems.append(f"email: {member.email} is already registered.")
+
+        amount = None
+        if fee:
+            try:
+                amount = parse_fee(row.get(FEE_COLUMN, ''), fee['amount'])
+            except ValidationError as exc:
+                problems.append(f"{FEE_COLUMN}: {' '.join(exc.messages)}")
+
+        if problems:
+            result.errors.append((line, '; '.join(problems)))
+            continue
+
+        taken_rids.add(member.rid.lower())
+        taken_emails.add(member.email.lower())
+        result.members.append(member)
+        fees.append(amount)
+
+    if dry_run or not result.members:
+        return result
+
+    with transaction.atomic():
+        Member.objects.bulk_create(result.members, batch_size=BATCH_SIZE)
+
+        paying = [(member, amount) for member, amount in zip(result.members, fees) if amount]
+        if paying:
+            AccountingPeriod.ensure_open(fee['payment_date'])
+            numbers = allocate_receipt_numbers(fee['payment_date'], len(paying))
+            result.payments = [
+                PaymentIn(
+                    payer_member=member, payer_name=member.name, contact=member.contact, email=member.email,
+                    revenue_type=fee['revenue_type'], amount=amount, payment_date=fee['payment_date'],
+                    payment_method=fee['payment_method'], account=fee['account'],
+                    receipt_number=number, created_by=user,
+                )
+                for (member, amount), number in zip(paying, numbers)
+            ]
+            PaymentIn.objects.bulk_create(result.payments, batch_size=BATCH_SIZE)
+            Account.adjust_balance(fee['account'].id, result.fees_total)
+            CategoryTotal.adjust_for('revenue_type', result.payments)
+            if settings.LEDGER_EMAIL_RECEIPTS:
+                queue_receipts(result.payments)
+
+    if result.payments:
+        # bulk_create skips post_save, so do what the payment signals would have done
+        caching.bump_version('payment_in', result.payments[0].tenant_id)
+        metrics.inc(
+            'ledger_payments_posted_total', len(result.payments), account=fee['account'].id, direction='in'
+        )
+    return result
@@ -0,0 +1,232 @@
+# ledger/jobs.py
+"""Database-backed job queue.
+
+Work is enqueued as a Job row (in the caller's transaction, so a rolled back
+request never leaves a job behind) and picked up by `manage.py run_worker`.
+Workers claim a job with a conditional UPDATE on its status, so any number of
+processes can poll the same table without a broker or row locks. Failed jobs
+are retried with exponential backoff until max_attempts; jobs whose worker
+died are requeued once their lock goes stale: a running job's worker refreshes
+the lock every so often, so only a job nobody is working on goes stale,
+however long it runs. Schedule rows enqueue tasks on a cron timetable.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .cron import Cron
+from .models import Job, Schedule
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+# First retry waits this many seconds, doubling on each further attempt
+RETRY_BACKOFF = 30
+MAX_BACKOFF = 3600
+
+
+@dataclass
+class TaskSpec:
+    name: str
+    func: Callable
+    max_attempts: int
+    priority: int
+    # Called with the job's kwargs when the job is given up after its worker died
+    on_abandon: Optional[Callable] = None
+
+
+TASKS = {}
+
+
+def task(name, max_attempts=3, priority=PRIORITY_NORMAL, on_abandon=None):
+    """Register a function as a queueable task; it is called with the job's kwargs."""
+    def register(func):
+        TASKS[name] = TaskSpec(name, func, max_attempts, priority, on_abandon)
+        return func
+    return register
+
+
+def get_task(name):
+    from . import tasks  # noqa: F401 - registers the built-in tasks
+    return TASKS.get(name)
+
+
+def enqueue(name, *, priority=None, run_after=None, max_attempts=None, **kwargs):
+    """Queue `name` to run with `kwargs` (which must be JSON serializable)."""
+    spec = get_task(name)
+    if spec is None:
+        raise ValueError(f"Unknown task '{name}'.")
+    return Job.objects.create(
+        task=name,
+        kwargs=kwargs,
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts if max_attempts is None else max_attempts,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def backoff(attempt):
+    return timedelta(seconds=min(RETRY_BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF))
+
+
+def heartbeat_interval():
+    return settings.LEDGER_JOB_STALE_AFTER / 4
+
+
+@contextmanager
+def heartbeat(job):
+    """Refresh the job's lock while the block runs, so a long job isn't mistaken for an abandoned one."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(heartbeat_interval()):
+                Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+                    locked_at=timezone.now()
+                )
+        except Exception:
+            logger.exception("Heartbeat for job %s failed", job.pk)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(now):
+    """Release jobs whose worker has not refreshed their lock within LEDGER_JOB_STALE_AFTER."""
+    cutoff = now - timedelta(seconds=settings.LEDGER_JOB_STALE_AFTER)
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    message = 'Worker stopped responding; the job was abandoned.'
+    for job in stale.filter(attempts__gte=F('max_attempts')).only('task', 'kwargs'):
+        failed = Job.objects.filter(pk=job.pk, status='running').update(
+            status='failed', locked_by='', last_error=message, finished_at=now
+        )
+        spec = get_task(job.task)
+        if failed and spec is not None and spec.on_abandon is not None:
+            try:
+                spec.on_abandon(**job.kwargs)
+            except Exception:
+                logger.exception("Cleaning up abandoned job %s (%s) failed", job.pk, job.task)
+    stale.update(status='queued', locked_by='', last_error=message, run_after=now)
+
+
+def claim(worker):
+    """Take the most urgent due job, or return None when there is nothing to do."""
+    now = timezone.now()
+    requeue_stale(now)
+    due = Job.objects.filter(status='queued', run_after__lte=now).order_by('-priority', 'run_after', 'id')
+    for job in due[:5]:
+        claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+            status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            job.status, job.locked_by, job.locked_at = 'running', worker, now
+            job.attempts += 1
+            return job
+    return None
+
+
+def execute(job):
+    """Run a claimed job and record the outcome, scheduling a retry on failure."""
+    spec = get_task(job.task)
+    started = time.perf_counter()
+    try:
+        if spec is None:
+            raise LookupError(f"Unknown task '{job.task}'.")
+        with heartbeat(job):
+            spec.func(**job.kwargs)
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.task, job.attempts)
+        job.last_error = traceback.format_exc()
+        if spec is not None and job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + backoff(job.attempts)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'done'
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    Job.objects.filter(pk=job.pk).update(
+        status=job.status, last_error=job.last_error, run_after=job.run_after,
+        finished_at=job.finished_at, locked_by='',
+    )
+    outcome = {'queued': 'retried'}.get(job.status, job.status)
+    metrics.inc('ledger_jobs_total', task=job.task, outcome=outcome)
+    metrics.observe('ledger_job_duration_seconds', time.perf_counter() - started, task=job.task)
+    return job
+
+
+def work(worker, stop, poll_interval=2.0, once=False):
+    """Claim and run jobs until `stop` is set (or, with `once`, until the queue is empty)."""
+    while not stop.is_set():
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            if once:
+                return
+            metrics.registry.flush()
+            stop.wait(poll_interval)
+            continue
+        execute(job)
+        metrics.registry.flush()
+
+
+def sync_schedules():
+    """Create or update the schedules declared in LEDGER_SCHEDULES. Enabled flags set in the admin are kept."""
+    now = timezone.now()
+    for entry in settings.LEDGER_SCHEDULES:
+        schedule = Schedule.objects.filter(name=entry['name']).first()
+        if schedule is None:
+            schedule = Schedule(name=entry['name'], enabled=entry.get('enabled', True))
+        changed = schedule.cron != entry['cron']
+        schedule.cron = entry['cron']
+        schedule.task = entry['task']
+        schedule.kwargs = entry.get('kwargs', {})
+        schedule.priority = entry.get('priority', PRIORITY_LOW)
+        if changed or schedule.next_run_at is None:
+            schedule.next_run_at = Cron(schedule.cron).next_after(now)
+        schedule.save()
+
+
+def run_due_schedules(now=None):
+    """Enqueue every schedule that has come due. Missed runs are coalesced into one."""
+    now = now or timezone.now()
+    queued = []
+    for schedule in Schedule.objects.filter(enabled=True, next_run_at__lte=now):
+        following = Cron(schedule.cron).next_after(now)
+        # Only the process that moves next_run_at on enqueues, however many schedulers are running
+        advanced = Schedule.objects.filter(pk=schedule.pk, next_run_at=schedule.next_run_at).update(
+            next_run_at=following, last_run_at=now
+        )
+        if advanced:
+            queued.append(enqueue(schedule.task, priority=schedule.priority, **schedule.kwargs))
+    return queued
@@ -0,0 +1,106 @@
+# ledger/layouts.py
+"""Crispy layouts rendered once per process.
+
+A crispy form re-renders its whole layout template tree (rows, columns,
+headings, buttons) on every request, although only the fields differ from
+one request to the next. Forms using CachedLayoutMixin build their helper
+once per class; on first render the layout is rendered with a marker in
+place of each field and split into a skeleton of static HTML chunks and
+field slots. Later renders join the chunks and render just the fields, so
+values and errors are still filled in per request.
+
+HTML blocks in a cached layout must not depend on the request (a {% url %}
+is fine, the user or an object is not).
+"""
+import re
+
+from crispy_forms.helper import FormHelper
+from crispy_forms.layout import Field, LayoutObject
+from crispy_forms.utils import TEMPLATE_PACK, render_field
+from django.utils.safestring import SafeString, mark_safe
+
+SLOT = re.compile('\x00(\\d+)\x00')
+
+
+class Slot(LayoutObject):
+    """Stands in for a field while the skeleton is rendered."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def render(self, form, context, template_pack=TEMPLATE_PACK, **kwargs):
+        return SafeString(f'\x00{self.index}\x00')
+
+
+def slotted(layout_object, fields):
+    """Copy of the layout with every field replaced by a Slot; `fields` collects what each slot stands for."""
+    if isinstance(layout_object, (str, Field)):
+        fields.append(layout_object)
+        return Slot(len(fields) - 1)
+    if not hasattr(layout_object, 'fields'):
+        return layout_object
+    copy = object.__new__(type(layout_object))
+    copy.__dict__.update(layout_object.__dict__)
+    copy.fields = [slotted(child, fields) for child in layout_object.fields]
+    return copy
+
+
+class CachedLayoutHelper(FormHelper):
+    """A FormHelper that renders its layout's static HTML once and reuses it."""
+
+    def __init__(self, layout, **attrs):
+        super().__init__()
+        for name, value in attrs.items():
+            setattr(self, name, value)
+        self.layout = layout
+        self.skeletons = {}
+
+    def skeleton(self, form, context, template_pack):
+        fields = []
+        html = slotted(self.layout, fields).render(form, context, template_pack=template_pack)
+        parts = SLOT.split(html)
+        # split() alternates static HTML with the captured slot numbers
+        return [part if i % 2 == 0 else fields[int(part)] for i, part in enumerate(parts)]
+
+    def render_layout(self, form, context, template_pack=TEMPLATE_PACK):
+        form.rendered_fields = set()
+        form.crispy_field_template = self.field_template
+        skeleton = self.skeletons.get(template_pack)
+        if skeleton is None:
+            skeleton = self.skeletons[template_pack] = self.skeleton(form, context, template_pack)
+        return mark_safe(''.join(
+            part if i % 2 == 0 else render_field(part, form, context, template_pack=template_pack)
+            for i, part in enumerate(skeleton)
+        ))
+
+
+class CachedLayoutMixin:
+    """Give a form one shared CachedLayoutHelper per class (and layout variant).
+
+    Subclasses define a `build_layout(variant)` classmethod returning the
+    crispy Layout; `layout_variant()` names which version of the layout an
+    instance needs, for forms that show an extra field in some cases.
+    """
+    helper_attrs = {
+        'form_method': 'post',
+        'form_class': 'form-horizontal',
+        'label_class': 'col-md-3',
+        'field_class': 'col-md-9',
+    }
+
+    @classmethod
+    def cached_helper(cls, variant=()):
+        helpers = cls.__dict__.get('_helpers')
+        if helpers is None:
+            helpers = {}
+            setattr(cls, '_helpers', helpers)
+        if variant not in helpers:
+            helpers[variant] = CachedLayoutHelper(cls.build_layout(variant), **cls.helper_attrs)
+        return helpers[variant]
+
+    def layout_variant(self):
+        return ()
+
+    @property
+    def helper(self):
+        return self.cached_helper(self.layout_variant())
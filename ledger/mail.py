@@ -0,0 +1,205 @@
+# ledger/mail.py
+"""Queued email of receipts and member statements.
+
+Posting a payment only inserts an EmailDelivery row and, if none is waiting,
+a `send_emails` job; the worker does the rendering and sending. Deliveries
+are claimed in batches of LEDGER_EMAIL_BATCH_SIZE, each batch is sent over a
+single SMTP connection, and sends are spaced to stay under
+LEDGER_EMAIL_RATE_PER_MINUTE. A recipient the server refuses fails on its
+own; a broken connection puts the rest of the batch back for the job retry.
+"""
+import logging
+import smtplib
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import EmailDelivery, Job, Member, PaymentIn
+
+logger = logging.getLogger(__name__)
+
+# The server refused this message or recipient; retrying the batch won't help
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class RateLimiter:
+    """Spaces calls to wait() so no more than `per_minute` pass in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def receipt_recipient(payment):
+    if payment.email:
+        return payment.email
+    return payment.payer_member.email if payment.payer_member_id else ''
+
+
+def schedule_send():
+    """Queue a send job unless one is already waiting to run."""
+    from .jobs import enqueue
+
+    if not Job.objects.filter(task='send_emails', status='queued').exists():
+        enqueue('send_emails')
+
+
+def queue_receipts(payments):
+    """Queue a receipt email for each payment with a payer address. Returns the number queued."""
+    deliveries = [
+        EmailDelivery(kind='receipt', payment=payment, recipient=recipient)
+        for payment in payments
+        if (recipient := receipt_recipient(payment))
+    ]
+    if deliveries:
+        EmailDelivery.objects.bulk_create(deliveries)
+        schedule_send()
+    return len(deliveries)
+
+
+def queue_statements(start, end, members=None):
+    """Queue a statement for [start, end] to every member (or those given) with an email address."""
+    members = Member.objects.exclude(email='') if members is None else members
+    deliveries = [
+        EmailDelivery(kind='statement', member_id=member_id, recipient=email, period_start=start, period_end=end)
+        for member_id, email in members.values_list('id', 'email')
+    ]
+    EmailDelivery.objects.bulk_create(deliveries, batch_size=500)
+    if deliveries:
+        schedule_send()
+    return len(deliveries)
+
+
+def claim_batch(size):
+    """Mark up to `size` queued deliveries as ours and return them with what they need preloaded."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.LEDGER_JOB_STALE_AFTER)
+    EmailDelivery.objects.filter(status='sending', claimed_at__lt=stale).update(status='queued', batch='')
+
+    token = uuid.uuid4().hex
+    ids = list(EmailDelivery.objects.filter(status='queued').order_by('id').values_list('id', flat=True)[:size])
+    EmailDelivery.objects.filter(id__in=ids, status='queued').update(status='sending', batch=token, claimed_at=now)
+    return list(
+        EmailDelivery.objects.filter(batch=token)
+        .select_related('payment__revenue_type', 'member')
+        .order_by('id')
+    )
+
+
+def statement_payments(deliveries):
+    """{member id: [payments]} for every statement in the batch, in one query."""
+    statements = [d for d in deliveries if d.kind == 'statement']
+    if not statements:
+        return {}
+    rows = (
+        PaymentIn.objects
+        .filter(
+            payer_member_id__in={d.member_id for d in statements},
+            payment_date__gte=min(d.period_start for d in statements),
+            payment_date__lte=max(d.period_end for d in statements),
+        )
+        .select_related('revenue_type')
+        .order_by('payment_date', 'id')
+    )
+    by_member = defaultdict(list)
+    for payment in rows:
+        by_member[payment.payer_member_id].append(payment)
+    return by_member
+
+
+def build_message(delivery, payments_by_member, connection):
+    from .pdfs import receipt_pdf, statement_pdf
+
+    context = {'organisation': settings.LEDGER_ORGANISATION_NAME}
+    if delivery.kind == 'receipt':
+        payment = delivery.payment
+        context['payment'] = payment
+        subject = f"Receipt {payment.receipt_number} from {settings.LEDGER_ORGANISATION_NAME}"
+        attachment = (f"receipt-{payment.receipt_number}.pdf", receipt_pdf(payment))
+    else:
+        member = delivery.member
+        payments = [
+            p for p in payments_by_member.get(member.id, [])
+            if delivery.period_start <= p.payment_date <= delivery.period_end
+        ]
+        context.update(member=member, payments=payments, start=delivery.period_start, end=delivery.period_end,
+                       total=sum(p.amount for p in payments))
+        subject = f"Your statement for {delivery.period_start:%d %b %Y} to {delivery.period_end:%d %b %Y}"
+        attachment = (
+            f"statement-{member.rid}-{delivery.period_start:%Y%m%d}.pdf",
+            statement_pdf(member, delivery.period_start, delivery.period_end, payments),
+        )
+
+    template = f"ledger/email/{delivery.kind}"
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string(f"{template}.txt", context),
+        to=[delivery.recipient],
+        connection=connection,
+    )
+    message.attach_alternative(render_to_string(f"{template}.html", context), 'text/html')
+    message.attach(*attachment, 'application/pdf')
+    return message
+
+
+def send_batch(deliveries, limiter):
+    """Send one claimed batch over one connection. Returns (sent, failed)."""
+    payments_by_member = statement_payments(deliveries)
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+        for delivery in deliveries:
+            try:
+                message = build_message(delivery, payments_by_member, connection)
+            except Exception as exc:
+                logger.exception("Could not build %s email %s", delivery.kind, delivery.pk)
+                failed.append((delivery, f"Could not build the message: {exc}"))
+                continue
+            limiter.wait()
+            try:
+                message.send()
+            except MESSAGE_ERRORS as exc:
+                failed.append((delivery, str(exc)))
+            else:
+                sent.append(delivery.pk)
+    except Exception:
+        # The connection itself failed: hand back what wasn't sent and let the job retry
+        done = set(sent) | {delivery.pk for delivery, _ in failed}
+        EmailDelivery.objects.filter(batch=deliveries[0].batch).exclude(pk__in=done).update(status='queued', batch='')
+        raise
+    finally:
+        record(sent, failed)
+        connection.close()
+    return len(sent), len(failed)
+
+
+def record(sent, failed):
+    now = timezone.now()
+    EmailDelivery.objects.filter(pk__in=sent).update(status='sent', sent_at=now, error='')
+    for delivery, error in failed:
+        EmailDelivery.objects.filter(pk=delivery.pk).update(status='failed', error=error)
+
+
+def send_pending(batch_size=None, per_minute=None):
+    """Send every queued delivery. Returns (sent, failed)."""
+    batch_size = batch_size or settings.LEDGER_EMAIL_BATCH_SIZE
+    limiter = RateLimiter(settings.LEDGER_EMAIL_RATE_PER_MINUTE if per_minute is None else per_minute)
+    totals = [0, 0]
+    while batch := claim_batch(batch_size):
+        sent, failed = send_batch(batch, limiter)
+        totals[0] += sent
+        totals[1] += failed
+    return tuple(totals)
@@ -0,0 +1,41 @@
+# ledger/management/commands/close_period.py
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.periods import close_period, reopen_period
+from ledger.tenancy import club_for_command, scoped
+
+
+class Command(BaseCommand):
+    help = 'Close (or reopen) an accounting month or year, freezing its totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', help='YYYY-MM to close a month, YYYY to close a year')
+        parser.add_argument('--reopen', action='store_true', help='Reopen the period and discard its frozen totals')
+        parser.add_argument('--club', help='Slug of the club whose books to close (needed when there is more than one)')
+
+    def handle(self, *args, **options):
+        match = re.fullmatch(r'(\d{4})(?:-(\d{2}))?', options['period'])
+        if not match:
+            raise CommandError('Period must look like 2025-09 (a month) or 2025 (a year).')
+        year, month = int(match.group(1)), match.group(2) and int(match.group(2))
+        period_type = 'month' if month else 'year'
+        if month and not 1 <= month <= 12:
+            raise CommandError(f'{month} is not a month.')
+
+        club = club_for_command(options['club'])
+        with scoped(club):
+            try:
+                if options['reopen']:
+                    if not reopen_period(period_type, year, month):
+                        raise CommandError(f"{options['period']} is not closed for {club}.")
+                    self.stdout.write(self.style.SUCCESS(f"Reopened {options['period']} for {club}"))
+                    return
+                period = close_period(period_type, year, month)
+            except ValidationError as exc:
+                raise CommandError(' '.join(exc.messages))
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed {period} for {club} with {period.totals.count()} frozen total(s)"
+        ))
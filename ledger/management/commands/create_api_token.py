@@ -0,0 +1,30 @@
+# ledger/management/commands/create_api_token.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.models import ApiToken
+from ledger.permissions import is_ledger_staff
+from ledger.tenancy import club_for_command
+
+
+class Command(BaseCommand):
+    help = 'Create a token for the payment API and print its key (shown only once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='What the token is for, e.g. "MTN MoMo callbacks"')
+        parser.add_argument('--user', required=True, help='Username the posted payments are recorded under')
+        parser.add_argument('--club', help='Slug of the club payments are posted to (needed when there is more than one)')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user named '{options['user']}'.")
+        if not is_ledger_staff(user):
+            raise CommandError(f"{user.username} is not ledger staff, so the token would be refused.")
+        club = club_for_command(options['club'])
+        if user.club_id and user.club_id != club.pk:
+            raise CommandError(f"{user.username} belongs to {user.club}, not {club}.")
+
+        token, key = ApiToken.issue(options['name'], user, tenant=club)
+        self.stdout.write(self.style.SUCCESS(f"Created token '{token.name}' for {club}. Its key, which is not stored:"))
+        self.stdout.write(key)
@@ -0,0 +1,35 @@
+# ledger/management/commands/export_ledger.py
+from django.core.management.base import BaseCommand
+
+from ledger.exports import archive_path, run_export
+from ledger.models import ExportJob
+from ledger.tenancy import club_for_command
+
+
+class Command(BaseCommand):
+    help = 'Write the full ledger to a compressed archive in LEDGER_EXPORT_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Run export jobs requested from the web UI that have not started yet, instead of a new export'
+        )
+        parser.add_argument('--club', help='Slug of the club to export (needed when there is more than one)')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            jobs = list(ExportJob.all_clubs.filter(status='pending').order_by('created_at'))
+            if not jobs:
+                self.stdout.write("No pending export jobs")
+        else:
+            jobs = [ExportJob.objects.create(tenant=club_for_command(options['club']))]
+
+        for job in jobs:
+            run_export(job)
+            if job.status == 'done':
+                self.stdout.write(self.style.SUCCESS(
+                    f"Export #{job.pk}: {job.rows_written:,} row(s) written to {archive_path(job)} "
+                    f"({job.file_size:,} bytes)"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Export #{job.pk} failed: {job.error}"))
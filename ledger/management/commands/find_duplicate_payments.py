@@ -0,0 +1,54 @@
+# ledger/management/commands/find_duplicate_payments.py
+from datetime import date
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ledger.models import Club, PaymentIn
+from ledger.tenancy import club_for_command, scoped
+
+
+class Command(BaseCommand):
+    help = 'List receipts that look like the same payment entered more than once (same payer, amount, date and account)'
+    # Run unattended from cron; the system checks (which load every template tag library) ran at deploy
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--club', help='Slug of the club to check (default: every club)')
+        parser.add_argument('--since', type=date.fromisoformat, help='Only look at payments on or after this date, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        club = club_for_command(options['club']) if options['club'] else None
+        with scoped(club):
+            payments = PaymentIn.objects.all()
+            if options['since']:
+                payments = payments.filter(payment_date__gte=options['since'])
+            clusters = self.clusters(payments)
+
+        clubs = Club.objects.cached()
+        total = 0
+        for (tenant_id, _), rows in clusters:
+            total += len(rows) - 1
+            first = rows[0]
+            self.stdout.write(self.style.WARNING(
+                f"{clubs[tenant_id].name}: {first.payer_name}, {first.amount:,.2f} on {first.payment_date} "
+                f"into {first.account}: {', '.join(payment.receipt_number for payment in rows)}"
+            ))
+        style = self.style.SUCCESS if not clusters else self.style.ERROR
+        self.stdout.write(style(f"{len(clusters)} duplicate cluster(s), {total} receipt(s) that may be double entries"))
+
+    def clusters(self, payments):
+        """[((tenant, fingerprint), [payments])] for every fingerprint posted more than once, in one query."""
+        repeated = (
+            payments.order_by().values('fingerprint')
+            .annotate(copies=Count('id')).filter(copies__gt=1).values('fingerprint')
+        )
+        rows = (
+            payments.filter(fingerprint__in=repeated)
+            .select_related('account')
+            .order_by('tenant_id', 'fingerprint', 'id')
+        )
+        grouped = groupby(rows, key=lambda payment: (payment.tenant_id, payment.fingerprint))
+        # The same fingerprint in two different clubs is not a duplicate
+        return [(key, group) for key, group in ((key, list(group)) for key, group in grouped) if len(group) > 1]
@@ -0,0 +1,84 @@
+# ledger/management/commands/import_members.py
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.imports import import_members, read_rows
+from ledger.models import Account, PaymentIn, RevenueType
+from ledger.tenancy import club_for_command, scoped
+
+
+def lookup(model, value, label):
+    """Find a row by id or (case-insensitive) name."""
+    queryset = model.objects.filter(pk=int(value)) if value.isdigit() else model.objects.filter(name__iexact=value)
+    found = queryset.first()
+    if found is None:
+        raise CommandError(f"No {label} matches '{value}'.")
+    return found
+
+
+class Command(BaseCommand):
+    help = 'Import members from a CSV file, optionally posting a registration fee for each'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV with columns name, rid, email and optionally contact, residence, '
+                                             'club, other_club_name, buddy_group, registration_fee')
+        parser.add_argument('--user', help='Username recorded as the creator of the members and payments')
+        parser.add_argument('--fee-revenue-type', help='Revenue type (name or id) to post registration fees under')
+        parser.add_argument('--fee-account', help='Account (name or id) receiving the fees')
+        parser.add_argument('--fee-method', default='cash', choices=[m for m, _ in PaymentIn.PAYMENT_METHODS])
+        parser.add_argument('--fee-date', type=date.fromisoformat, help='Payment date, YYYY-MM-DD (default today)')
+        parser.add_argument('--fee-amount', help="Fee for rows without a registration_fee value "
+                                                 "(default: the revenue type's default amount)")
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving anything')
+        parser.add_argument('--club', help='Slug of the club to import into (needed when there is more than one)')
+
+    def handle(self, *args, **options):
+        with scoped(club_for_command(options['club'])):
+            self.import_file(options)
+
+    def import_file(self, options):
+        user = None
+        if options['user']:
+            user = get_user_model().objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named '{options['user']}'.")
+
+        fee = None
+        if options['fee_revenue_type'] or options['fee_account']:
+            if not (options['fee_revenue_type'] and options['fee_account']):
+                raise CommandError('--fee-revenue-type and --fee-account must be given together.')
+            revenue_type = lookup(RevenueType, options['fee_revenue_type'], 'revenue type')
+            fee = {
+                'revenue_type': revenue_type,
+                'account': lookup(Account, options['fee_account'], 'account'),
+                'payment_method': options['fee_method'],
+                'payment_date': options['fee_date'] or date.today(),
+                'amount': revenue_type.amount_default,
+            }
+            if options['fee_amount']:
+                try:
+                    fee['amount'] = Decimal(options['fee_amount'])
+                except InvalidOperation:
+                    raise CommandError(f"--fee-amount '{options['fee_amount']}' is not a number.")
+
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as stream:
+                result = import_members(read_rows(stream), user=user, fee=fee, dry_run=options['dry_run'])
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ValidationError as exc:
+            raise CommandError(' '.join(exc.messages))
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f"Line {line}: {message}"))
+
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        summary = f"{verb} {len(result.members)} of {result.rows} member(s)"
+        if result.payments:
+            summary += f" and posted {len(result.payments)} fee(s) totalling {result.fees_total:,.2f}"
+        style = self.style.SUCCESS if not result.errors else self.style.ERROR
+        self.stdout.write(style(f"{summary}; {len(result.errors)} row(s) rejected"))
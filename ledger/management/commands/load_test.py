@@ -0,0 +1,299 @@
+# ledger/management/commands/load_test.py
+import html
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+# Relative weights of what a treasurer does in a session
+DEFAULT_MIX = 'dashboard=40,cashbook=25,payment=15,receipt=20'
+SCENARIOS = ('dashboard', 'cashbook', 'payment', 'receipt')
+PERCENTILES = (50, 90, 95, 99)
+
+OPTION = re.compile(r'<option value="(\d+)"')
+# Django's technical 500 page: exception type in the heading, message just below
+DEBUG_EXCEPTION = re.compile(r'<h1>(\w+)\s+at .*?</h1>\s*<pre class="exception_value">(.*?)</pre>', re.S)
+LOCK_WAITS = re.compile(r'^ledger_db_lock_waits_total(?:\{.*\})? (\S+)$', re.M)
+
+
+def parse_mix(text):
+    """{scenario: weight} from "dashboard=40,cashbook=25,..."; scenarios left out get no traffic."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}' in --mix (choose from {', '.join(SCENARIOS)}).")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f"'{part}' in --mix needs a number, e.g. {name}=20.")
+    if not any(weight > 0 for weight in mix.values()):
+        raise CommandError('--mix needs at least one scenario with a positive weight.')
+    return mix
+
+
+def parse_user(text):
+    username, sep, password = text.partition(':')
+    if not (username and sep):
+        raise CommandError(f"--user takes username:password, not '{text}'.")
+    return username, password
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def select_options(html, name):
+    """The non-empty option values of the <select> called `name`."""
+    match = re.search(rf'<select name="{name}".*?</select>', html, re.S)
+    return OPTION.findall(match.group(0)) if match else []
+
+
+def classify(status, body):
+    """Label for a response the scenario didn't expect, naming the exception when DEBUG shows it."""
+    match = DEBUG_EXCEPTION.search(body)
+    if not match:
+        return f'HTTP {status}'
+    exception, message = match[1], html.unescape(match[2]).strip()
+    if 'database is locked' in message:
+        return 'database is locked'
+    return f'HTTP {status} {exception}: {message[:90]}'
+
+
+class KeepRedirects(HTTPRedirectHandler):
+    """Hand 3xx responses back instead of following them, so a successful POST shows as its redirect."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """One browser: its own cookies, logged in as one user."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), KeepRedirects)
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, path, data=None):
+        """(status, body) for a GET, or a form POST when `data` is given."""
+        url = urljoin(self.base_url, path)
+        headers = {'Referer': url}
+        if data is not None:
+            data = urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        try:
+            with self.opener.open(Request(url, data=data, headers=headers), timeout=self.timeout) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except HTTPError as exc:
+            return exc.code, exc.read().decode('utf-8', 'replace')
+
+    def login(self, username, password):
+        path = reverse('login')
+        self.request(path)
+        status, _ = self.request(path, {'username': username, 'password': password})
+        if status != 302:
+            raise CommandError(f"Could not log in as {username} (check the password and that the user is active).")
+
+
+class Recorder:
+    """Latencies and errors per scenario, shared by the worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def add(self, scenario, seconds, error=None):
+        with self.lock:
+            self.latencies[scenario].append(seconds)
+            if error:
+                self.errors[scenario][error] += 1
+
+
+class Command(BaseCommand):
+    help = ('Drive a running ledger (runserver, gunicorn, uvicorn...) with logged-in users replaying a treasurer '
+            'mix of dashboard views, cashbook ranges, payment posts and receipt prints, and report throughput, '
+            'latency percentiles and errors. Payment posts record real payments (payer "Load test") in the '
+            "users' club; point it at a copy of the database, or leave payment out of --mix.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/', help='Base URL of the running server')
+        parser.add_argument('--user', action='append', required=True, metavar='USERNAME:PASSWORD',
+                            help='Account to log in as; repeat for more users (sessions are shared out round robin)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Simultaneous sessions (default 10)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run for (default 30)')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests instead of --duration')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Scenario weights (default {DEFAULT_MIX})')
+        parser.add_argument('--think', type=float, default=0,
+                            help='Mean pause in seconds between one session\'s requests (default 0: flat out)')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, help='Random seed, to replay the same sequence')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        self.mix = parse_mix(options['mix'])
+        self.options = options
+        self.random = random.Random(options['seed'])
+        users = [parse_user(text) for text in options['user']]
+        base_url = options['url']
+
+        self.stdout.write(f"Logging in {options['concurrency']} session(s) as {len(users)} user(s) at {base_url}")
+        sessions = []
+        try:
+            for i in range(options['concurrency']):
+                session = Session(base_url, options['timeout'])
+                session.login(*users[i % len(users)])
+                sessions.append(session)
+        except URLError as exc:
+            raise CommandError(f"Cannot reach {base_url}: {exc.reason}")
+        self.prepare(sessions[0])
+        self.locks_before = self.lock_waits(sessions[0])
+
+        recorder = Recorder()
+        self.remaining = options['requests']
+        self.remaining_lock = threading.Lock()
+        self.deadline = time.monotonic() + options['duration']
+        workers = [
+            threading.Thread(target=self.work, args=(session, recorder, random.Random(self.random.random())))
+            for session in sessions
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.report(recorder, time.monotonic() - started)
+
+        locks_after = self.lock_waits(sessions[0])
+        if self.locks_before is not None and locks_after is not None:
+            # Other worker processes publish their counts up to a few seconds late
+            self.stdout.write(f"\nServer-side database lock errors during the run (/metrics): "
+                              f"{locks_after - self.locks_before:g}")
+
+    def prepare(self, session):
+        """Read the choices a payment form offers and some receipts to print, as the first user sees them."""
+        _, form = session.request(reverse('payment_in_create'))
+        self.revenue_types, self.accounts = select_options(form, 'revenue_type'), select_options(form, 'account')
+        if self.mix.get('payment') and not (self.revenue_types and self.accounts):
+            raise CommandError('The payment form offers no revenue type or account to post to.')
+
+        detail = reverse('payment_in_detail', args=[0])[:-2]
+        _, listing = session.request(reverse('payment_in_list'))
+        self.payments = sorted(set(re.findall(rf'{re.escape(detail)}(\d+)/"', listing)))
+        if self.mix.get('receipt') and not self.payments:
+            self.stdout.write(self.style.WARNING('No payments listed to print receipts for; receipt prints are skipped.'))
+            self.mix['receipt'] = 0
+            if not any(self.mix.values()):
+                raise CommandError('The mix only prints receipts, and there are no payments to print.')
+
+    def lock_waits(self, session):
+        """ledger_db_lock_waits_total summed over databases, or None when the user may not read /metrics."""
+        status, body = session.request(reverse('metrics'))
+        if status != 200:
+            return None
+        return sum(float(value) for value in LOCK_WAITS.findall(body))
+
+    def take(self):
+        """Whether this worker may send another request."""
+        if self.remaining is None:
+            return time.monotonic() < self.deadline
+        with self.remaining_lock:
+            self.remaining -= 1
+            return self.remaining >= 0
+
+    def work(self, session, recorder, rng):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while self.take():
+            scenario = rng.choices(names, weights)[0]
+            path, data, expected = getattr(self, f'{scenario}_request')(rng)
+            started = time.perf_counter()
+            try:
+                status, body = session.request(path, data)
+            except (URLError, OSError) as exc:
+                recorder.add(scenario, time.perf_counter() - started, type(getattr(exc, 'reason', exc)).__name__)
+            else:
+                error = None if status == expected else classify(status, body)
+                if scenario == 'payment' and status == 200:
+                    error = 'payment form rejected'
+                recorder.add(scenario, time.perf_counter() - started, error)
+            if self.options['think']:
+                time.sleep(rng.expovariate(1 / self.options['think']))
+
+    def dashboard_request(self, rng):
+        return reverse('dashboard'), None, 200
+
+    def cashbook_request(self, rng):
+        today = timezone.now().date()
+        end = today - timedelta(days=rng.randint(0, 365))
+        start = end - timedelta(days=rng.choice([7, 30, 31, 90, 365]))
+        return f"{reverse('cashbook')}?{urlencode({'start_date': start, 'end_date': end})}", None, 200
+
+    def payment_request(self, rng):
+        data = {
+            'manual_payer_name': 'Load test',
+            'revenue_type': rng.choice(self.revenue_types),
+            'amount': f'{rng.randint(1, 500) * 1000}.00',
+            'payment_date': timezone.now().date().isoformat(),
+            'payment_method': 'cash',
+            'account': rng.choice(self.accounts),
+            'notes': 'Posted by the load_test command',
+            'confirm_duplicate': 'on',
+        }
+        return reverse('payment_in_create'), data, 302
+
+    def receipt_request(self, rng):
+        return reverse('payment_receipt', args=[rng.choice(self.payments)]), None, 200
+
+    def report(self, recorder, elapsed):
+        ms = lambda seconds: f"{seconds * 1000:8.1f}"
+        rows = [(name, sorted(recorder.latencies[name])) for name in SCENARIOS if recorder.latencies[name]]
+        total = sum(len(latencies) for _, latencies in rows)
+        errors = sum(sum(counter.values()) for counter in recorder.errors.values())
+        if not total:
+            raise CommandError('No requests were sent.')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\n{total} request(s) in {elapsed:.1f} s from {self.options['concurrency']} session(s): "
+            f"{total / elapsed:.1f} req/s, {errors / total:.1%} errors"
+        ))
+        header = ''.join(f"{f'p{pct}':>9}" for pct in PERCENTILES)
+        self.stdout.write(f"  {'scenario':<11}{'requests':>9}{'req/s':>8}{'errors':>8}{header}{'max':>9}   (ms)")
+        everything = sorted(seconds for _, latencies in rows for seconds in latencies)
+        for name, latencies in [*rows, ('all', everything)]:
+            failed = sum(recorder.errors[name].values()) if name != 'all' else errors
+            self.stdout.write(
+                f"  {name:<11}{len(latencies):>9}{len(latencies) / elapsed:>8.1f}{failed / len(latencies):>8.1%}"
+                + ''.join(f"{ms(percentile(latencies, pct)):>9}" for pct in PERCENTILES)
+                + f"{ms(latencies[-1]):>9}"
+            )
+
+        if errors:
+            by_kind = Counter()
+            for counter in recorder.errors.values():
+                by_kind.update(counter)
+            self.stdout.write(self.style.ERROR('\nErrors'))
+            for kind, count in by_kind.most_common():
+                scenarios = ', '.join(name for name in SCENARIOS if recorder.errors[name][kind])
+                self.stdout.write(f"  {count:>7}  {kind}  ({scenarios})")
+            if self.locks_before is None and not by_kind['database is locked']:
+                self.stdout.write('  Responses only name lock errors with DEBUG on; log in as ledger staff '
+                                  'to have the run read them from /metrics.')
@@ -0,0 +1,62 @@
+# ledger/management/commands/rebuild_category_totals.py
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from ledger.models import CategoryTotal, PaymentIn, PaymentOut
+from ledger.tenancy import club_for_command, scoped
+
+
+class Command(BaseCommand):
+    help = 'Recompute the monthly revenue and expense type totals behind the budget report from the payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--club', help='Slug of the club whose totals to rebuild (needed when there is more than one)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted totals without changing them')
+
+    def handle(self, *args, **options):
+        club = club_for_command(options['club'])
+        with scoped(club), transaction.atomic():
+            expected = defaultdict(Decimal)
+            for model, kind in ((PaymentIn, 'revenue_type'), (PaymentOut, 'expense_type')):
+                rows = (
+                    model.objects.values_list(f'{kind}_id', 'payment_date')
+                    .annotate(total=Sum('amount'))
+                    .order_by()
+                )
+                for category_id, day, total in rows:
+                    expected[kind, category_id, day.replace(day=1)] += total
+
+            stored = {
+                (row.kind, row.category_id, row.month): row for row in CategoryTotal.objects.all()
+            }
+            drifted = []
+            for key in expected.keys() | stored.keys():
+                row = stored.get(key)
+                total = expected.get(key, Decimal('0'))
+                if row is None or row.total != total:
+                    drifted.append((key, row.total if row else Decimal('0'), total))
+
+            for (kind, category_id, month), was, total in sorted(drifted, key=lambda item: item[0][2]):
+                self.stdout.write(self.style.WARNING(
+                    f"{kind} {category_id} {month:%Y-%m}: stored {was:,.2f}, expected {total:,.2f}"
+                ))
+            if not options['dry_run']:
+                CategoryTotal.objects.all().delete()
+                CategoryTotal.objects.bulk_create(
+                    [
+                        CategoryTotal(kind=kind, category_id=category_id, month=month, total=total)
+                        for (kind, category_id, month), total in expected.items() if total
+                    ],
+                    batch_size=500,
+                )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f"Category totals for {club} match the payments"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.ERROR(f"{len(drifted)} drifted total(s) for {club}. Re-run without --dry-run to fix."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt category totals for {club}: fixed {len(drifted)} drifted total(s)"))
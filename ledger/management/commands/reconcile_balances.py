@@ -0,0 +1,108 @@
+# ledger/management/commands/reconcile_balances.py
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from ledger.models import Account, PaymentIn, PaymentOut, ReconciliationCheckpoint, ReconciliationRun
+
+
+def grouped_totals(model, after_id):
+    """One grouped query: {account_id: total} for rows above the high-water mark, plus the new mark."""
+    rows = (
+        model.objects.filter(id__gt=after_id)
+        .values('account_id')
+        .annotate(total=Sum('amount'), last_id=Max('id'))
+        .order_by()
+    )
+    totals, last_id = {}, after_id
+    for row in rows:
+        totals[row['account_id']] = row['total']
+        last_id = max(last_id, row['last_id'])
+    return totals, last_id
+
+
+class Command(BaseCommand):
+    help = 'Recompute account balances from payments and report (or repair) any drift'
+    # Run unattended from cron; the system checks (which load every template tag library) ran at deploy
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rescan every payment instead of only those after the last high-water mark. '
+                 'Incremental runs do not see edits or deletes of older payments, so when one finds '
+                 'drift it rescans every payment before reporting or repairing it.'
+        )
+        parser.add_argument('--repair', action='store_true', help='Set drifted balances to the recomputed value')
+
+    def scan(self, run, last_run, full):
+        """Bring the checkpoints up to date and return (accounts, [(account, expected, drift)])."""
+        after_in = 0 if full else last_run.last_payment_in_id
+        after_out = 0 if full else last_run.last_payment_out_id
+
+        totals_in, run.last_payment_in_id = grouped_totals(PaymentIn, after_in)
+        totals_out, run.last_payment_out_id = grouped_totals(PaymentOut, after_out)
+
+        checkpoints = {c.account_id: c for c in ReconciliationCheckpoint.objects.all()}
+        created, drifted = [], []
+        accounts = list(Account.objects.order_by('name'))
+        for account in accounts:
+            checkpoint = checkpoints.get(account.id)
+            if checkpoint is None:
+                checkpoint = ReconciliationCheckpoint(account=account)
+                created.append(checkpoint)
+            elif full:
+                checkpoint.total_in = checkpoint.total_out = Decimal('0')
+            checkpoint.total_in += totals_in.get(account.id) or 0
+            checkpoint.total_out += totals_out.get(account.id) or 0
+
+            expected = account.opening_balance + checkpoint.total_in - checkpoint.total_out
+            drift = account.balance - expected
+            if drift:
+                drifted.append((account, expected, drift))
+
+        ReconciliationCheckpoint.objects.bulk_create(created)
+        ReconciliationCheckpoint.objects.bulk_update(checkpoints.values(), ['total_in', 'total_out'])
+        return accounts, drifted
+
+    def handle(self, *args, **options):
+        last_run = ReconciliationRun.objects.filter(finished_at__isnull=False).first()
+        full = options['full'] or last_run is None
+        repair = options['repair']
+
+        with transaction.atomic():
+            run = ReconciliationRun.objects.create(mode='full' if full else 'incremental')
+            accounts, drifted = self.scan(run, last_run, full)
+            if drifted and not full:
+                # Edits and deletes of payments below the high-water mark look like drift
+                # to an incremental run, so only a full rescan may report (or repair) it
+                self.stdout.write("Incremental run found drift; rescanning every payment to confirm it.")
+                run.mode = 'full'
+                accounts, drifted = self.scan(run, last_run, full=True)
+
+            for account, expected, drift in drifted:
+                self.stdout.write(self.style.WARNING(
+                    f"{account.name}: stored {account.balance:,.2f}, expected {expected:,.2f}, drift {drift:+,.2f}"
+                ))
+                if repair:
+                    Account.adjust_balance(account.id, -drift)
+
+            run.accounts_checked = len(accounts)
+            run.drifted_accounts = len(drifted)
+            run.total_drift = sum((abs(drift) for _, _, drift in drifted), Decimal('0'))
+            run.repaired = repair and bool(drifted)
+            run.finished_at = timezone.now()
+            run.save()
+
+        summary = f"{run.get_mode_display()} run checked {run.accounts_checked} account(s)"
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f"{summary}: no drift"))
+        elif repair:
+            self.stdout.write(self.style.SUCCESS(f"{summary}: repaired {len(drifted)} drifted balance(s)"))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"{summary}: {len(drifted)} drifted balance(s), total {run.total_drift:,.2f}. Re-run with --repair to fix."
+            ))
@@ -0,0 +1,81 @@
+# ledger/management/commands/reconcile_statement.py
+import csv
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.management.commands.import_members import lookup
+from ledger.models import Account
+from ledger.reconciliation import DEFAULT_WINDOW, reconcile_statement
+from ledger.tenancy import club_for_command, scoped
+
+
+class Command(BaseCommand):
+    help = 'Match a bank or mobile-money statement (CSV) against the payments posted to an account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Statement export with a date column, an amount (or money in / money '
+                                             'out) column and optionally reference or description columns')
+        parser.add_argument('--account', required=True, help='Account (name or id) the statement is for')
+        parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                            help=f'Days either side of the statement date to look for a payment '
+                                 f'(default {DEFAULT_WINDOW})')
+        parser.add_argument('--report', help='Write every line and its outcome to this CSV file')
+        parser.add_argument('--club', help='Slug of the club the account belongs to (needed when there is more than one)')
+
+    def handle(self, *args, **options):
+        with scoped(club_for_command(options['club'])):
+            self.reconcile(options)
+
+    def reconcile(self, options):
+        account = lookup(Account, options['account'], 'account')
+        started = time.perf_counter()
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as stream:
+                result = reconcile_statement(stream, account, options['window'])
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ValidationError as exc:
+            raise CommandError(' '.join(exc.messages))
+        elapsed = time.perf_counter() - started
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f"Line {line}: {message}"))
+        for line, candidates in result.ambiguous:
+            options_text = '; '.join(entry.label for entry in candidates)
+            self.stdout.write(self.style.WARNING(
+                f"Line {line.line}: {line.amount:,.2f} on {line.date} could be any of: {options_text}"
+            ))
+        for line in result.unmatched:
+            self.stdout.write(self.style.ERROR(
+                f"Line {line.line}: {line.amount:,.2f} on {line.date} ({line.reference}) is not in the ledger"
+            ))
+        for entry in result.missing:
+            self.stdout.write(self.style.NOTICE(
+                f"{entry.label} for {entry.amount:,.2f} ({entry.direction}) is not on the statement"
+            ))
+
+        if options['report']:
+            self.write_report(options['report'], result)
+
+        style = self.style.SUCCESS if not (result.unmatched or result.ambiguous) else self.style.ERROR
+        self.stdout.write(style(
+            f"{account}: {len(result.matched)} of {result.lines} line(s) matched, {len(result.ambiguous)} ambiguous, "
+            f"{len(result.unmatched)} unmatched; {len(result.missing)} ledger payment(s) not on the statement "
+            f"({elapsed:.2f}s)"
+        ))
+
+    def write_report(self, path, result):
+        rows = [(line, 'matched', how, [entry]) for line, entry, how in result.matched]
+        rows += [(line, 'ambiguous', '', candidates) for line, candidates in result.ambiguous]
+        rows += [(line, 'unmatched', '', []) for line in result.unmatched]
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                writer = csv.writer(stream)
+                writer.writerow(['line', 'date', 'amount', 'reference', 'status', 'matched_on', 'ledger_entries'])
+                for line, status, how, entries in sorted(rows, key=lambda row: row[0].line):
+                    writer.writerow([line.line, line.date.isoformat(), line.amount, line.reference, status, how,
+                                     '; '.join(entry.label for entry in entries)])
+        except OSError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,101 @@
+# ledger/management/commands/run_worker.py
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Nothing here imports models at module level: with the "spawn" start method
+# the children import this module before Django is set up.
+
+
+def worker_process(name, poll_interval):
+    import django
+    django.setup()
+
+    # SIGTERM (from the parent, or sent to the whole process group) lets the current job finish;
+    # Ctrl+C is left to the parent
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from ledger.jobs import work
+    work(name, stop, poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue and enqueue scheduled tasks'
+    # Run unattended from cron; the system checks (which load every template tag library) ran at deploy
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.LEDGER_WORKER_PROCESSES,
+            help='Worker processes to run jobs in (default: LEDGER_WORKER_PROCESSES)'
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Enqueue due schedules, run every due job in this process, then exit (for cron or testing)'
+        )
+        parser.add_argument('--no-scheduler', action='store_true', help='Only run jobs; leave schedules to another worker')
+
+    def handle(self, *args, **options):
+        from ledger import jobs
+
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        scheduler = not options['no_scheduler']
+        if scheduler:
+            jobs.sync_schedules()
+
+        if options['once']:
+            if scheduler:
+                jobs.run_due_schedules()
+            jobs.work(jobs.worker_name(), threading.Event(), once=True)
+            self.stdout.write(self.style.SUCCESS('Queue drained'))
+            return
+
+        context = multiprocessing.get_context()
+        stopping = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.append(True))
+
+        def start(index):
+            process = context.Process(
+                target=worker_process, name=f'ledger-worker-{index}',
+                args=(f"{jobs.worker_name()}/{index}", options['poll_interval']),
+            )
+            process.start()
+            return process
+
+        # Children must not inherit the parent's open database connection
+        connections.close_all()
+        pool = [start(index) for index in range(options['processes'])]
+        self.stdout.write(self.style.SUCCESS(
+            f"Started {len(pool)} worker process(es){' and the scheduler' if scheduler else ''}; Ctrl+C to stop"
+        ))
+
+        while not stopping:
+            if scheduler:
+                for job in jobs.run_due_schedules():
+                    self.stdout.write(f"Scheduled {job.task} as job #{job.pk}")
+            for index, process in enumerate(pool):
+                if not process.is_alive() and not stopping:
+                    self.stdout.write(self.style.WARNING(
+                        f"{process.name} exited with code {process.exitcode}; restarting"
+                    ))
+                    pool[index] = start(index)
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write('Stopping: waiting for running jobs to finish')
+        for process in pool:
+            process.terminate()
+        for process in pool:
+            process.join(timeout=settings.LEDGER_JOB_STALE_AFTER)
+            if process.is_alive():
+                process.kill()
+        self.stdout.write(self.style.SUCCESS('Stopped'))
@@ -0,0 +1,45 @@
+# ledger/management/commands/send_statements.py
+import re
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ledger.mail import queue_statements, send_pending
+from ledger.models import Member
+
+
+class Command(BaseCommand):
+    help = 'Queue a payment statement email to every member (or one member) for a month'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='YYYY-MM; defaults to last month')
+        parser.add_argument('--member', help='Only this member, by RID')
+        parser.add_argument(
+            '--send', action='store_true',
+            help='Send everything queued now, in this process, instead of leaving it to run_worker'
+        )
+
+    def handle(self, *args, **options):
+        if options['month']:
+            match = re.fullmatch(r'(\d{4})-(\d{2})', options['month'])
+            if not match or not 1 <= int(match.group(2)) <= 12:
+                raise CommandError('Month must look like 2025-09.')
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+        else:
+            start = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+        members = None
+        if options['member']:
+            members = Member.objects.filter(rid__iexact=options['member'])
+            if not members.exists():
+                raise CommandError(f"No member has RID {options['member']}.")
+
+        count = queue_statements(start, end, members)
+        self.stdout.write(self.style.SUCCESS(f"Queued {count} statement(s) for {start:%B %Y}"))
+
+        if options['send']:
+            sent, failed = send_pending()
+            style = self.style.ERROR if failed else self.style.SUCCESS
+            self.stdout.write(style(f"Sent {sent} email(s), {failed} failed"))
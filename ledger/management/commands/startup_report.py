@@ -0,0 +1,106 @@
+# ledger/management/commands/startup_report.py
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: boot the way a web worker does and report how long each stage took
+BOOT_SCRIPT = '''
+import json, os, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+from django.conf import settings
+settings.INSTALLED_APPS
+configured = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+ready = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+routed = time.perf_counter()
+print(json.dumps({{'settings': configured - started, 'apps': ready - configured, 'urls': routed - ready}}))
+'''
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run(args):
+    started = time.perf_counter()
+    result = subprocess.run(args, capture_output=True, text=True, cwd=settings.BASE_DIR)
+    if result.returncode:
+        raise CommandError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+    return time.perf_counter() - started, result
+
+
+def parse_importtime(stderr):
+    """[(module, self seconds, cumulative seconds)] from python -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append((match[4], int(match[1]) / 1e6, int(match[2]) / 1e6))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report how long a web worker and a management command take to start, and which imports cost the most'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Boots to time; the median is reported (default 5)')
+        parser.add_argument('--top', type=int, default=15, help='Number of packages and project modules to list')
+        parser.add_argument('--command', default='find_duplicate_payments',
+                            help='manage.py command line to time as the cron case (default: find_duplicate_payments)')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        python = sys.executable
+        script = BOOT_SCRIPT.format(settings_module=os.environ['DJANGO_SETTINGS_MODULE'])
+        manage = str(Path(settings.BASE_DIR) / 'manage.py')
+
+        # Warm the bytecode cache so the first run isn't an outlier
+        run([python, '-c', script])
+        boots, stages = [], defaultdict(list)
+        commands = []
+        for _ in range(options['repeat']):
+            elapsed, result = run([python, '-c', script])
+            boots.append(elapsed)
+            for stage, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items():
+                stages[stage].append(seconds)
+            commands.append(run([python, manage, *options['command'].split()])[0])
+        interpreter = statistics.median(run([python, '-c', 'pass'])[0] for _ in range(options['repeat']))
+
+        ms = lambda seconds: f"{seconds * 1000:7.1f} ms"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Median of {options['repeat']} run(s)"))
+        self.stdout.write(f"  Python interpreter alone        {ms(interpreter)}")
+        self.stdout.write(f"  Web worker boot (WSGI + URLs)   {ms(statistics.median(boots))}")
+        for stage in ('settings', 'apps', 'urls'):
+            self.stdout.write(f"    {stage:<29} {ms(statistics.median(stages[stage]))}")
+        self.stdout.write(f"  manage.py {options['command']:<21} {ms(statistics.median(commands))}")
+
+        _, result = run([python, '-X', 'importtime', '-c', script])
+        rows = parse_importtime(result.stderr)
+        by_package = defaultdict(float)
+        for module, own, _ in rows:
+            by_package[module.split('.')[0]] += own
+        project = {app.split('.')[0] for app in settings.INSTALLED_APPS if not app.startswith('django.')}
+        project.add(settings.ROOT_URLCONF.split('.')[0])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nImports during web worker boot: {len(rows)} modules, {ms(sum(own for _, own, _ in rows)).strip()}"
+        ))
+        self.stdout.write('  By top-level package (own time of every module in it)')
+        for package, seconds in sorted(by_package.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"    {package:<30} {ms(seconds)}")
+        self.stdout.write('  Slowest project and third-party app modules (including what they import)')
+        ours = sorted((row for row in rows if row[0].split('.')[0] in project), key=lambda row: -row[2])
+        for module, _, cumulative in ours[:options['top']]:
+            self.stdout.write(f"    {module:<30} {ms(cumulative)}")
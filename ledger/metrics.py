@@ -0,0 +1,294 @@
+# ledger/metrics.py
+"""In-process metrics exported in the Prometheus text format.
+
+Each worker process keeps its counters and histograms in memory and writes a
+snapshot to LEDGER_METRICS_DIR every few seconds. The /metrics view merges the
+snapshots of every process, so a scrape sees the whole deployment no matter
+which worker answers it.
+
+Snapshots of processes that have exited (or that have not written for
+LEDGER_METRICS_MAX_AGE seconds) are folded into a single archive snapshot, so
+the directory stays small while counters never go backwards.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'ledger_http_request_duration_seconds': (
+        'histogram', 'Request latency by URL name.', LATENCY_BUCKETS),
+    'ledger_http_requests_total': (
+        'counter', 'Requests served by URL name and status code.', None),
+    'ledger_payments_posted_total': (
+        'counter', 'Payments posted per account; rate() gives postings per second.', None),
+    'ledger_receipt_allocation_seconds': (
+        'histogram', 'Time taken to allocate a receipt number.', FAST_BUCKETS),
+    'ledger_cache_requests_total': (
+        'counter', 'Cache lookups by cache and result (hit or miss).', None),
+    'ledger_db_lock_waits_total': (
+        'counter', 'Queries that failed waiting on a database lock.', None),
+    'ledger_jobs_total': (
+        'counter', 'Background jobs run by task and outcome (done, retried or failed).', None),
+    'ledger_job_duration_seconds': (
+        'histogram', 'Background job run time by task.', JOB_BUCKETS),
+}
+
+FLUSH_INTERVAL = 5.0
+
+ARCHIVE_PREFIX = 'archive-'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._written_to = None
+        self._filename = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    def reset(self):
+        """Start empty under a new file name; run in forked children so they don't overwrite the parent's snapshot."""
+        self._lock = threading.Lock()
+        self._counters.clear()
+        self._histograms.clear()
+        self._last_flush = 0.0
+        self._written_to = None
+        self._filename = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                hist[0][index] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, labels, list(counts), total, count]
+                    for (name, labels), (counts, total, count) in self._histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        directory = Path(settings.LEDGER_METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / self._filename
+        if path == self._written_to and not path.exists():
+            # Archived as idle by collect(); those counts live in the archive now
+            with self._lock:
+                self._counters.clear()
+                self._histograms.clear()
+        tmp = directory / f".{self._filename}.tmp"
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+        self._written_to = path
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def flush_at_exit():
+    try:
+        registry.flush(force=True)
+    except Exception:
+        pass
+
+
+atexit.register(flush_at_exit)
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def record_cache_lookup(cache, hit):
+    inc('ledger_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def count_lock_waits(execute, sql, params, many, context):
+    """connection.execute_wrapper hook counting SQLite 'database is locked' errors."""
+    try:
+        return execute(sql, params, many, context)
+    except Exception as exc:
+        if 'locked' in str(exc):
+            inc('ledger_db_lock_waits_total', database=context['connection'].alias)
+        raise
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def merge(data, counters, histograms):
+    for name, labels, value in data['counters']:
+        counters[name, tuple(map(tuple, labels))] += value
+    for name, labels, counts, total, count in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        if key not in histograms:
+            histograms[key] = [[0] * len(counts), 0.0, 0]
+        merged = histograms[key]
+        merged[0] = [a + b for a, b in zip(merged[0], counts)]
+        merged[1] += total
+        merged[2] += count
+
+
+def process_running(pid):
+    if os.name == 'nt':
+        # os.kill() would terminate it; assume it runs and leave it to the age check
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_stale(path, now):
+    """Whether the snapshot's process has exited, or has not written for LEDGER_METRICS_MAX_AGE."""
+    pid = path.name.split('-', 1)[0]
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    if not process_running(int(pid)):
+        return True
+    # A reused PID would otherwise keep a dead process's snapshot forever
+    try:
+        return now - path.stat().st_mtime > settings.LEDGER_METRICS_MAX_AGE
+    except OSError:
+        return False
+
+
+def archive(directory, paths):
+    """Fold `paths` and any earlier archives into one new archive snapshot."""
+    claimed = []
+    for path in [*paths, *directory.glob(f'{ARCHIVE_PREFIX}*.json')]:
+        # Renaming claims the file, so a concurrent scrape can't fold it twice
+        target = directory / f".{path.name}.{uuid.uuid4().hex[:8]}.archiving"
+        try:
+            os.rename(path, target)
+        except OSError:
+            continue
+        claimed.append(target)
+    if not claimed:
+        return
+
+    counters, histograms = defaultdict(float), {}
+    for path in claimed:
+        data = read_snapshot(path)
+        if data is not None:
+            merge(data, counters, histograms)
+    name = f"{ARCHIVE_PREFIX}{uuid.uuid4().hex[:8]}.json"
+    tmp = directory / f".{name}.tmp"
+    tmp.write_text(json.dumps({
+        'counters': [[metric, labels, value] for (metric, labels), value in counters.items()],
+        'histograms': [
+            [metric, labels, counts, total, count]
+            for (metric, labels), (counts, total, count) in histograms.items()
+        ],
+    }))
+    os.replace(tmp, directory / name)
+    for path in claimed:
+        path.unlink(missing_ok=True)
+
+
+def collect():
+    """Merge the snapshots written by every worker process, archiving those of exited processes."""
+    counters = defaultdict(float)
+    histograms = {}
+    directory = Path(settings.LEDGER_METRICS_DIR)
+    now = time.time()
+    stale = []
+    for path in directory.glob('*.json'):
+        data = read_snapshot(path)
+        if data is None:
+            continue
+        merge(data, counters, histograms)
+        if is_stale(path, now):
+            stale.append(path)
+    if stale:
+        archive(directory, stale)
+    return counters, histograms
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    registry.flush(force=True)
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
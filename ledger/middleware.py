@@ -0,0 +1,156 @@
+# ledger/middleware.py
+import io
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics, tenancy
+from .permissions import is_ledger_staff
+
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_LEDGER_PROFILE'
+TRUTHY = ('1', 'true', 'yes', 'on')
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 30
+
+class MetricsMiddleware:
+    """Time every request by URL name and count database lock waits for /metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with connection.execute_wrapper(metrics.count_lock_waits):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        url_name = (match.url_name or match.view_name) if match else 'unresolved'
+        metrics.observe('ledger_http_request_duration_seconds', duration, url_name=url_name, method=request.method)
+        metrics.inc('ledger_http_requests_total', url_name=url_name, status=response.status_code)
+        metrics.registry.flush()
+        return response
+
+
+class TenantMiddleware:
+    """Scope everything the request does to its club (see ledger.tenancy)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.club = tenancy.club_for_request(request)
+        with tenancy.scoped(request.club):
+            return self.get_response(request)
+
+
+# tracemalloc is process-wide, so only one request per process is profiled at a time
+_profile_lock = threading.Lock()
+
+
+class RequestProfilerMiddleware:
+    """Run a single request under cProfile and tracemalloc when a staff user asks for it.
+
+    Add ?profile=1 to the URL or send an ``X-Ledger-Profile: 1`` header. The
+    profile and the top allocations are written to LEDGER_PROFILE_DIR and listed
+    under Request profiles in the admin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.wants_profile(request) or not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _profile_lock.release()
+
+    def wants_profile(self, request):
+        flag = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+        return bool(flag) and flag.lower() in TRUTHY and is_ledger_staff(request.user)
+
+    def profile(self, request):
+        # Imported here: profiling is rare, and these are not worth loading into every worker
+        import cProfile
+        import tracemalloc
+
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not already_tracing:
+                tracemalloc.stop()
+
+        save_profile(request, response, profiler, snapshot, duration, peak)
+        return response
+
+
+def save_profile(request, response, profiler, snapshot, duration, peak):
+    from .models import RequestProfile
+
+    url_name = request.resolver_match.url_name if request.resolver_match else ''
+    directory = Path(settings.LEDGER_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{timezone.now():%Y%m%d-%H%M%S}-{url_name or 'request'}-{uuid.uuid4().hex[:6]}"
+
+    profile_file = f"{stem}.prof"
+    profiler.dump_stats(directory / profile_file)
+
+    allocations_file = f"{stem}.txt"
+    (directory / allocations_file).write_text(
+        build_report(request, response, profiler, snapshot, duration, peak)
+    )
+
+    return RequestProfile.objects.create(
+        user=request.user,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        url_name=url_name or '',
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 1),
+        peak_memory_kb=peak // 1024,
+        profile_file=profile_file,
+        allocations_file=allocations_file,
+    )
+
+
+def build_report(request, response, profiler, snapshot, duration, peak):
+    import pstats
+    import tracemalloc
+
+    out = io.StringIO()
+    out.write(f"{request.method} {request.get_full_path()} -> {response.status_code}\n")
+    out.write(f"Duration: {duration * 1000:.1f} ms   Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+
+    out.write(f"Top {TOP_ALLOCATIONS} allocations by line\n")
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        out.write(f"{stat}\n")
+
+    out.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0008_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental')], max_length=12)),
+                ('last_payment_in_id', models.BigIntegerField(default=0)),
+                ('last_payment_out_id', models.BigIntegerField(default=0)),
+                ('accounts_checked', models.PositiveIntegerField(default=0)),
+                ('drifted_accounts', models.PositiveIntegerField(default=0)),
+                ('total_drift', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('repaired', models.BooleanField(default=False)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Balance before the first recorded payment; reconciliation adds postings to this.', max_digits=15),
+        ),
+        migrations.CreateModel(
+            name='ReconciliationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_in', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_out', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reconciliation_checkpoint', to='ledger.account')),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0009_reconciliation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountingPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_type', models.CharField(choices=[('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-start_date', 'period_type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PeriodTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('account', 'Account'), ('revenue_type', 'Revenue Type'), ('expense_type', 'Expense Type')], max_length=20)),
+                ('key', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=255)),
+                ('total_in', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_out', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('closing_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='totals', to='ledger.accountingperiod')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accountingperiod',
+            index=models.Index(fields=['start_date', 'end_date'], name='ledger_acco_start_d_0a57b6_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountingperiod',
+            constraint=models.UniqueConstraint(fields=('period_type', 'start_date'), name='unique_accounting_period'),
+        ),
+        migrations.AddIndex(
+            model_name='periodtotal',
+            index=models.Index(fields=['dimension', 'period'], name='ledger_peri_dimensi_6e436f_idx'),
+        ),
+    ]
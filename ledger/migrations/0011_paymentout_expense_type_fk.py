@@ -0,0 +1,129 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:12
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def expense_type_key(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+def canonicalize_expense_types(apps, schema_editor):
+    """Point every payment out at an ExpenseType row, merging spellings that differ only in case or spacing."""
+    ExpenseType = apps.get_model('ledger', 'ExpenseType')
+    PaymentOut = apps.get_model('ledger', 'PaymentOut')
+    PeriodTotal = apps.get_model('ledger', 'PeriodTotal')
+
+    # Existing types: the first of each spelling wins, unreferenced duplicates go
+    canonical, duplicates = {}, []
+    for expense_type in ExpenseType.objects.order_by('id'):
+        key = expense_type_key(expense_type.name) or 'uncategorised'
+        if key in canonical:
+            duplicates.append(expense_type.id)
+            continue
+        expense_type.key = key
+        canonical[key] = expense_type
+    ExpenseType.objects.filter(id__in=duplicates).delete()
+    ExpenseType.objects.bulk_update(canonical.values(), ['key'])
+
+    # Free-text values: one grouped read; the most used spelling (title case on a tie) names a new type
+    spellings = defaultdict(list)
+    rows = PaymentOut.objects.values('expense_type').annotate(uses=Count('id')).order_by()
+    for row in sorted(rows, key=lambda row: (-row['uses'], not row['expense_type'].istitle(), row['expense_type'])):
+        text = row['expense_type']
+        spellings[expense_type_key(text) or 'uncategorised'].append(text)
+    ExpenseType.objects.bulk_create([
+        ExpenseType(name=' '.join(texts[0].split()) or 'Uncategorised', key=key)
+        for key, texts in spellings.items() if key not in canonical
+    ])
+    canonical = {t.key: t for t in ExpenseType.objects.all()}
+
+    for key, texts in spellings.items():
+        PaymentOut.objects.filter(expense_type__in=texts).update(expense_type_ref=canonical[key])
+
+    # Frozen period totals were keyed by the raw text; re-key them by id, summing merged spellings
+    merged = {}
+    for total in PeriodTotal.objects.filter(dimension='expense_type'):
+        expense_type = canonical[expense_type_key(total.key) or 'uncategorised']
+        entry = merged.get((total.period_id, expense_type.id))
+        if entry is None:
+            merged[total.period_id, expense_type.id] = PeriodTotal(
+                period_id=total.period_id, dimension='expense_type', key=str(expense_type.id),
+                label=expense_type.name, total_in=total.total_in, total_out=total.total_out,
+                closing_balance=Decimal('0'),
+            )
+        else:
+            entry.total_in += total.total_in
+            entry.total_out += total.total_out
+    PeriodTotal.objects.filter(dimension='expense_type').delete()
+    PeriodTotal.objects.bulk_create(merged.values())
+
+
+def restore_expense_text(apps, schema_editor):
+    ExpenseType = apps.get_model('ledger', 'ExpenseType')
+    PaymentOut = apps.get_model('ledger', 'PaymentOut')
+    PeriodTotal = apps.get_model('ledger', 'PeriodTotal')
+
+    names = dict(ExpenseType.objects.values_list('id', 'name'))
+    for expense_type_id, name in names.items():
+        PaymentOut.objects.filter(expense_type_ref_id=expense_type_id).update(expense_type=name)
+    for total in PeriodTotal.objects.filter(dimension='expense_type'):
+        total.key = names.get(int(total.key), total.label)
+        total.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0010_accounting_periods'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='expensetype',
+            options={'ordering': ['name']},
+        ),
+        migrations.AddField(
+            model_name='expensetype',
+            name='key',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentout',
+            name='expense_type_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.expensetype'),
+        ),
+        migrations.RunPython(canonicalize_expense_types, restore_expense_text),
+        migrations.AlterField(
+            model_name='paymentout',
+            name='expense_type',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='paymentout',
+            name='expense_type',
+        ),
+        migrations.RenameField(
+            model_name='paymentout',
+            old_name='expense_type_ref',
+            new_name='expense_type',
+        ),
+        migrations.AlterField(
+            model_name='paymentout',
+            name='expense_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='ledger.expensetype'),
+        ),
+        migrations.AlterField(
+            model_name='expensetype',
+            name='key',
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['expense_type', 'payment_date'], name='ledger_paym_expense_6d157e_idx'),
+        ),
+    ]
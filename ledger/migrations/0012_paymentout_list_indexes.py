@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0011_paymentout_expense_type_fk'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['-payment_date', '-created_at'], name='ledger_paym_payment_3941c3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['payee_supplier', 'payment_date'], name='ledger_paym_payee_s_c7a00d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['account', 'payment_date'], name='ledger_paym_account_45936b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['payment_method', 'payment_date'], name='ledger_paym_payment_fe5f97_idx'),
+        ),
+    ]
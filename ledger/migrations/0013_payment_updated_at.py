@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    for model_name in ('PaymentIn', 'PaymentOut'):
+        apps.get_model('ledger', model_name).objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0012_paymentout_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentin',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='paymentout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
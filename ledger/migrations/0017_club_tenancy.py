@@ -0,0 +1,268 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:10
+
+import django.db.models.deletion
+import ledger.tenancy
+from django.conf import settings
+from django.db import migrations, models
+
+
+TENANT_MODELS = ['Account', 'AccountingPeriod', 'AuditLog', 'ExportJob', 'Member', 'PaymentIn', 'PaymentOut', 'Supplier']
+
+
+def create_default_club(apps, schema_editor):
+    """Everything recorded so far belongs to one club, named after the organisation."""
+    Club = apps.get_model('ledger', 'Club')
+    club = Club.objects.create(name=settings.LEDGER_ORGANISATION_NAME, slug='main')
+    for name in TENANT_MODELS:
+        apps.get_model('ledger', name).objects.update(tenant=club)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0016_email_delivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Club',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='accountingperiod',
+            name='unique_accounting_period',
+        ),
+        migrations.RemoveIndex(
+            model_name='accountingperiod',
+            name='ledger_acco_start_d_0a57b6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentout',
+            name='ledger_paym_expense_6d157e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentout',
+            name='ledger_paym_payment_3941c3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentout',
+            name='ledger_paym_payee_s_c7a00d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentout',
+            name='ledger_paym_account_45936b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentout',
+            name='ledger_paym_payment_fe5f97_idx',
+        ),
+        migrations.AlterField(
+            model_name='member',
+            name='email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.AlterField(
+            model_name='member',
+            name='rid',
+            field=models.CharField(max_length=20, verbose_name='RID'),
+        ),
+        migrations.AlterField(
+            model_name='paymentin',
+            name='receipt_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='paymentout',
+            name='invoice_number',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='paymentout',
+            name='receipt_number',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='supplier_id',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='accountingperiod',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='paymentin',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='paymentout',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.RunPython(create_default_club, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='accountingperiod',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='member',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='paymentin',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='paymentout',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='tenant',
+            field=models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['tenant', 'name'], name='ledger_acco_tenant__1e5008_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountingperiod',
+            index=models.Index(fields=['tenant', 'start_date', 'end_date'], name='ledger_acco_tenant__25cb9b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['tenant', '-timestamp'], name='ledger_audi_tenant__3927d6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(fields=['tenant', '-created_at'], name='ledger_expo_tenant__7b1860_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['tenant', 'name'], name='ledger_memb_tenant__f86c74_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentin',
+            index=models.Index(fields=['tenant', '-payment_date', '-created_at'], name='ledger_paym_tenant__a016c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentin',
+            index=models.Index(fields=['tenant', 'account', 'payment_date'], name='ledger_paym_tenant__dbd0a8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentin',
+            index=models.Index(fields=['tenant', 'revenue_type', 'payment_date'], name='ledger_paym_tenant__037213_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentin',
+            index=models.Index(fields=['tenant', 'payer_member', 'payment_date'], name='ledger_paym_tenant__eccdcc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['tenant', '-payment_date', '-created_at'], name='ledger_paym_tenant__ffdaab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['tenant', 'expense_type', 'payment_date'], name='ledger_paym_tenant__14d651_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['tenant', 'payee_supplier', 'payment_date'], name='ledger_paym_tenant__5ea3c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['tenant', 'account', 'payment_date'], name='ledger_paym_tenant__4e1590_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentout',
+            index=models.Index(fields=['tenant', 'payment_method', 'payment_date'], name='ledger_paym_tenant__aceafd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['tenant', 'name'], name='ledger_supp_tenant__5cc4b9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountingperiod',
+            constraint=models.UniqueConstraint(fields=('tenant', 'period_type', 'start_date'), name='unique_accounting_period'),
+        ),
+        migrations.AddConstraint(
+            model_name='member',
+            constraint=models.UniqueConstraint(fields=('tenant', 'rid'), name='unique_member_rid'),
+        ),
+        migrations.AddConstraint(
+            model_name='member',
+            constraint=models.UniqueConstraint(fields=('tenant', 'email'), name='unique_member_email'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentin',
+            constraint=models.UniqueConstraint(fields=('tenant', 'receipt_number'), name='unique_payment_in_receipt'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentout',
+            constraint=models.UniqueConstraint(fields=('tenant', 'receipt_number'), name='unique_payment_out_receipt'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentout',
+            constraint=models.UniqueConstraint(fields=('tenant', 'invoice_number'), name='unique_payment_out_invoice'),
+        ),
+        migrations.AddConstraint(
+            model_name='supplier',
+            constraint=models.UniqueConstraint(fields=('tenant', 'supplier_id'), name='unique_supplier_id'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:00
+
+import django.db.models.deletion
+import ledger.tenancy
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0017_club_tenancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('prefix', models.CharField(editable=False, max_length=8)),
+                ('key_digest', models.CharField(editable=False, max_length=64, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+                ('tenant', models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club')),
+                ('user', models.ForeignKey(help_text='Payments posted with this token are recorded as created by this user.', on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('request_digest', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('response', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to='ledger.apitoken')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='ledger_idem_created_2ff487_idx')],
+                'constraints': [models.UniqueConstraint(fields=('token', 'key'), name='unique_idempotency_key')],
+            },
+        ),
+    ]
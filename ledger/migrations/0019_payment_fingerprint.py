@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:40
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fingerprint(payer_name, amount, payment_date, account_id):
+    # Frozen copy of ledger.models.payment_fingerprint as it was when the column was added
+    payer = ' '.join(''.join(c if c.isalnum() else ' ' for c in (payer_name or '').casefold()).split())
+    text = f"{payer}|{Decimal(amount).quantize(Decimal('0.01'))}|{payment_date.isoformat()}|{account_id}"
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    PaymentIn = apps.get_model('ledger', 'PaymentIn')
+    batch = []
+    for payment in PaymentIn.objects.only('payer_name', 'amount', 'payment_date', 'account_id').iterator(chunk_size=2000):
+        payment.fingerprint = fingerprint(payment.payer_name, payment.amount, payment.payment_date, payment.account_id)
+        batch.append(payment)
+        if len(batch) == 2000:
+            PaymentIn.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    PaymentIn.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0018_api_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentin',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='paymentin',
+            index=models.Index(fields=['tenant', 'fingerprint'], name='ledger_paym_tenant__626dcf_idx'),
+        ),
+    ]
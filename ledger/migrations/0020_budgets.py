@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:20
+
+import django.core.validators
+import django.db.models.deletion
+import ledger.tenancy
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_category_totals(apps, schema_editor):
+    CategoryTotal = apps.get_model('ledger', 'CategoryTotal')
+    totals = {}
+    for model, kind in (('PaymentIn', 'revenue_type'), ('PaymentOut', 'expense_type')):
+        rows = (
+            apps.get_model('ledger', model).objects
+            .values_list('tenant_id', f'{kind}_id', 'payment_date')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        for tenant_id, category_id, day, total in rows.iterator(chunk_size=2000):
+            key = (tenant_id, kind, category_id, day.replace(day=1))
+            totals[key] = totals.get(key, Decimal('0')) + total
+    CategoryTotal.objects.bulk_create(
+        [
+            CategoryTotal(tenant_id=tenant_id, kind=kind, category_id=category_id, month=month, total=total)
+            for (tenant_id, kind, category_id, month), total in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0019_payment_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Budget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_type', models.CharField(choices=[('month', 'Month'), ('year', 'Year')], default='year', max_length=5)),
+                ('start_date', models.DateField(help_text='Any day in the month or year; stored as its first day')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+                ('notes', models.CharField(blank=True, max_length=255)),
+                ('expense_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ledger.expensetype')),
+                ('revenue_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ledger.revenuetype')),
+                ('tenant', models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club')),
+            ],
+            options={
+                'ordering': ['-start_date', 'period_type'],
+                'indexes': [models.Index(fields=['tenant', 'start_date'], name='ledger_budg_tenant__f39107_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('expense_type__isnull', False), ('revenue_type__isnull', True)), models.Q(('expense_type__isnull', True), ('revenue_type__isnull', False)), _connector='OR'), name='budget_has_one_category'), models.UniqueConstraint(condition=models.Q(('revenue_type__isnull', False)), fields=('tenant', 'period_type', 'start_date', 'revenue_type'), name='unique_revenue_budget'), models.UniqueConstraint(condition=models.Q(('expense_type__isnull', False)), fields=('tenant', 'period_type', 'start_date', 'expense_type'), name='unique_expense_budget')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('revenue_type', 'Revenue Type'), ('expense_type', 'Expense Type')], max_length=12)),
+                ('category_id', models.BigIntegerField()),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('tenant', models.ForeignKey(db_index=False, default=ledger.tenancy.current_club_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='ledger.club', verbose_name='club')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'month', 'kind', 'category_id'), name='unique_category_total')],
+            },
+        ),
+        migrations.RunPython(fill_category_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+def drop_category_rows(apps, schema_editor):
+    PeriodTotal = apps.get_model('ledger', 'PeriodTotal')
+    PeriodTotal.objects.exclude(dimension='account').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0020_budgets'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_category_rows, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='periodtotal',
+            name='dimension',
+            field=models.CharField(choices=[('account', 'Account')], max_length=20),
+        ),
+    ]
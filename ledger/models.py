@@ -1,21 +1,169 @@
 # ledger/models.py
+from collections import defaultdict
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+import hashlib
+import secrets
+import sys
+
+from . import caching, metrics
+from .cron import Cron
+from .tenancy import ClubManager, TenantManager, TenantQuerySet, current_club_id
 
 User = get_user_model()
 
+def expense_type_key(name):
+    """Canonical spelling used to match expense types: trimmed, single-spaced, case-folded."""
+    return ' '.join(str(name).split()).casefold()
+
+
+class ExpenseTypeManager(models.Manager):
+    """Resolves typed expense type names to rows through a per-process cache.
+
+    The cache holds one shared instance per type, keyed by the interned
+    canonical spelling, so repeated form posts don't query for the type.
+    It is tagged with the shared 'expense_types' cache version, which every
+    save or delete bumps, so a change made in one worker process reloads the
+    cache in all of them.
+    """
+    _by_key = {}
+    _by_id = {}
+    _version = None
+
+    def clear_cache(self):
+        ExpenseTypeManager._by_key = {}
+        ExpenseTypeManager._by_id = {}
+        ExpenseTypeManager._version = None
+
+    def _check(self):
+        if caching.get_version('expense_types') != self._version:
+            self.clear_cache()
+
+    def _load(self):
+        # Read the version first, so a change made during the query forces another load
+        version = caching.get_version('expense_types')
+        types = list(self.get_queryset().order_by('name'))
+        ExpenseTypeManager._by_key = {sys.intern(t.key): t for t in types}
+        ExpenseTypeManager._by_id = {t.id: t for t in types}
+        ExpenseTypeManager._version = version
+
+    def cached(self):
+        """All expense types, ordered by name."""
+        self._check()
+        hit = bool(self._by_id)
+        metrics.record_cache_lookup('expense_type', hit)
+        if not hit:
+            self._load()
+        return list(self._by_id.values())
+
+    def get_cached(self, pk):
+        self._check()
+        if pk not in self._by_id:
+            self._load()
+        return self._by_id.get(pk)
+
+    def resolve(self, name):
+        """The expense type for `name`, or a new unsaved one the first time a spelling is seen; see persist()."""
+        self._check()
+        key = expense_type_key(name)
+        expense_type = self._by_key.get(key)
+        metrics.record_cache_lookup('expense_type', expense_type is not None)
+        if expense_type is None:
+            self._load()
+            expense_type = self._by_key.get(key)
+        if expense_type is None:
+            expense_type = self.model(name=' '.join(str(name).split()), key=key)
+        return expense_type
+
+    def persist(self, expense_type):
+        """The saved row for a type from resolve(), creating it if resolve() found none.
+
+        Call it where the payment is saved, so a form or batch that fails
+        validation leaves no new type behind.
+        """
+        if expense_type.pk is not None:
+            return expense_type
+        return self.get_or_create(key=expense_type.key, defaults={'name': expense_type.name})[0]
+
+
 class ExpenseType(models.Model):
     name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True, editable=False)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
-    
+
+    objects = ExpenseTypeManager()
+
+    class Meta:
+        ordering = ['name']
+
+    def save(self, *args, **kwargs):
+        self.key = expense_type_key(self.name)
+        super().save(*args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude)
+        # key is not a form field, so Django would leave its clash to the database
+        if exclude and 'name' in exclude:
+            return
+        key = expense_type_key(self.name)
+        clash = ExpenseType.objects.filter(key=key).exclude(pk=self.pk).first()
+        if clash:
+            raise ValidationError({'name': f'"{clash.name}" already exists; names differing only in case or spacing are the same type.'})
+
+    def __str__(self):
+        return self.name
+
+class Club(models.Model):
+    """A club keeping its books in this ledger; see ledger.tenancy."""
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=50, unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ClubManager()
+
     def __str__(self):
         return self.name
 
-class Member(models.Model):
+    class Meta:
+        ordering = ['name']
+
+
+class TenantModel(models.Model):
+    """A row owned by one club. New rows go to the active club, or the default club outside a request."""
+    # Not indexed on its own: every index on a tenant table leads with it
+    tenant = models.ForeignKey(
+        Club, on_delete=models.PROTECT, default=current_club_id, editable=False, db_index=False,
+        related_name='+', verbose_name='club',
+    )
+
+    objects = TenantManager()
+    all_clubs = models.Manager()
+
+    class Meta:
+        abstract = True
+
+    def assign_tenant(self):
+        if self.tenant_id is None:
+            self.tenant_id = current_club_id() or Club.objects.default_id()
+
+    def save(self, *args, **kwargs):
+        self.assign_tenant()
+        super().save(*args, **kwargs)
+
+    def validate_constraints(self, exclude=None):
+        self.assign_tenant()
+        return super().validate_constraints(exclude and set(exclude) - {'tenant'})
+
+
+class Member(TenantModel):
     CLUB_CHOICES = [
         ('rotaract', 'Rotaract Club'),
         ('rotary', 'Rotary Club'),
@@ -23,9 +171,9 @@ class Member(models.Model):
     ]
     
     name = models.CharField(max_length=200)
-    rid = models.CharField(max_length=20, unique=True, verbose_name="RID")
+    rid = models.CharField(max_length=20, verbose_name="RID")
     contact = models.CharField(max_length=15)
-    email = models.EmailField(unique=True)
+    email = models.EmailField()
     residence = models.CharField(max_length=200)
     club = models.CharField(max_length=50, choices=CLUB_CHOICES, default='rotaract')
     other_club_name = models.CharField(max_length=200, blank=True, null=True)
@@ -40,14 +188,21 @@ class Member(models.Model):
     
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'rid'], name='unique_member_rid'),
+            models.UniqueConstraint(fields=['tenant', 'email'], name='unique_member_email'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'name']),
+        ]
 
-class Supplier(models.Model):
+class Supplier(TenantModel):
     name = models.CharField(max_length=200)
     contact = models.CharField(max_length=15)
     email = models.EmailField(blank=True)
     address = models.TextField(blank=True)
     bank_details = models.TextField(blank=True)
-    supplier_id = models.CharField(max_length=50, unique=True)
+    supplier_id = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
@@ -56,6 +211,12 @@ class Supplier(models.Model):
     
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'supplier_id'], name='unique_supplier_id'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'name']),
+        ]
 
 class RevenueType(models.Model):
     name = models.CharField(max_length=100)
@@ -66,7 +227,7 @@ class RevenueType(models.Model):
     def __str__(self):
         return self.name
 
-class Account(models.Model):
+class Account(TenantModel):
     ACCOUNT_TYPES = [
         ('cash', 'Cash'),
         ('bank', 'Bank Account'),
@@ -77,12 +238,244 @@ class Account(models.Model):
     account_type = models.CharField(max_length=10, choices=ACCOUNT_TYPES)
     account_number = models.CharField(max_length=50, blank=True)
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    opening_balance = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0.00,
+        help_text="Balance before the first recorded payment; reconciliation adds postings to this."
+    )
     bank_name = models.CharField(max_length=100, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     
     def __str__(self):
         return f"{self.name} ({self.get_account_type_display()})"
 
+    @classmethod
+    def adjust_balance(cls, account_id, amount):
+        """Apply a posting in SQL so concurrent saves can't overwrite each other's balance."""
+        cls.all_clubs.filter(pk=account_id).update(balance=F('balance') + amount)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'name']),
+        ]
+
+
+class ReconciliationCheckpoint(models.Model):
+    """Per-account payment totals up to the high-water mark of the last reconciliation run."""
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, related_name='reconciliation_checkpoint')
+    total_in = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_out = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Checkpoint for {self.account}"
+
+
+class ReconciliationRun(models.Model):
+    MODE_CHOICES = [
+        ('full', 'Full'),
+        ('incremental', 'Incremental'),
+    ]
+
+    mode = models.CharField(max_length=12, choices=MODE_CHOICES)
+    last_payment_in_id = models.BigIntegerField(default=0)
+    last_payment_out_id = models.BigIntegerField(default=0)
+    accounts_checked = models.PositiveIntegerField(default=0)
+    drifted_accounts = models.PositiveIntegerField(default=0)
+    total_drift = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    repaired = models.BooleanField(default=False)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_mode_display()} reconciliation at {self.started_at}"
+
+    class Meta:
+        ordering = ['-started_at']
+
+class AccountingPeriod(TenantModel):
+    """A closed month or year. Payments dated inside it can no longer be changed."""
+    PERIOD_TYPES = [
+        ('month', 'Month'),
+        ('year', 'Year'),
+    ]
+
+    period_type = models.CharField(max_length=5, choices=PERIOD_TYPES)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    closed_at = models.DateTimeField(auto_now_add=True)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        if self.period_type == 'year':
+            return f"Year {self.start_date:%Y}"
+        return f"{self.start_date:%B %Y}"
+
+    @classmethod
+    def closed_periods(cls, dates, tenant_id=None):
+        """{date: period} for each of `dates` that falls in a closed period of the club, in one query."""
+        dates = {d for d in dates if d}
+        if not dates:
+            return {}
+        periods = cls.all_clubs.filter(tenant_id=tenant_id) if tenant_id else cls.objects.all()
+        periods = list(periods.filter(start_date__lte=max(dates), end_date__gte=min(dates)))
+        return {
+            date: period for date in sorted(dates) for period in periods
+            if period.start_date <= date <= period.end_date
+        }
+
+    @staticmethod
+    def closed_message(period, date):
+        return f"{period} is closed; payments dated {date:%d %b %Y} cannot be added, changed or deleted."
+
+    @classmethod
+    def ensure_open(cls, *dates, tenant_id=None):
+        """Raise ValidationError if any of the given payment dates falls in a closed period of the club."""
+        for date, period in cls.closed_periods(dates, tenant_id).items():
+            raise ValidationError({'payment_date': cls.closed_message(period, date)})
+
+    class Meta:
+        ordering = ['-start_date', 'period_type']
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'period_type', 'start_date'], name='unique_accounting_period'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'start_date', 'end_date']),
+        ]
+
+
+class PeriodTotal(models.Model):
+    """Account totals and closing balances frozen when a period is closed, so balances never rescan its payments.
+
+    Reports by category read CategoryTotal instead, which covers open periods too.
+    """
+    DIMENSIONS = [
+        ('account', 'Account'),
+    ]
+
+    period = models.ForeignKey(AccountingPeriod, on_delete=models.CASCADE, related_name='totals')
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    key = models.CharField(max_length=255)
+    label = models.CharField(max_length=255)
+    total_in = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_out = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    closing_balance = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.period} {self.get_dimension_display()}: {self.label}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dimension', 'period']),
+        ]
+
+
+class CategoryTotal(TenantModel):
+    """A month's running total for one revenue or expense type, adjusted on every payment write.
+
+    Budget reports sum these rows (a dozen per category per year) instead of
+    aggregating the payment tables.
+    """
+    KINDS = [
+        ('revenue_type', 'Revenue Type'),
+        ('expense_type', 'Expense Type'),
+    ]
+
+    kind = models.CharField(max_length=12, choices=KINDS)
+    category_id = models.BigIntegerField()
+    month = models.DateField(help_text="First day of the month")
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.category_id} {self.month:%b %Y}: {self.total}"
+
+    @classmethod
+    def adjust(cls, tenant_id, kind, category_id, day, amount):
+        """Add `amount` to the month of `day` in SQL, creating the row on the month's first posting."""
+        month = day.replace(day=1)
+        row = cls.all_clubs.filter(tenant_id=tenant_id, kind=kind, category_id=category_id, month=month)
+        if row.update(total=F('total') + amount):
+            return
+        try:
+            with transaction.atomic():
+                cls.all_clubs.create(tenant_id=tenant_id, kind=kind, category_id=category_id, month=month,
+                                     total=amount)
+        except IntegrityError:
+            # Another writer created the row first
+            row.update(total=F('total') + amount)
+
+    @classmethod
+    def adjust_for(cls, kind, payments, sign=1):
+        """Apply a batch of payments with one adjustment per category and month."""
+        totals = defaultdict(Decimal)
+        for payment in payments:
+            totals[payment.tenant_id, getattr(payment, f'{kind}_id'), payment.payment_date.replace(day=1)] += payment.amount
+        for (tenant_id, category_id, month), total in totals.items():
+            cls.adjust(tenant_id, kind, category_id, month, sign * total)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'month', 'kind', 'category_id'], name='unique_category_total'),
+        ]
+
+
+class Budget(TenantModel):
+    """What a club plans to receive for a revenue type, or spend on an expense type, in a month or year."""
+    period_type = models.CharField(max_length=5, choices=AccountingPeriod.PERIOD_TYPES, default='year')
+    start_date = models.DateField(help_text="Any day in the month or year; stored as its first day")
+    revenue_type = models.ForeignKey('RevenueType', on_delete=models.CASCADE, null=True, blank=True)
+    expense_type = models.ForeignKey('ExpenseType', on_delete=models.CASCADE, null=True, blank=True)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0'))])
+    notes = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        period = AccountingPeriod(period_type=self.period_type, start_date=self.start_date)
+        return f"{self.category} budget for {period}"
+
+    @property
+    def kind(self):
+        return 'revenue_type' if self.revenue_type_id else 'expense_type'
+
+    @property
+    def category(self):
+        return self.revenue_type or self.expense_type
+
+    def normalize_start(self):
+        if self.start_date:
+            self.start_date = self.start_date.replace(day=1)
+            if self.period_type == 'year':
+                self.start_date = self.start_date.replace(month=1)
+
+    def clean(self):
+        super().clean()
+        if bool(self.revenue_type_id) == bool(self.expense_type_id):
+            raise ValidationError("Choose either a revenue type or an expense type.")
+        self.normalize_start()
+
+    def save(self, *args, **kwargs):
+        self.normalize_start()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['-start_date', 'period_type']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(revenue_type__isnull=True, expense_type__isnull=False)
+                | models.Q(revenue_type__isnull=False, expense_type__isnull=True),
+                name='budget_has_one_category',
+            ),
+            models.UniqueConstraint(
+                fields=['tenant', 'period_type', 'start_date', 'revenue_type'],
+                condition=models.Q(revenue_type__isnull=False), name='unique_revenue_budget',
+            ),
+            models.UniqueConstraint(
+                fields=['tenant', 'period_type', 'start_date', 'expense_type'],
+                condition=models.Q(expense_type__isnull=False), name='unique_expense_budget',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'start_date']),
+        ]
+
+
 from decimal import Decimal
 from django.db import models, transaction
 from django.core.validators import MinValueValidator
@@ -90,7 +483,32 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class PaymentIn(models.Model):
+
+def normalize_payer(name):
+    """Payer name as compared for duplicates: case, punctuation and spacing ignored."""
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in (name or '').casefold()).split())
+
+
+def payment_fingerprint(payer_name, amount, payment_date, account_id):
+    """Digest of what makes two receipts the same payment entered twice."""
+    amount = Decimal(amount).quantize(Decimal('0.01'))
+    text = f"{normalize_payer(payer_name)}|{amount}|{payment_date.isoformat()}|{account_id}"
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class PaymentInQuerySet(TenantQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_fingerprint()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def duplicates_of(self, fingerprint, exclude_pk=None):
+        """Receipts already posted with this fingerprint: one lookup on the (tenant, fingerprint) index."""
+        return self.filter(fingerprint=fingerprint).exclude(pk=exclude_pk).order_by('id')
+
+
+class PaymentIn(TenantModel):
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
         ('bank', 'Bank Transfer'),
@@ -111,83 +529,102 @@ class PaymentIn(models.Model):
     payment_date = models.DateField()
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS)
     account = models.ForeignKey('Account', on_delete=models.PROTECT)
-    receipt_number = models.CharField(max_length=20, unique=True, blank=True)
+    receipt_number = models.CharField(max_length=20, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save; receipts use it as their cache version and Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    
-def save(self, *args, **kwargs):
-    is_new = self._state.adding
-    old = None
+    # payment_fingerprint() of payer, amount, date and account, kept in step by save() and bulk_create()
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
+
+    objects = TenantManager.from_queryset(PaymentInQuerySet)()
+
+    def set_fingerprint(self):
+        self.fingerprint = payment_fingerprint(self.payer_name, self.amount, self.payment_date, self.account_id)
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        old = None
+        self.assign_tenant()
+        self.set_fingerprint()
+
+        if not is_new:
+            old = (
+                PaymentIn.all_clubs.filter(pk=self.pk)
+                .values('account_id', 'amount', 'payment_date', 'revenue_type_id').first()
+            )
+        AccountingPeriod.ensure_open(self.payment_date, old and old['payment_date'], tenant_id=self.tenant_id)
+
+        # Generate a unique receipt number safely; each club numbers its own receipts
+        if not self.receipt_number:
+            club_receipts = PaymentIn.all_clubs.filter(tenant_id=self.tenant_id)
+            with metrics.timer('ledger_receipt_allocation_seconds', kind='in'):
+                base_prefix = f"RC-{self.payment_date.strftime('%Y%m')}-"
+                last = (
+                    club_receipts
+                    .filter(receipt_number__startswith=base_prefix)
+                    .order_by('-id')
+                    .first()
+                )
 
-    if not is_new:
-        try:
-            old = PaymentIn.objects.get(pk=self.pk)
-        except PaymentIn.DoesNotExist:
-            old = None
-
-    # Generate a unique receipt number safely
-    if not self.receipt_number:
-        base_prefix = f"RC-{self.payment_date.strftime('%Y%m')}-"
-        last = (
-            PaymentIn.objects
-            .filter(receipt_number__startswith=base_prefix)
-            .order_by('-id')
-            .first()
-        )
-
-        last_number = 0
-        if last and last.receipt_number:
-            try:
-                last_number = int(last.receipt_number.split('-')[-1])
-            except (IndexError, ValueError):
                 last_number = 0
+                if last and last.receipt_number:
+                    try:
+                        last_number = int(last.receipt_number.split('-')[-1])
+                    except (IndexError, ValueError):
+                        last_number = 0
 
-        new_number = last_number + 1
+                new_number = last_number + 1
 
-        # Ensure absolute uniqueness (important for SQLite)
-        while PaymentIn.objects.filter(receipt_number=f"{base_prefix}{new_number:04d}").exists():
-            new_number += 1
+                # Ensure absolute uniqueness (important for SQLite)
+                while club_receipts.filter(receipt_number=f"{base_prefix}{new_number:04d}").exists():
+                    new_number += 1
 
-        self.receipt_number = f"{base_prefix}{new_number:04d}"
+                self.receipt_number = f"{base_prefix}{new_number:04d}"
+
+        # --- Balance handling ---
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if old:
+                # Update case — reverse the old posting first
+                Account.adjust_balance(old['account_id'], -old['amount'])
+                CategoryTotal.adjust(self.tenant_id, 'revenue_type', old['revenue_type_id'], old['payment_date'], -old['amount'])
+            Account.adjust_balance(self.account_id, self.amount)
+            CategoryTotal.adjust(self.tenant_id, 'revenue_type', self.revenue_type_id, self.payment_date, self.amount)
+
+    def clean(self):
+        super().clean()
+        original = None
+        if self.pk:
+            original = PaymentIn.all_clubs.filter(pk=self.pk).values_list('payment_date', flat=True).first()
+        AccountingPeriod.ensure_open(self.payment_date, original, tenant_id=self.tenant_id)
+
+    def delete(self, *args, **kwargs):
+        AccountingPeriod.ensure_open(self.payment_date, tenant_id=self.tenant_id)
+        with transaction.atomic():
+            Account.adjust_balance(self.account_id, -self.amount)
+            CategoryTotal.adjust(self.tenant_id, 'revenue_type', self.revenue_type_id, self.payment_date, -self.amount)
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"Receipt {self.receipt_number} - {self.payer_name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'receipt_number'], name='unique_payment_in_receipt'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', '-payment_date', '-created_at']),
+            models.Index(fields=['tenant', 'account', 'payment_date']),
+            models.Index(fields=['tenant', 'revenue_type', 'payment_date']),
+            models.Index(fields=['tenant', 'payer_member', 'payment_date']),
+            models.Index(fields=['tenant', 'fingerprint']),
+        ]
 
-    # --- Balance handling ---
-    with transaction.atomic():
-        super().save(*args, **kwargs)
 
-        if is_new:
-            # New payment — increase balance
-            self.account.balance += self.amount
-            self.account.save()
-        elif old:
-            # Update case
-            if old.account_id != self.account_id:
-                # Account changed
-                old.account.balance -= old.amount
-                old.account.save()
-                self.account.balance += self.amount
-                self.account.save()
-            else:
-                # Same account, maybe amount changed
-                diff = self.amount - old.amount
-                if diff != 0:
-                    self.account.balance += diff
-                    self.account.save()
-
-
-def delete(self, *args, **kwargs):
-    with transaction.atomic():
-        acct = self.account
-        acct.balance -= self.amount
-        acct.save()
-        return super().delete(*args, **kwargs)
-
-
-def __str__(self):
-    return f"Receipt {self.receipt_number} - {self.payer_name}"
-
-
-class PaymentOut(models.Model):
+class PaymentOut(TenantModel):
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
         ('bank', 'Bank Transfer'),
@@ -200,8 +637,8 @@ class PaymentOut(models.Model):
     reason = models.TextField()
     
     # New fields
-    expense_type = models.CharField(max_length=255)
-    invoice_number = models.CharField(max_length=50, blank=True, null=True, unique=True)
+    expense_type = models.ForeignKey('ExpenseType', on_delete=models.PROTECT, related_name='payments')
+    invoice_number = models.CharField(max_length=50, blank=True, null=True)
     
     amount = models.DecimalField(
         max_digits=10,
@@ -211,25 +648,71 @@ class PaymentOut(models.Model):
     payment_date = models.DateField()
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS)
     account = models.ForeignKey('Account', on_delete=models.PROTECT)
-    receipt_number = models.CharField(max_length=20, unique=True)
+    receipt_number = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        old = None
+        self.assign_tenant()
+
+        if not is_new:
+            old = (
+                PaymentOut.all_clubs.filter(pk=self.pk)
+                .values('account_id', 'amount', 'payment_date', 'expense_type_id').first()
+            )
+        AccountingPeriod.ensure_open(self.payment_date, old and old['payment_date'], tenant_id=self.tenant_id)
+
         if not self.receipt_number:
-            last_payment = PaymentOut.objects.order_by('-id').first()
-            last_number = int(last_payment.receipt_number.split('-')[-1]) if last_payment else 0
-            self.receipt_number = f"PY-{self.payment_date.strftime('%Y%m')}-{last_number + 1:04d}"
+            with metrics.timer('ledger_receipt_allocation_seconds', kind='out'):
+                last_payment = PaymentOut.all_clubs.filter(tenant_id=self.tenant_id).order_by('-id').first()
+                last_number = int(last_payment.receipt_number.split('-')[-1]) if last_payment else 0
+                self.receipt_number = f"PY-{self.payment_date.strftime('%Y%m')}-{last_number + 1:04d}"
         
-        super().save(*args, **kwargs)
-        self.account.balance -= self.amount
-        self.account.save()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if old:
+                # Update case — reverse the old posting first
+                Account.adjust_balance(old['account_id'], old['amount'])
+                CategoryTotal.adjust(self.tenant_id, 'expense_type', old['expense_type_id'], old['payment_date'], -old['amount'])
+            Account.adjust_balance(self.account_id, -self.amount)
+            CategoryTotal.adjust(self.tenant_id, 'expense_type', self.expense_type_id, self.payment_date, self.amount)
+
+    def clean(self):
+        super().clean()
+        original = None
+        if self.pk:
+            original = PaymentOut.all_clubs.filter(pk=self.pk).values_list('payment_date', flat=True).first()
+        AccountingPeriod.ensure_open(self.payment_date, original, tenant_id=self.tenant_id)
+
+    def delete(self, *args, **kwargs):
+        AccountingPeriod.ensure_open(self.payment_date, tenant_id=self.tenant_id)
+        with transaction.atomic():
+            Account.adjust_balance(self.account_id, self.amount)
+            CategoryTotal.adjust(self.tenant_id, 'expense_type', self.expense_type_id, self.payment_date, -self.amount)
+            return super().delete(*args, **kwargs)
     
     def __str__(self):
         return f"Payment {self.receipt_number} - {self.payee_name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'receipt_number'], name='unique_payment_out_receipt'),
+            models.UniqueConstraint(fields=['tenant', 'invoice_number'], name='unique_payment_out_invoice'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', '-payment_date', '-created_at']),
+            models.Index(fields=['tenant', 'expense_type', 'payment_date']),
+            models.Index(fields=['tenant', 'payee_supplier', 'payment_date']),
+            models.Index(fields=['tenant', 'account', 'payment_date']),
+            models.Index(fields=['tenant', 'payment_method', 'payment_date']),
+        ]
     
 
-class AuditLog(models.Model):
+class AuditLog(TenantModel):
     ACTION_CHOICES = [
         ('create', 'Create'),
         ('update', 'Update'),
@@ -248,8 +731,227 @@ class AuditLog(models.Model):
     
     def __str__(self):
         return f"{self.user} {self.action} {self.object_type} at {self.timestamp}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', '-timestamp']),
+        ]
     
 
+class ApiToken(TenantModel):
+    """A key another system posts payments with (see ledger.api). Only its SHA-256 digest is stored."""
+    name = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens',
+                             help_text='Payments posted with this token are recorded as created by this user.')
+    prefix = models.CharField(max_length=8, editable=False)
+    key_digest = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…)"
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, name, user, tenant=None):
+        """Create a token and return it with its key, which is not stored and can't be shown again."""
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(name=name, user=user, tenant=tenant, prefix=key[:8], key_digest=cls.digest(key))
+        return token, key
+
+    class Meta:
+        ordering = ['name']
+
+
+class IdempotencyKey(models.Model):
+    """The stored response to an API request, replayed when the client retries with the same key."""
+    token = models.ForeignKey(ApiToken, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    request_digest = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+
+class RequestProfile(models.Model):
+    """A request run under cProfile/tracemalloc; the reports live in LEDGER_PROFILE_DIR."""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    url_name = models.CharField(max_length=100, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    duration_ms = models.DecimalField(max_digits=10, decimal_places=1)
+    peak_memory_kb = models.PositiveIntegerField(default=0)
+    profile_file = models.CharField(max_length=200)
+    allocations_file = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms} ms)"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ExportJob(TenantModel):
+    """A club's full-ledger archive built in the background; the archive lives in LEDGER_EXPORT_DIR."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    current_table = models.CharField(max_length=50, blank=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=200, blank=True)
+    file_size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Ledger export #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_written * 100 // self.rows_total)
+
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', '-created_at']),
+        ]
+
+
+class Job(models.Model):
+    """A unit of background work picked up by `manage.py run_worker`; see ledger.jobs."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after']),
+        ]
+
+
+class EmailDelivery(models.Model):
+    """One outgoing receipt or statement email; sent in batches by ledger.mail."""
+    KIND_CHOICES = [
+        ('receipt', 'Receipt'),
+        ('statement', 'Statement'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    recipient = models.EmailField()
+    payment = models.ForeignKey('PaymentIn', on_delete=models.CASCADE, null=True, blank=True, related_name='emails')
+    member = models.ForeignKey('Member', on_delete=models.CASCADE, null=True, blank=True, related_name='emails')
+    period_start = models.DateField(null=True, blank=True)
+    period_end = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    batch = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.recipient} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'email deliveries'
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['batch']),
+        ]
+
+
+class Schedule(models.Model):
+    """Enqueues a task whenever its cron expression comes due."""
+    name = models.CharField(max_length=100, unique=True)
+    cron = models.CharField(max_length=100, help_text='minute hour day month weekday, e.g. "30 2 * * *"')
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0)
+    enabled = models.BooleanField(default=True)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.cron})"
+
+    def clean(self):
+        try:
+            Cron(self.cron)
+        except ValidationError as exc:
+            raise ValidationError({'cron': exc.messages})
+        if self.task == 'call_command' and (self.kwargs or {}).get('command') not in settings.LEDGER_JOB_COMMANDS:
+            raise ValidationError({'kwargs': f"The command must be one of {', '.join(settings.LEDGER_JOB_COMMANDS)}."})
+
+    def save(self, *args, **kwargs):
+        if self.next_run_at is None:
+            self.next_run_at = Cron(self.cron).next_after(timezone.now())
+        super().save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['name']
+
+
 # class PaymentIn(models.Model):
 #     recorded_by = models.ForeignKey(
 #         settings.AUTH_USER_MODEL,
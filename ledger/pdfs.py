@@ -0,0 +1,105 @@
+# ledger/pdfs.py
+"""PDF receipts and member statements, drawn with reportlab.
+
+reportlab is imported inside the functions: it is only needed by the
+worker that sends email, not by every web request.
+"""
+import io
+from decimal import Decimal
+
+from django.conf import settings
+
+
+def money(amount):
+    return f"UGX {amount:,.2f}"
+
+
+def build(story, title):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate
+
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=A4, title=title, author=settings.LEDGER_ORGANISATION_NAME,
+        leftMargin=20 * mm, rightMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm,
+    )
+    document.build(story)
+    return buffer.getvalue()
+
+
+def heading(title, subtitle):
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles = getSampleStyleSheet()
+    return [
+        Paragraph(settings.LEDGER_ORGANISATION_NAME, styles['Title']),
+        Paragraph(title, styles['Heading2']),
+        Paragraph(subtitle, styles['Normal']),
+        Spacer(1, 12),
+    ]
+
+
+def table(rows, widths, header=False, total=False):
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    commands = [
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+    ]
+    if header:
+        commands += [('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke)]
+    else:
+        commands.append(('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'))
+    if total:
+        commands += [('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'), ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black)]
+    result = Table(rows, colWidths=widths, hAlign='LEFT')
+    result.setStyle(TableStyle(commands))
+    return result
+
+
+def footer(text):
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer
+
+    return [Spacer(1, 18), Paragraph(text, getSampleStyleSheet()['Italic'])]
+
+
+def receipt_pdf(payment):
+    from reportlab.lib.units import mm
+
+    rows = [
+        ['Receipt Number', payment.receipt_number],
+        ['Date', f"{payment.payment_date:%d %b %Y}"],
+        ['Received From', payment.payer_name],
+        ['Payment Type', payment.revenue_type.name],
+        ['Payment Method', payment.get_payment_method_display()],
+        ['Amount', money(payment.amount)],
+    ]
+    story = heading('Official Receipt', f"Receipt No. {payment.receipt_number}")
+    story.append(table(rows, [50 * mm, 110 * mm]))
+    story += footer('Thank you for your payment. This is a system-generated receipt.')
+    return build(story, f"Receipt {payment.receipt_number}")
+
+
+def statement_pdf(member, start, end, payments):
+    from reportlab.lib.units import mm
+
+    total = sum((payment.amount for payment in payments), Decimal('0'))
+    rows = [['Date', 'Receipt', 'Payment Type', 'Amount']]
+    rows += [
+        [f"{p.payment_date:%d %b %Y}", p.receipt_number, p.revenue_type.name, money(p.amount)]
+        for p in payments
+    ]
+    rows.append(['', '', 'Total', money(total)])
+    story = heading(
+        f"Statement for {member.name} ({member.rid})",
+        f"Payments from {start:%d %b %Y} to {end:%d %b %Y}",
+    )
+    story.append(table(rows, [30 * mm, 45 * mm, 50 * mm, 35 * mm], header=True, total=True))
+    story += footer('Please contact the treasurer if anything on this statement looks wrong.')
+    return build(story, f"Statement {member.rid} {start:%Y-%m}")
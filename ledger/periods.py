@@ -0,0 +1,127 @@
+# ledger/periods.py
+"""Closing accounting periods and reading balances across closed and open periods.
+
+Closed periods keep each account's totals and closing balance in
+PeriodTotal. Opening balances (the cashbook's, for one) start from the
+latest closed period's closing balances and only aggregate the payments
+dated after it, so their cost no longer grows with the age of the ledger.
+"""
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Account, AccountingPeriod, PaymentIn, PaymentOut, PeriodTotal
+
+# dimension -> {table: (key field, label field)}; a dimension only reads the tables it appears in
+DIMENSION_FIELDS = {
+    'account': {
+        PaymentIn: ('account_id', 'account__name'),
+        PaymentOut: ('account_id', 'account__name'),
+    },
+}
+
+
+def period_bounds(period_type, year, month=None):
+    if period_type == 'year':
+        return date(year, 1, 1), date(year, 12, 31)
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def grouped_sums(model, key_field, label_field, date_filter):
+    """{key: (label, total)} from one grouped query over `model`."""
+    rows = (
+        model.objects.filter(date_filter)
+        .values(key_field, label_field)
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    return {str(row[key_field]): (row[label_field], row['total']) for row in rows}
+
+
+def raw_totals(dimension, date_filter):
+    """{key: [label, total_in, total_out]} aggregated straight from the payment tables."""
+    totals = {}
+    for model, (key_field, label_field) in DIMENSION_FIELDS[dimension].items():
+        column = 1 if model is PaymentIn else 2
+        for key, (label, total) in grouped_sums(model, key_field, label_field, date_filter).items():
+            entry = totals.setdefault(key, [label, Decimal('0'), Decimal('0')])
+            entry[column] += total
+    return totals
+
+
+def balances_as_of(day):
+    """{account_id: closing balance} at the end of `day`.
+
+    Starts from the closing balances of the latest closed period ending on or
+    before `day`, then adds the raw payments dated after it.
+    """
+    balances = {account.id: account.opening_balance for account in Account.objects.all()}
+    date_filter = Q(payment_date__lte=day)
+
+    period = AccountingPeriod.objects.filter(end_date__lte=day).order_by('-end_date', '-period_type').first()
+    if period:
+        for row in period.totals.filter(dimension='account').values('key', 'closing_balance'):
+            balances[int(row['key'])] = row['closing_balance']
+        date_filter &= Q(payment_date__gt=period.end_date)
+
+    for key, (_, total_in, total_out) in raw_totals('account', date_filter).items():
+        balances[int(key)] = balances.get(int(key), Decimal('0')) + total_in - total_out
+    return balances
+
+
+def closed_through(day):
+    """Whether `day` falls in a closed period."""
+    return AccountingPeriod.objects.filter(start_date__lte=day, end_date__gte=day).exists()
+
+
+@transaction.atomic
+def close_period(period_type, year, month=None, user=None):
+    """Freeze each account's totals and closing balance for a month or year and lock its payments.
+
+    Periods close in order and only once they have ended: a closing balance
+    is only final when nothing before it can still change.
+    """
+    start, end = period_bounds(period_type, year, month)
+    name = AccountingPeriod(period_type=period_type, start_date=start)
+    if AccountingPeriod.objects.filter(period_type=period_type, start_date=start).exists():
+        raise ValidationError(f"{name} is already closed.")
+    if end >= timezone.localdate():
+        raise ValidationError(f"{name} has not ended yet; it can be closed from {end + timedelta(days=1):%d %b %Y}.")
+    before = start - timedelta(days=1)
+    earlier_payments = PaymentIn.objects.filter(payment_date__lt=start).exists() or \
+        PaymentOut.objects.filter(payment_date__lt=start).exists()
+    if earlier_payments and not closed_through(before):
+        previous = AccountingPeriod(period_type='month', start_date=before.replace(day=1))
+        raise ValidationError(f"Close {previous} first; periods are closed in order.")
+
+    in_period = Q(payment_date__range=(start, end))
+    closing = balances_as_of(end)
+    period = AccountingPeriod.objects.create(
+        period_type=period_type, start_date=start, end_date=end, closed_by=user
+    )
+
+    rows = []
+    account_totals = raw_totals('account', in_period)
+    for account in Account.objects.all():
+        _, total_in, total_out = account_totals.get(str(account.id), [account.name, 0, 0])
+        rows.append(PeriodTotal(
+            period=period, dimension='account', key=str(account.id), label=account.name,
+            total_in=total_in, total_out=total_out, closing_balance=closing.get(account.id, Decimal('0')),
+        ))
+    PeriodTotal.objects.bulk_create(rows)
+    return period
+
+
+def reopen_period(period_type, year, month=None):
+    """Discard a period's frozen totals. Only the latest closed period can be reopened."""
+    start, end = period_bounds(period_type, year, month)
+    later = AccountingPeriod.objects.filter(end_date__gt=end).order_by('-end_date').first()
+    if later is not None and AccountingPeriod.objects.filter(period_type=period_type, start_date=start).exists():
+        raise ValidationError(f"Reopen {later} first; its closing balances depend on this period.")
+    deleted, _ = AccountingPeriod.objects.filter(period_type=period_type, start_date=start).delete()
+    return bool(deleted)
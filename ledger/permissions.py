@@ -0,0 +1,24 @@
+# ledger/permissions.py
+
+STAFF_ROLES = ['admin', 'treasurer', 'registrar']
+
+
+def is_ledger_staff(user):
+    """Superusers and active users with a staff role (the StaffRequiredMixin rules)"""
+    if not user.is_authenticated:
+        return False
+
+    # Superusers always have access
+    if user.is_superuser:
+        return True
+
+    # Check if user is active
+    if not user.is_active:
+        return False
+
+    # If using CustomUser with role field, check specific roles
+    if hasattr(user, 'role'):
+        return user.role in STAFF_ROLES
+
+    # For regular staff users without role field, allow access
+    return True
@@ -0,0 +1,272 @@
+# ledger/reconciliation.py
+"""Matching bank and mobile-money statements against the ledger.
+
+A statement export (CSV) is read into lines with a signed amount: money in
+matches PaymentIn, money out matches PaymentOut. The account's payments for
+the statement's dates are loaded in one query per direction and indexed
+twice: by receipt/invoice number in a dict, and by (direction, amount) in
+date-sorted lists that are bisected for the date window. Each line is then
+a couple of hash lookups and a binary search, so a year of statement lines
+matches in O(n log n) rather than comparing every line with every payment.
+"""
+import csv
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+
+from .imports import normalize_header
+from .models import PaymentIn, PaymentOut
+
+DATE_COLUMNS = ['date', 'transaction_date', 'value_date', 'posting_date', 'date_time', 'transaction_time']
+AMOUNT_COLUMN = 'amount'
+CREDIT_COLUMNS = ['credit', 'money_in', 'paid_in', 'deposit', 'deposits']
+DEBIT_COLUMNS = ['debit', 'money_out', 'withdrawn', 'withdrawal', 'withdrawals']
+REFERENCE_COLUMNS = ['reference', 'ref', 'transaction_id', 'receipt_no', 'description', 'details',
+                     'narration', 'narrative', 'particulars']
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%d-%b-%Y', '%d %B %Y',
+                '%d/%m/%y', '%d-%b-%y']
+DEFAULT_WINDOW = 3
+
+# Receipt and invoice numbers as they appear inside free-text narration
+REFERENCE_TOKEN = re.compile(r'[A-Z0-9][A-Z0-9/-]*[A-Z0-9]')
+
+
+@dataclass
+class StatementLine:
+    line: int
+    date: date
+    amount: Decimal
+    reference: str
+
+    @property
+    def direction(self):
+        return 'in' if self.amount > 0 else 'out'
+
+    def tokens(self):
+        return set(REFERENCE_TOKEN.findall(self.reference.upper()))
+
+
+@dataclass
+class LedgerEntry:
+    direction: str
+    pk: int
+    date: date
+    amount: Decimal
+    receipt_number: str
+    name: str
+    references: tuple = ()
+
+    @property
+    def label(self):
+        return f"{self.receipt_number} {self.name} ({self.date:%d %b %Y})"
+
+
+@dataclass
+class Reconciliation:
+    matched: list = field(default_factory=list)  # (line, entry, how)
+    unmatched: list = field(default_factory=list)  # lines with no candidate
+    ambiguous: list = field(default_factory=list)  # (line, candidates)
+    missing: list = field(default_factory=list)  # entries in the ledger but not on the statement
+    errors: list = field(default_factory=list)  # (line number, message)
+
+    @property
+    def lines(self):
+        return len(self.matched) + len(self.unmatched) + len(self.ambiguous)
+
+    @property
+    def matched_total(self):
+        return sum((line.amount for line, _, _ in self.matched), Decimal('0'))
+
+    @property
+    def unmatched_total(self):
+        return sum((line.amount for line in self.unmatched), Decimal('0'))
+
+
+def parse_date(text):
+    text = text.strip()
+    for candidate in (text, text.split(' ')[0], text.split('T')[0]):
+        for pattern in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, pattern).date()
+            except ValueError:
+                continue
+    raise ValidationError(f"Date '{text}' is not in a recognised format.")
+
+
+def parse_amount(text):
+    """A statement amount: thousands separators, currency codes and (123) for negatives are accepted."""
+    cleaned = re.sub(r'[^0-9.()\-]', '', text)
+    negative = cleaned.startswith('(') and cleaned.endswith(')')
+    try:
+        amount = Decimal(cleaned.strip('()') or '0')
+    except InvalidOperation:
+        raise ValidationError(f"Amount '{text}' is not a number.")
+    return -amount if negative else amount
+
+
+def first_column(names, fieldnames):
+    return next((name for name in names if name in fieldnames), None)
+
+
+def read_statement(stream):
+    """Read a statement CSV into (lines, errors). Rows that are neither money in nor out are skipped."""
+    reader = csv.DictReader(stream)
+    fieldnames = [normalize_header(name) for name in reader.fieldnames or []]
+    reader.fieldnames = fieldnames
+    date_column = first_column(DATE_COLUMNS, fieldnames)
+    credit_column = first_column(CREDIT_COLUMNS, fieldnames)
+    debit_column = first_column(DEBIT_COLUMNS, fieldnames)
+    has_amount = AMOUNT_COLUMN in fieldnames
+    if date_column is None or not (has_amount or credit_column or debit_column):
+        raise ValidationError('The statement needs a date column and either an amount column '
+                              'or money in / money out columns.')
+    reference_columns = [name for name in REFERENCE_COLUMNS if name in fieldnames]
+
+    lines, errors = [], []
+    for row in reader:
+        row = {key: (value or '').strip() for key, value in row.items() if key}
+        try:
+            when = parse_date(row[date_column])
+            if has_amount and row[AMOUNT_COLUMN]:
+                amount = parse_amount(row[AMOUNT_COLUMN])
+            else:
+                amount = parse_amount(row.get(credit_column) or '0') - abs(parse_amount(row.get(debit_column) or '0'))
+        except ValidationError as exc:
+            errors.append((reader.line_num, ' '.join(exc.messages)))
+            continue
+        if amount:
+            reference = ' '.join(row[name] for name in reference_columns if row[name])
+            lines.append(StatementLine(reader.line_num, when, amount, reference))
+    return lines, errors
+
+
+def ledger_entries(account, start, end):
+    """The account's payments in and out between start and end, two queries in all."""
+    entries = [
+        LedgerEntry('in', pk, day, amount, number, name)
+        for pk, day, amount, number, name in PaymentIn.objects.filter(
+            account=account, payment_date__range=(start, end)
+        ).values_list('id', 'payment_date', 'amount', 'receipt_number', 'payer_name')
+    ]
+    entries += [
+        LedgerEntry('out', pk, day, amount, number, name, (invoice,) if invoice else ())
+        for pk, day, amount, number, name, invoice in PaymentOut.objects.filter(
+            account=account, payment_date__range=(start, end)
+        ).values_list('id', 'payment_date', 'amount', 'receipt_number', 'payee_name', 'invoice_number')
+    ]
+    return entries
+
+
+class LedgerIndex:
+    """Payments keyed for the matcher: by reference, and by (direction, amount) in date order."""
+
+    def __init__(self, entries):
+        self.by_reference = defaultdict(list)
+        self.by_amount = defaultdict(list)
+        for entry in entries:
+            for reference in (entry.receipt_number, *entry.references):
+                if reference:
+                    self.by_reference[reference.upper()].append(entry)
+            self.by_amount[entry.direction, entry.amount].append(entry)
+        self.dates = {}
+        for key, bucket in self.by_amount.items():
+            bucket.sort(key=lambda entry: (entry.date, entry.pk))
+            self.dates[key] = [entry.date.toordinal() for entry in bucket]
+
+    def in_window(self, line, window):
+        key = (line.direction, abs(line.amount))
+        bucket = self.by_amount.get(key, ())
+        if not bucket:
+            return []
+        dates = self.dates[key]
+        day = line.date.toordinal()
+        return bucket[bisect_left(dates, day - window):bisect_right(dates, day + window)]
+
+    def by_references(self, line):
+        return [entry for token in line.tokens() for entry in self.by_reference.get(token, ())]
+
+
+def pick(line, candidates, claimed):
+    """(entry, how, candidates): the one unclaimed candidate the line identifies, if any, and those left."""
+    candidates = [entry for entry in candidates if entry.pk not in claimed[entry.direction]]
+    if len(candidates) == 1:
+        return candidates[0], 'amount and date', candidates
+    same_day = [entry for entry in candidates if entry.date == line.date]
+    if len(same_day) == 1:
+        return same_day[0], 'amount and exact date', candidates
+    return None, '', candidates
+
+
+def match(lines, entries, window=DEFAULT_WINDOW):
+    """Match statement lines to ledger entries one-to-one.
+
+    A receipt or invoice number in the line's reference text, on a payment
+    of the same amount within the window, is a match outright. Otherwise the
+    line matches when exactly one unclaimed payment of the same amount falls
+    in the window (or exactly one falls on the same day); several is
+    ambiguous and none is unmatched. Lines are taken in date order, and
+    ambiguous lines get a second look once the first pass has claimed
+    payments, since a neighbour's match often settles them.
+    """
+    index = LedgerIndex(entries)
+    claimed = {'in': set(), 'out': set()}
+    result = Reconciliation()
+    window_days = timedelta(days=window)
+
+    def claim(line, entry, how):
+        claimed[entry.direction].add(entry.pk)
+        result.matched.append((line, entry, how))
+
+    pending = []
+    for line in sorted(lines, key=lambda line: (line.date, line.line)):
+        by_reference = [
+            entry for entry in index.by_references(line)
+            if entry.direction == line.direction and entry.amount == abs(line.amount)
+            and abs(entry.date - line.date) <= window_days and entry.pk not in claimed[entry.direction]
+        ]
+        if len(by_reference) == 1:
+            claim(line, by_reference[0], 'reference')
+            continue
+        entry, how, _ = pick(line, index.in_window(line, window), claimed)
+        if entry is not None:
+            claim(line, entry, how)
+        else:
+            pending.append(line)
+
+    for line in pending:
+        entry, how, left = pick(line, index.in_window(line, window), claimed)
+        if entry is not None:
+            claim(line, entry, how)
+        elif left:
+            result.ambiguous.append((line, left))
+        else:
+            result.unmatched.append(line)
+
+    result.matched.sort(key=lambda item: item[0].line)
+    if lines:
+        first, last = min(line.date for line in lines), max(line.date for line in lines)
+        result.missing = sorted(
+            (entry for entry in entries
+             if entry.pk not in claimed[entry.direction] and first <= entry.date <= last),
+            key=lambda entry: (entry.date, entry.direction, entry.pk),
+        )
+    return result
+
+
+def reconcile_statement(stream, account, window=DEFAULT_WINDOW):
+    """Read a statement for `account` and match it against the ledger."""
+    lines, errors = read_statement(stream)
+    entries = []
+    if lines:
+        margin = timedelta(days=window)
+        entries = ledger_entries(
+            account, min(line.date for line in lines) - margin, max(line.date for line in lines) + margin
+        )
+    result = match(lines, entries, window)
+    result.errors = errors
+    return result
@@ -0,0 +1,172 @@
+# ledger/reports.py
+"""Income and expenditure statement.
+
+Each payment table is read in a single grouped query: every column of the
+statement (one per month/quarter/year, plus the previous period) is a
+conditional SUM over the same GROUP BY, and the per-dimension sections are
+rolled up from those rows in Python.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Q, Sum
+
+from .models import PaymentIn, PaymentOut
+
+# Finer granularities are coarsened until the statement fits in this many columns
+MAX_COLUMNS = 60
+
+GRANULARITIES = [
+    ('auto', 'Automatic'),
+    ('month', 'Monthly'),
+    ('quarter', 'Quarterly'),
+    ('year', 'Yearly'),
+]
+
+# section -> (title, key field, label field); the label field is None when the key is the label
+INCOME_SECTIONS = [
+    ('revenue_type', 'By Revenue Type', 'revenue_type_id', 'revenue_type__name'),
+    ('account', 'By Account', 'account_id', 'account__name'),
+    ('payment_method', 'By Payment Method', 'payment_method', None),
+]
+EXPENDITURE_SECTIONS = [
+    ('expense_type', 'By Expense Type', 'expense_type_id', 'expense_type__name'),
+    ('account', 'By Account', 'account_id', 'account__name'),
+    ('payment_method', 'By Payment Method', 'payment_method', None),
+]
+
+
+def pick_granularity(start, end):
+    days = (end - start).days
+    if days > 3 * 366:
+        return 'year'
+    if days > 366:
+        return 'quarter'
+    return 'month'
+
+
+def period_columns(start, end, granularity):
+    """[(label, first day, last day)] covering [start, end], clipped to the range."""
+    step = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    if granularity == 'year':
+        cursor = start.replace(month=1, day=1)
+    else:
+        cursor = start.replace(month=start.month - (start.month - 1) % step, day=1)
+
+    columns = []
+    while cursor <= end:
+        following = cursor + relativedelta(months=step)
+        if granularity == 'year':
+            label = f"{cursor:%Y}"
+        elif granularity == 'quarter':
+            label = f"Q{(cursor.month - 1) // 3 + 1} {cursor:%Y}"
+        else:
+            label = f"{cursor:%b %Y}"
+        columns.append((label, max(cursor, start), min(following - timedelta(days=1), end)))
+        cursor = following
+    return columns
+
+
+def conditional_pass(model, group_fields, columns, previous):
+    """One query: a SUM per column and for the previous period, grouped by `group_fields`."""
+    aggregates = {
+        f'c{i}': Sum('amount', filter=Q(payment_date__range=(first, last)))
+        for i, (_, first, last) in enumerate(columns)
+    }
+    aggregates['previous'] = Sum('amount', filter=Q(payment_date__range=previous))
+    return list(
+        model.objects.filter(payment_date__range=(previous[0], columns[-1][2]))
+        .values(*group_fields)
+        .annotate(**aggregates)
+        .order_by()
+    )
+
+
+def roll_up(rows, sections, column_count, choices):
+    """Turn the grouped rows into one table per section."""
+    tables = []
+    for key, title, key_field, label_field in sections:
+        lines = {}
+        for row in rows:
+            label = row[label_field] if label_field else choices.get(row[key_field], row[key_field])
+            line = lines.setdefault(row[key_field], {'label': label, 'values': [Decimal('0')] * column_count, 'previous': Decimal('0')})
+            for i in range(column_count):
+                line['values'][i] += row[f'c{i}'] or 0
+            line['previous'] += row['previous'] or 0
+        lines = sorted(lines.values(), key=lambda line: str(line['label']))
+        for line in lines:
+            finish_line(line)
+        tables.append({'key': key, 'title': title, 'lines': lines})
+    return tables
+
+
+def finish_line(line):
+    line['total'] = sum(line['values'], Decimal('0'))
+    line['change'] = line['total'] - line['previous']
+    line['change_pct'] = (line['change'] / line['previous'] * 100) if line['previous'] else None
+    return line
+
+
+def column_totals(rows, column_count, label):
+    line = {'label': label, 'values': [Decimal('0')] * column_count, 'previous': Decimal('0')}
+    for row in rows:
+        for i in range(column_count):
+            line['values'][i] += row[f'c{i}'] or 0
+        line['previous'] += row['previous'] or 0
+    return finish_line(line)
+
+
+def income_statement(start, end, granularity='auto'):
+    if granularity == 'auto':
+        granularity = pick_granularity(start, end)
+    columns = period_columns(start, end, granularity)
+    while len(columns) > MAX_COLUMNS and granularity != 'year':
+        granularity = 'quarter' if granularity == 'month' else 'year'
+        columns = period_columns(start, end, granularity)
+    length = end - start
+    previous = (start - length - timedelta(days=1), start - timedelta(days=1))
+
+    income_fields = {f for _, _, key, label in INCOME_SECTIONS for f in (key, label) if f}
+    expense_fields = {f for _, _, key, label in EXPENDITURE_SECTIONS for f in (key, label) if f}
+    income_rows = conditional_pass(PaymentIn, sorted(income_fields), columns, previous)
+    expense_rows = conditional_pass(PaymentOut, sorted(expense_fields), columns, previous)
+
+    count = len(columns)
+    total_income = column_totals(income_rows, count, 'Total Income')
+    total_expenditure = column_totals(expense_rows, count, 'Total Expenditure')
+    surplus = finish_line({
+        'label': 'Surplus / (Deficit)',
+        'values': [i - e for i, e in zip(total_income['values'], total_expenditure['values'])],
+        'previous': total_income['previous'] - total_expenditure['previous'],
+    })
+
+    return {
+        'start': start,
+        'end': end,
+        'granularity': granularity,
+        'columns': [label for label, _, _ in columns],
+        'previous': previous,
+        'income': roll_up(income_rows, INCOME_SECTIONS, count, dict(PaymentIn.PAYMENT_METHODS)),
+        'expenditure': roll_up(expense_rows, EXPENDITURE_SECTIONS, count, dict(PaymentOut.PAYMENT_METHODS)),
+        'total_income': total_income,
+        'total_expenditure': total_expenditure,
+        'surplus': surplus,
+    }
+
+
+def statement_rows(statement):
+    """Flatten a statement into CSV rows."""
+    header = ['Section', 'Line'] + statement['columns'] + ['Total', 'Previous Period', 'Change']
+    yield header
+    for heading, tables, total in (
+        ('Income', statement['income'], statement['total_income']),
+        ('Expenditure', statement['expenditure'], statement['total_expenditure']),
+    ):
+        for table in tables:
+            for line in table['lines']:
+                yield [f"{heading} {table['title']}", line['label'], *line['values'],
+                       line['total'], line['previous'], line['change']]
+        yield [heading, total['label'], *total['values'], total['total'], total['previous'], total['change']]
+    surplus = statement['surplus']
+    yield ['', surplus['label'], *surplus['values'], surplus['total'], surplus['previous'], surplus['change']]
@@ -0,0 +1,51 @@
+# ledger/signals.py
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, metrics
+from .models import Account, Club, ExpenseType, Member, PaymentIn, PaymentOut, RevenueType, Supplier
+
+
+@receiver(post_save, sender=PaymentIn)
+@receiver(post_save, sender=PaymentOut)
+def count_payment_posting(sender, instance, created, **kwargs):
+    if created:
+        direction = 'in' if sender is PaymentIn else 'out'
+        metrics.inc('ledger_payments_posted_total', account=instance.account_id, direction=direction)
+
+
+@receiver(post_save, sender=ExpenseType)
+@receiver(post_delete, sender=ExpenseType)
+def clear_expense_type_cache(sender, **kwargs):
+    # Every worker process holds its own copy; the version bump makes the others reload theirs
+    caching.bump_version('expense_types')
+    ExpenseType.objects.clear_cache()
+
+
+@receiver(post_save, sender=PaymentIn)
+@receiver(post_delete, sender=PaymentIn)
+@receiver(post_save, sender=RevenueType)
+def invalidate_payment_in_cache(sender, instance, **kwargs):
+    # The dashboard's cached trends are broken down by revenue type name; revenue types are shared by every club
+    caching.bump_version('payment_in', getattr(instance, 'tenant_id', None))
+
+
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+def invalidate_clubs(sender, **kwargs):
+    caching.bump_version('clubs')
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=ExpenseType)
+@receiver(post_save, sender=Member)
+@receiver(post_save, sender=RevenueType)
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=get_user_model())
+def invalidate_receipts(sender, instance, update_fields=None, **kwargs):
+    # Receipts print these names; payments themselves are versioned by updated_at.
+    # Club-owned rows only invalidate their own club's receipts.
+    if update_fields == frozenset({'last_login'}):
+        return
+    caching.bump_version('receipts', getattr(instance, 'tenant_id', None))
@@ -0,0 +1,65 @@
+# ledger/tasks.py
+"""Tasks the background worker can run. Queue them with ledger.jobs.enqueue()."""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.utils import timezone
+
+from .jobs import PRIORITY_HIGH, PRIORITY_LOW, task
+from .models import ExportJob
+
+
+@task('call_command', priority=PRIORITY_LOW)
+def run_management_command(command, args=(), options=None):
+    """Run a management command listed in LEDGER_JOB_COMMANDS, e.g. reconcile_balances for the nightly check."""
+    if command not in settings.LEDGER_JOB_COMMANDS:
+        raise PermissionDenied(f"'{command}' is not in LEDGER_JOB_COMMANDS and cannot be run as a job.")
+    call_command(command, *args, **(options or {}))
+
+
+def abandon_export(export_job_id):
+    """Fail an export whose worker died, so the club can start another."""
+    ExportJob.all_clubs.filter(pk=export_job_id, status__in=['pending', 'running']).update(
+        status='failed', error='The worker building this export stopped.', current_table='',
+        finished_at=timezone.now(),
+    )
+
+
+# A second attempt only happens when the first worker died; run_export records its own failures
+@task('export_ledger', max_attempts=2, priority=PRIORITY_HIGH, on_abandon=abandon_export)
+def export_ledger(export_job_id):
+    from .exports import run_export
+
+    # 'running' means an earlier attempt's worker died part way; the archive is rebuilt from scratch
+    job = ExportJob.all_clubs.filter(pk=export_job_id, status__in=['pending', 'running']).first()
+    if job is not None:
+        run_export(job)
+
+
+@task('purge_idempotency_keys', priority=PRIORITY_LOW)
+def purge_idempotency_keys():
+    from .api import purge_idempotency_keys
+
+    purge_idempotency_keys()
+
+
+@task('send_emails', max_attempts=5)
+def send_emails():
+    from .mail import send_pending
+
+    send_pending()
+
+
+@task('queue_statements', priority=PRIORITY_LOW)
+def queue_statements(start=None, end=None):
+    """Queue statements for the given ISO dates, or for last month."""
+    from .mail import queue_statements
+
+    if start and end:
+        start, end = date.fromisoformat(start), date.fromisoformat(end)
+    else:
+        end = timezone.localdate().replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    queue_statements(start, end)
@@ -0,0 +1,119 @@
+# ledger/tenancy.py
+"""Multi-club tenancy.
+
+Several clubs share one database. Every tenant-owned row carries a `tenant`
+foreign key, and the club being worked on lives in a context variable set by
+TenantMiddleware for each request (or by `scoped()` in commands and jobs).
+While a club is active, the default manager of every tenant model adds
+`tenant = <club>` to its queries, so views, forms and reports only ever see
+that club's rows and use the tenant-leading indexes. With no club active
+(migrations, the worker, maintenance commands) queries span every club;
+`Model.all_clubs` is the explicit unscoped manager.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.core.management.base import CommandError
+from django.db import models
+
+SESSION_KEY = 'ledger_club_id'
+
+_current = contextvars.ContextVar('ledger_club', default=None)
+
+
+def current_club_id():
+    """Id of the active club, or None when nothing is scoped."""
+    return _current.get()
+
+
+@contextmanager
+def scoped(club):
+    """Run the block with `club` (a Club, an id or None for every club) active."""
+    token = _current.set(getattr(club, 'pk', club))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class TenantQuerySet(models.QuerySet):
+    """Adds the active club's filter once, when the queryset is created or next chained.
+
+    Chaining matters for querysets built before any club was active, such as
+    the choices of a form field declared at class level: Django clones them
+    for every form instance, and the clone picks up the club of that request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tenant_id = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._tenant_id = self._tenant_id
+        return clone
+
+    def _chain(self):
+        return super()._chain().scope()
+
+    def scope(self):
+        club_id = _current.get()
+        if club_id is not None and self._tenant_id is None and not self.query.is_sliced and not self.query.combinator:
+            self.query.add_q(models.Q(tenant_id=club_id))
+            self._tenant_id = club_id
+        return self
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.assign_tenant()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().scope()
+
+
+class ClubManager(models.Manager):
+    def cached(self):
+        """{id: club} for every club, shared through the cache."""
+        from . import caching
+
+        with scoped(None):
+            return caching.cached('clubs', (), lambda: {club.id: club for club in self.order_by('name')})
+
+    def default_id(self):
+        """The club rows belong to when none is active: the oldest active club."""
+        active = [club_id for club_id, club in self.cached().items() if club.is_active]
+        return min(active) if active else None
+
+
+def club_for_request(request):
+    """The club a request works on: the user's own, or the one a district user picked."""
+    from .models import Club
+
+    clubs = Club.objects.cached()
+    user = request.user
+    if user.is_authenticated and not user.can_switch_clubs:
+        return clubs.get(user.club_id or Club.objects.default_id())
+    if user.is_authenticated:
+        chosen = clubs.get(request.session.get(SESSION_KEY))
+        if chosen is not None and chosen.is_active:
+            return chosen
+    return clubs.get(getattr(user, 'club_id', None) or Club.objects.default_id())
+
+
+def club_for_command(slug):
+    """The club a management command acts for: the one named, or the only active one."""
+    from .models import Club
+
+    if slug:
+        club = Club.objects.filter(slug=slug).first()
+        if club is None:
+            raise CommandError(f"No club with slug '{slug}'.")
+        return club
+    active = list(Club.objects.filter(is_active=True)[:2])
+    if len(active) != 1:
+        raise CommandError('Choose a club with --club (there is more than one).' if active else 'No active club.')
+    return active[0]
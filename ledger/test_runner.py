@@ -0,0 +1,41 @@
+# ledger/test_runner.py
+"""Test runner that keeps a test run's files out of the working directories.
+
+The cache and the metrics snapshots default to directories under BASE_DIR
+that the development server shares; a test run gets throwaway ones instead.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class LedgerTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.scratch = tempfile.mkdtemp()
+        cache_dir = os.path.join(self.scratch, 'cache')
+        metrics_dir = os.path.join(self.scratch, 'metrics')
+        self.overrides = override_settings(
+            CACHES={'default': {**settings.CACHES['default'], 'LOCATION': cache_dir}},
+            LEDGER_METRICS_DIR=metrics_dir,
+        )
+        self.overrides.enable()
+        # Subprocesses started by the tests read their settings from the environment
+        self.environ = mock.patch.dict(os.environ, {'CACHE_LOCATION': cache_dir, 'LEDGER_METRICS_DIR': metrics_dir})
+        self.environ.start()
+
+    def teardown_test_environment(self, **kwargs):
+        from . import metrics
+
+        # It would run after the override is gone and leave this run's counters in the real directory
+        atexit.unregister(metrics.flush_at_exit)
+        self.environ.stop()
+        self.overrides.disable()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
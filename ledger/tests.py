@@ -1,3 +1,1820 @@
-from django.test import TestCase
+# ledger/tests.py
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import smtplib
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+import zipfile
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from crispy_forms.helper import FormHelper
+
+from .models import (
+    Member, Supplier, RevenueType, ExpenseType, Account, PaymentIn, PaymentOut, ReconciliationRun, ExportJob,
+    AuditLog, Job, Schedule, EmailDelivery, Club, ApiToken, Budget, CategoryTotal, PeriodTotal, RequestProfile,
+)
+from . import caching, jobs, metrics, tenancy
+from .analytics import revenue_trends, rolling_mean
+from .balances import balance_history
+from .budgets import budget_report
+from .periods import balances_as_of, close_period
+from .reports import income_statement
+from . import mail as ledger_mail
+from .cron import Cron
+from .forms import MemberForm, PaymentInForm
+from .urls import urlpatterns
+
+User = get_user_model()
+
+
+def temporary_directory(test):
+    """A directory removed once `test` finishes."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def use_settings(test, **options):
+    """override_settings for the rest of `test`."""
+    override = override_settings(**options)
+    override.enable()
+    test.addCleanup(override.disable)
+
+# Maximum number of queries each ledger URL may run on a GET, keyed by URL name.
+# Every name in ledger/urls.py must have an entry. The counts include the
+# session and user lookups done by the auth middleware, which the tenant
+# middleware needs even on pages that don't require a login.
+QUERY_BUDGETS = {
+    'dashboard': 4,
+    'club_switch': 2,
+    'member_list': 5,
+    'member_create': 4,
+    'member_import': 4,
+    'member_detail': 4,
+    'member_update': 5,
+    'member_delete': 3,
+    'member_cashbook': 6,
+    'supplier_list': 5,
+    'supplier_create': 2,
+    'supplier_detail': 6,
+    'supplier_update': 3,
+    'supplier_delete': 3,
+    'payment_in_list': 5,
+    'payment_in_create': 5,
+    'payment_in_detail': 7,
+    'payment_in_delete': 3,
+    'payment_receipt': 3,
+    'payment_in_print': 3,
+    'payment_in_email': 2,
+    'payment_out_list': 7,
+    'payment_out_create': 5,
+    'payment_out_edit': 5,
+    'payment_out_detail': 4,
+    'payment_out_receipt': 3,
+    'cashbook': 8,
+    'income_statement': 4,
+    'export_list': 3,
+    'export_download': 3,
+    'statement_reconcile': 3,
+    'account_balance_history': 3,
+    'account_balance_history_data': 4,
+    'budget_report': 4,
+    'api_payment_in': 2,
+    'api_payment_in_batch': 2,
+    'api_payment_out': 2,
+    'api_payment_out_batch': 2,
+    'metrics': 2,
+}
+
+# Each view is measured at both sizes; the query count must not grow between them.
+DATASET_SIZES = (3, 12)
+
+# A query shape repeated this many times in one request is a per-row lookup.
+REPEATED_QUERY_LIMIT = 3
+
+# Object each <int:pk> URL is resolved against, keyed by URL name prefix.
+URL_OBJECTS = {
+    'member_': 'member',
+    'supplier_': 'supplier',
+    'payment_in_': 'payment_in',
+    'payment_receipt': 'payment_in',
+    'payment_out_': 'payment_out',
+    'export_': 'export_job',
+}
+
+
+def normalize_sql(sql):
+    """Reduce a query to its shape so per-row repeats can be counted."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\((?:\?,\s*)+\?\)', '(?)', sql)
+    return sql
+
+
+class QueryBudgetTests(TestCase):
+    """Fails when a ledger view exceeds its query budget or runs a query per row."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            username='treasurer', email='treasurer@example.com', password='secret', role='admin'
+        )
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues', amount_default=500)
+        cls.expense_type = ExpenseType.objects.create(name='Venue')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash', balance=Decimal('100000'))
+        cls.member = Member.objects.create(
+            name='Anchor Member', rid='RID-0000', contact='0700000000',
+            email='anchor@example.com', residence='Kampala', created_by=cls.user
+        )
+        cls.supplier = Supplier.objects.create(
+            name='Anchor Supplier', contact='0700000001', supplier_id='S-0000', created_by=cls.user
+        )
+        cls.export_job = ExportJob.objects.create(status='done', file_name='ledger-test.zip')
+        cls.rows = 0
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        export_dir = temporary_directory(self)
+        use_settings(self, LEDGER_EXPORT_DIR=export_dir)
+        Path(export_dir, self.export_job.file_name).write_bytes(b'PK')
+
+    def seed(self, size):
+        """Grow every table to `size` rows, hanging the new rows off the anchor objects."""
+        today = timezone.now().date()
+        start, self.rows = self.rows, size
+        ExpenseType.objects.clear_cache()
+        cache.clear()
+        members, suppliers, payments_in, payments_out = [], [], [], []
+        for i in range(start, size):
+            members.append(Member(
+                name=f'Member {i}', rid=f'RID-{i + 1:04d}', contact='0700000000',
+                email=f'member{i}@example.com', residence='Kampala', created_by=self.user
+            ))
+            suppliers.append(Supplier(
+                name=f'Supplier {i}', contact='0700000001', supplier_id=f'S-{i + 1:04d}', created_by=self.user
+            ))
+            payments_in.append(PaymentIn(
+                payer_member=self.member, payer_name=self.member.name, revenue_type=self.revenue_type,
+                amount=Decimal('500.00'), payment_date=today - timedelta(days=i), payment_method='cash',
+                account=self.account, receipt_number=f'RC-TEST-{i:04d}', created_by=self.user
+            ))
+            payments_out.append(PaymentOut(
+                payee_supplier=self.supplier, payee_name=self.supplier.name, reason='Venue hire',
+                expense_type=self.expense_type, amount=Decimal('200.00'), payment_date=today - timedelta(days=i),
+                payment_method='cash', account=self.account, receipt_number=f'PY-TEST-{i:04d}',
+                created_by=self.user
+            ))
+        Member.objects.bulk_create(members)
+        Supplier.objects.bulk_create(suppliers)
+        PaymentIn.objects.bulk_create(payments_in)
+        PaymentOut.objects.bulk_create(payments_out)
+
+    def url_for(self, name):
+        pattern = next(p for p in urlpatterns if p.name == name)
+        if 'pk' not in pattern.pattern.converters:
+            return reverse(name)
+        prefix = next(prefix for prefix in URL_OBJECTS if name.startswith(prefix))
+        obj = {
+            'member': self.member,
+            'supplier': self.supplier,
+            'payment_in': PaymentIn.objects.first(),
+            'payment_out': PaymentOut.objects.first(),
+            'export_job': self.export_job,
+        }[URL_OBJECTS[prefix]]
+        return reverse(name, kwargs={'pk': obj.pk})
+
+    def capture(self, name):
+        url = self.url_for(name)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, f'{name} returned {response.status_code}')
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def test_every_url_has_a_budget(self):
+        names = {p.name for p in urlpatterns if p.name}
+        self.assertEqual(names - set(QUERY_BUDGETS), set(), 'Add a QUERY_BUDGETS entry for new URLs')
+
+    def test_views_stay_within_budget(self):
+        counts = {}
+        for size in DATASET_SIZES:
+            self.seed(size)
+            for name, budget in QUERY_BUDGETS.items():
+                with self.subTest(url=name, rows=size):
+                    queries = self.capture(name)
+                    counts[name, size] = len(queries)
+                    repeated = {
+                        shape: seen for shape, seen in Counter(map(normalize_sql, queries)).items()
+                        if seen >= REPEATED_QUERY_LIMIT
+                    }
+                    self.assertFalse(repeated, f'{name} repeats a query per row: {repeated}')
+                    self.assertLessEqual(
+                        len(queries), budget,
+                        f'{name} ran {len(queries)} queries (budget {budget}) with {size} rows'
+                    )
+
+        small, large = DATASET_SIZES
+        for name in QUERY_BUDGETS:
+            with self.subTest(url=name):
+                self.assertEqual(
+                    counts[name, small], counts[name, large],
+                    f'{name} query count grows with table size'
+                )
+
+
+class StartupTests(SimpleTestCase):
+    def test_loading_the_urlconf_imports_no_views_or_forms(self):
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(sorted(m for m in sys.modules if m in HEAVY))"
+        ).replace('HEAVY', repr({'ledger.views', 'ledger.api', 'ledger.forms', 'crispy_forms.helper', 'django_tables2'}))
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'rotaract_ledger.settings'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_lazy_views_load_on_first_request(self):
+        match = resolve(reverse('api_payment_in_batch'))
+        self.assertTrue(match.func.csrf_exempt)
+        self.assertEqual(match.url_name, 'api_payment_in_batch')
+
+
+class BalanceReconciliationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.expense_type = ExpenseType.objects.create(name='Venue')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash', opening_balance=Decimal('50'), balance=Decimal('50'))
+        cls.bank = Account.objects.create(name='Equity Bank', account_type='bank')
+
+    def post_in(self, account, amount):
+        return PaymentIn.objects.create(
+            payer_name='Payer', revenue_type=self.revenue_type, amount=Decimal(amount),
+            payment_date=timezone.now().date(), payment_method='cash', account=account
+        )
+
+    def post_out(self, account, amount):
+        return PaymentOut.objects.create(
+            payee_name='Payee', reason='Venue hire', expense_type=self.expense_type, amount=Decimal(amount),
+            payment_date=timezone.now().date(), payment_method='cash', account=account
+        )
+
+    def balance(self, account):
+        return Account.objects.get(pk=account.pk).balance
+
+    def test_edits_and_deletes_keep_balances_in_step(self):
+        payment_in = self.post_in(self.cash, '100')
+        payment_out = self.post_out(self.cash, '30')
+        self.assertEqual(self.balance(self.cash), Decimal('120'))
+
+        payment_in.account, payment_in.amount = self.bank, Decimal('80')
+        payment_in.save()
+        payment_out.amount = Decimal('20')
+        payment_out.save()
+        self.assertEqual(self.balance(self.cash), Decimal('30'))
+        self.assertEqual(self.balance(self.bank), Decimal('80'))
+
+        payment_out.delete()
+        payment_in.delete()
+        self.assertEqual(self.balance(self.cash), Decimal('50'))
+        self.assertEqual(self.balance(self.bank), Decimal('0'))
+
+    def test_incremental_run_reports_and_repairs_drift(self):
+        self.post_in(self.cash, '100')
+        call_command('reconcile_balances', stdout=StringIO())
+
+        self.post_in(self.bank, '40')
+        Account.objects.filter(pk=self.cash.pk).update(balance=Decimal('999'))
+        call_command('reconcile_balances', stdout=StringIO())
+        run = ReconciliationRun.objects.first()
+        # Drift found incrementally is confirmed by a full rescan
+        self.assertEqual((run.mode, run.drifted_accounts, run.total_drift), ('full', 1, Decimal('849')))
+        self.assertEqual(self.balance(self.cash), Decimal('999'))
+
+        call_command('reconcile_balances', repair=True, stdout=StringIO())
+        self.assertEqual(self.balance(self.cash), Decimal('150'))
+        self.assertEqual(self.balance(self.bank), Decimal('40'))
+
+    def test_incremental_repair_leaves_edited_and_deleted_payments_alone(self):
+        payment_in = self.post_in(self.cash, '100')
+        payment_out = self.post_out(self.bank, '30')
+        call_command('reconcile_balances', stdout=StringIO())
+        payment_in.delete()
+        payment_out.amount = Decimal('10')
+        payment_out.save()
+        self.post_in(self.bank, '5')
+
+        call_command('reconcile_balances', repair=True, stdout=StringIO())
+        run = ReconciliationRun.objects.first()
+        self.assertEqual((run.mode, run.drifted_accounts, run.repaired), ('full', 0, False))
+        self.assertEqual(self.balance(self.cash), Decimal('50'))
+        self.assertEqual(self.balance(self.bank), Decimal('-5'))
+
+        out = StringIO()
+        call_command('reconcile_balances', full=True, stdout=out)
+        self.assertIn('no drift', out.getvalue())
+
+
+class AccountingPeriodTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.expense_type = ExpenseType.objects.create(name='Venue')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash', opening_balance=Decimal('1000'))
+        cls.january = cls.receive('500', date(2026, 1, 10))
+        PaymentOut.objects.create(
+            payee_name='Hall', expense_type=cls.expense_type, amount=Decimal('200'), payment_date=date(2026, 1, 20),
+            payment_method='cash', account=cls.cash, reason='Venue hire',
+        )
+        cls.february = cls.receive('300', date(2026, 2, 3))
+
+    @classmethod
+    def receive(cls, amount, day):
+        return PaymentIn.objects.create(
+            payer_name='Alice', revenue_type=cls.revenue_type, amount=Decimal(amount), payment_date=day,
+            payment_method='cash', account=cls.cash,
+        )
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    def test_closing_freezes_totals_and_closing_balances(self):
+        period = close_period('month', 2026, 1)
+        totals = {(row.dimension, row.key): row for row in period.totals.all()}
+        account = totals['account', str(self.cash.pk)]
+        self.assertEqual((account.total_in, account.total_out, account.closing_balance),
+                         (Decimal('500'), Decimal('200'), Decimal('1300')))
+        self.assertEqual(set(totals), {('account', str(self.cash.pk))})
+
+        # Balances after the period start from the snapshot
+        PeriodTotal.objects.filter(pk=account.pk).update(closing_balance=Decimal('5000'))
+        self.assertEqual(balances_as_of(date(2026, 2, 28))[self.cash.pk], Decimal('5300'))
+        self.assertEqual(balances_as_of(date(2025, 12, 31))[self.cash.pk], Decimal('1000'))
+
+    def test_periods_close_in_order_and_only_once_ended(self):
+        with self.assertRaisesMessage(ValidationError, 'Close January 2026 first'):
+            close_period('month', 2026, 2)
+        today = timezone.localdate()
+        with self.assertRaisesMessage(ValidationError, 'has not ended yet'):
+            close_period('month', today.year, today.month)
+
+        close_period('month', 2026, 1)
+        with self.assertRaisesMessage(ValidationError, 'already closed'):
+            close_period('month', 2026, 1)
+        close_period('month', 2026, 2)
+        # Before the first payment there is nothing to close first
+        close_period('month', 2025, 6)
+
+    def test_closed_periods_lock_their_payments(self):
+        close_period('month', 2026, 1)
+        with self.assertRaises(ValidationError):
+            self.receive('10', date(2026, 1, 31))
+        self.january.amount = Decimal('1')
+        with self.assertRaises(ValidationError):
+            self.january.save()
+        # Moving a payment out of a closed period is an edit of that period too
+        self.february.payment_date = date(2026, 1, 5)
+        with self.assertRaises(ValidationError):
+            self.february.save()
+        with self.assertRaises(ValidationError):
+            PaymentIn.objects.get(pk=self.january.pk).delete()
+        self.receive('10', date(2026, 2, 1))
+
+    def test_only_the_latest_period_reopens(self):
+        close_period('month', 2026, 1)
+        close_period('month', 2026, 2)
+        with self.assertRaisesMessage(CommandError, 'Reopen February 2026 first'):
+            call_command('close_period', '2026-01', '--reopen', stdout=StringIO())
+        call_command('close_period', '2026-02', '--reopen', stdout=StringIO())
+        call_command('close_period', '2026-01', '--reopen', stdout=StringIO())
+        self.assertFalse(PeriodTotal.objects.exists())
+        self.january.amount = Decimal('600')
+        self.january.save()
+        self.assertEqual(close_period('month', 2026, 1).totals.get(dimension='account').closing_balance,
+                         Decimal('1400'))
+
+
+class RequestProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.viewer = User.objects.create_user(username='viewer', password='secret', role='viewer')
+
+    def setUp(self):
+        self.profile_dir = Path(temporary_directory(self))
+        use_settings(self, LEDGER_PROFILE_DIR=str(self.profile_dir))
+
+    def test_staff_requests_are_profiled_on_demand(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+        response = self.client.get(reverse('dashboard'), {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.user, profile.method, profile.url_name, profile.status_code),
+                         (self.admin, 'GET', 'dashboard', 200))
+        self.assertEqual(profile.path, reverse('dashboard') + '?profile=1')
+        self.assertGreater((self.profile_dir / profile.profile_file).stat().st_size, 0)
+        self.assertIn('dashboard', (self.profile_dir / profile.allocations_file).read_text())
+
+        self.client.get(reverse('dashboard'), headers={'X-Ledger-Profile': 'yes'})
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_other_users_cannot_profile_requests(self):
+        self.client.force_login(self.viewer)
+        self.client.get(reverse('dashboard'), {'profile': '1'})
+        self.client.logout()
+        self.client.get(reverse('login'), {'profile': '1'})
+        self.assertFalse(RequestProfile.objects.exists())
+        self.assertFalse(any(self.profile_dir.iterdir()))
+
+    def test_only_staff_with_view_permission_download_profiles(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard'), {'profile': '1'})
+        profile = RequestProfile.objects.get()
+        url = reverse('admin:ledger_requestprofile_download', args=[profile.pk, 'allocations'])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(profile.allocations_file, response['Content-Disposition'])
+        self.assertEqual(self.client.get(reverse('admin:ledger_requestprofile_download',
+                                                 args=[profile.pk, 'other'])).status_code, 404)
+
+        # A treasurer is ledger staff but not admin staff
+        treasurer = User.objects.create_user(username='treasurer', password='secret', role='treasurer')
+        self.client.force_login(treasurer)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        treasurer.is_staff = True
+        treasurer.save()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.viewer = User.objects.create_user(username='viewer', password='secret', role='viewer')
+
+    def setUp(self):
+        self.directory = Path(temporary_directory(self))
+        use_settings(self, LEDGER_METRICS_DIR=str(self.directory))
+
+    def write_snapshot(self, pid, hits, age=0):
+        path = self.directory / f'{pid}-{len(list(self.directory.iterdir())):08x}.json'
+        path.write_text(json.dumps({
+            'counters': [['ledger_cache_requests_total', [['cache', 'metrics-test'], ['result', 'hit']], hits]],
+            'histograms': [['ledger_receipt_allocation_seconds', [['kind', 'metrics-test']], [1] + [0] * 9, 0.0004, 2]],
+        }))
+        if age:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    @staticmethod
+    def exited_pid():
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        return process.pid
+
+    def hits(self):
+        counters, _ = metrics.collect()
+        return counters['ledger_cache_requests_total', (('cache', 'metrics-test'), ('result', 'hit'))]
+
+    def test_render_merges_this_process_with_the_others(self):
+        self.write_snapshot(os.getppid(), 2)
+        metrics.record_cache_lookup('metrics-test', hit=True)
+        metrics.observe('ledger_receipt_allocation_seconds', 0.003, kind='metrics-test')
+        text = metrics.render()
+
+        self.assertIn('# TYPE ledger_cache_requests_total counter', text)
+        self.assertIn('ledger_cache_requests_total{cache="metrics-test",result="hit"} 3.0', text)
+        histogram = 'ledger_receipt_allocation_seconds'
+        self.assertIn(f'{histogram}_bucket{{kind="metrics-test",le="0.0005"}} 1', text)
+        self.assertIn(f'{histogram}_bucket{{kind="metrics-test",le="0.005"}} 2', text)
+        self.assertIn(f'{histogram}_bucket{{kind="metrics-test",le="+Inf"}} 3', text)
+        self.assertIn(f'{histogram}_count{{kind="metrics-test"}} 3', text)
+
+    def test_snapshots_of_exited_or_idle_processes_are_archived(self):
+        live = self.write_snapshot(os.getppid(), 1)
+        self.write_snapshot(self.exited_pid(), 5)
+        self.assertEqual(self.hits(), 6)
+        self.assertEqual(self.hits(), 6)
+        self.assertEqual(len(list(self.directory.glob('archive-*.json'))), 1)
+        self.assertTrue(live.exists())
+
+        # An idle snapshot is archived even though its PID is running, and archives are combined
+        self.write_snapshot(self.exited_pid(), 2)
+        idle = self.write_snapshot(os.getppid(), 4, age=settings.LEDGER_METRICS_MAX_AGE + 60)
+        self.assertEqual(self.hits(), 12)
+        self.assertEqual(self.hits(), 12)
+        self.assertFalse(idle.exists())
+        self.assertEqual(sorted(path.name.split('-')[0] for path in self.directory.iterdir()),
+                         [str(os.getppid()), 'archive'])
+
+    def test_scrapes_need_the_token_or_a_staff_session(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 403)
+        with override_settings(LEDGER_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+            response = self.client.get(url, headers={'Authorization': 'Bearer s3cret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(url), '# TYPE ledger_http_requests_total counter')
+
+
+class ExpenseTypeTests(TestCase):
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    def test_spellings_resolve_to_one_cached_type(self):
+        venue = ExpenseType.objects.resolve('Venue  Hire')
+        self.assertEqual((venue.pk, venue.name, venue.key), (None, 'Venue Hire', 'venue hire'))
+        self.assertFalse(ExpenseType.objects.exists())
+        venue = ExpenseType.objects.persist(venue)
+        self.assertEqual(ExpenseType.objects.persist(ExpenseType.objects.resolve('VENUE HIRE')), venue)
+        with self.assertNumQueries(0):
+            self.assertIs(ExpenseType.objects.resolve(' venue hire '), ExpenseType.objects.resolve('VENUE HIRE'))
+        self.assertEqual(ExpenseType.objects.count(), 1)
+
+    def test_a_new_type_is_created_only_with_its_payment(self):
+        account = Account.objects.create(name='Main Cash', account_type='cash', balance=Decimal('100'))
+        supplier = Supplier.objects.create(name='Hall', contact='0700000001', supplier_id='S-0001')
+        self.client.force_login(User.objects.create_superuser(username='admin', password='secret'))
+        data = {'supplier': supplier.pk, 'expense_type': 'Venue hire', 'amount': '500', 'payment_date': '2026-01-10',
+                'payment_method': 'cash', 'account': account.pk, 'reason': 'Meeting'}
+        response = self.client.post(reverse('payment_out_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('does not have enough balance', str(response.context['form'].non_field_errors()))
+        self.assertFalse(ExpenseType.objects.exists())
+
+        self.client.post(reverse('payment_out_create'), {**data, 'amount': '60'})
+        payment = PaymentOut.objects.get()
+        self.assertEqual((payment.expense_type.name, ExpenseType.objects.count()), ('Venue hire', 1))
+
+    def test_changes_in_another_process_reload_the_cache(self):
+        venue = ExpenseType.objects.create(name='Venue')
+        self.assertEqual(ExpenseType.objects.get_cached(venue.pk).name, 'Venue')
+        # A rename the signals of this process never saw
+        ExpenseType.objects.filter(pk=venue.pk).update(name='Hall')
+        self.assertEqual(ExpenseType.objects.get_cached(venue.pk).name, 'Venue')
+
+        script = "import django; django.setup(); from ledger import caching; caching.bump_version('expense_types')"
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'rotaract_ledger.settings'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(ExpenseType.objects.get_cached(venue.pk).name, 'Hall')
+
+    def test_admin_rejects_a_name_that_differs_only_in_case(self):
+        ExpenseType.objects.create(name='Venue')
+        self.client.force_login(User.objects.create_superuser(username='admin', password='secret'))
+        response = self.client.post(reverse('admin:ledger_expensetype_add'), {'name': ' venue ', 'is_active': 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"Venue" already exists', response.context['adminform'].form.errors['name'][0])
+        self.assertEqual(ExpenseType.objects.count(), 1)
+
+        # Renaming a type to another spelling of itself is fine
+        venue = ExpenseType.objects.get()
+        venue.name = 'VENUE'
+        venue.full_clean()
+
+
+class PaymentInListCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def post_in(self, amount):
+        return PaymentIn.objects.create(
+            payer_name='Payer', revenue_type=self.revenue_type, amount=Decimal(amount),
+            payment_date=timezone.now().date(), payment_method='cash', account=self.account
+        )
+
+    def test_summary_is_cached_until_a_payment_changes(self):
+        self.post_in('100')
+        url = reverse('payment_in_list')
+        self.assertEqual(self.client.get(url).context['total_amount'], Decimal('100'))
+
+        # Session, user, the page of payments and the revenue type filter choices
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['total_count'], 1)
+
+        payment = self.post_in('50')
+        self.assertEqual(self.client.get(url).context['total_amount'], Decimal('150'))
+        payment.delete()
+        response = self.client.get(url, {'payer_name': '  PAYER '})
+        self.assertEqual((response.context['total_count'], response.context['month_total']), (1, Decimal('100')))
+
+    def test_a_lost_version_key_never_revives_older_entries(self):
+        self.assertEqual(caching.cached('payment_in', ['probe'], lambda: 'old'), 'old')
+        caching.bump_version('payment_in')
+        # As if the cache had culled the version key
+        cache.delete(caching.version_key('payment_in'))
+        self.assertEqual(caching.cached('payment_in', ['probe'], lambda: 'new'), 'new')
+
+    def test_other_worker_processes_see_invalidations(self):
+        before = caching.get_version('payment_in')
+        script = "import django; django.setup(); from ledger import caching; caching.bump_version('payment_in')"
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'rotaract_ledger.settings'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotEqual(caching.get_version('payment_in'), before)
+
+
+class PaymentOutListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.hall = Supplier.objects.create(name='Hall', contact='0700000001', supplier_id='S-0001')
+        caterer = Supplier.objects.create(name='Caterer', contact='0700000002', supplier_id='S-0002')
+        cls.food = ExpenseType.objects.create(name='Food')
+        venue = ExpenseType.objects.create(name='Venue')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash')
+        cls.bank = Account.objects.create(name='Stanbic', account_type='bank')
+        today = timezone.now().date()
+        cls.payments = [
+            PaymentOut.objects.create(
+                payee_supplier=supplier, payee_name=supplier.name, expense_type=expense_type, account=account,
+                payment_method=method, amount=Decimal(amount), payment_date=day, reason='Meeting',
+            )
+            for supplier, expense_type, account, method, amount, day in [
+                (cls.hall, venue, cls.cash, 'cash', '100', today),
+                (cls.hall, venue, cls.bank, 'bank', '200', date(2025, 3, 10)),
+                (caterer, cls.food, cls.bank, 'mobile', '50', today),
+                (caterer, cls.food, cls.cash, 'cash', '25', date(2025, 3, 20)),
+            ]
+        ]
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+        self.client.force_login(self.user)
+
+    def test_each_filter_and_its_summary(self):
+        first, second, third, fourth = self.payments
+        for query, expected in [
+            ({}, [first, second, third, fourth]),
+            ({'supplier': self.hall.pk}, [first, second]),
+            ({'expense_type': self.food.pk}, [third, fourth]),
+            ({'account': self.bank.pk}, [second, third]),
+            ({'payment_method': 'cash'}, [first, fourth]),
+            ({'payment_date_range': 'month'}, [first, third]),
+            ({'payment_date_range': 'custom', 'start_date': '2025-03-01', 'end_date': '2025-03-31'}, [second, fourth]),
+            ({'supplier': self.hall.pk, 'account': self.cash.pk}, [first]),
+        ]:
+            with self.subTest(query=query):
+                context = self.client.get(reverse('payment_out_list'), query).context
+                self.assertEqual(sorted(p.pk for p in context['payments']), sorted(p.pk for p in expected))
+                self.assertEqual(context['total_count'], len(expected))
+                self.assertEqual(context['total_amount'], sum(p.amount for p in expected))
+                # The month-to-date total ignores the filters
+                self.assertEqual(context['month_total'], Decimal('150'))
+
+    def test_paginator_counts_from_the_summary_and_links_keep_the_filters(self):
+        for _ in range(21):
+            PaymentOut.objects.create(
+                payee_name='Hall', expense_type=self.food, account=self.cash, payment_method='cash',
+                amount=Decimal('1'), payment_date=date(2025, 4, 1), reason='Snacks',
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('payment_out_list'), {'account': self.cash.pk, 'note': 'a&b c'})
+        paginator = response.context['paginator']
+        self.assertEqual((paginator.count, paginator.num_pages), (23, 2))
+        self.assertEqual(response.context['total_count'], 23)
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(*)' in q['sql']])
+        self.assertContains(response, f'href="?page=2&amp;account={self.cash.pk}&amp;note=a%26b+c"')
+
+
+class TenancyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Club.objects.get(slug='main')
+        cls.other = Club.objects.create(name='Kampala Central', slug='kampala-central')
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.district = User.objects.create_superuser(username='district', email='d@example.com', password='secret')
+        cls.treasurer = User.objects.create_user(username='central', password='secret', role='treasurer', club=cls.other)
+        cls.clubs = {}
+        for club in (cls.main, cls.other):
+            with tenancy.scoped(club):
+                account = Account.objects.create(name='Main Cash', account_type='cash')
+                member = Member.objects.create(
+                    name=f'{club.name} Member', rid='RID-0001', contact='0700000000',
+                    email='member@example.com', residence='Kampala'
+                )
+                payment = PaymentIn.objects.create(
+                    payer_member=member, payer_name=member.name, revenue_type=cls.revenue_type,
+                    amount=Decimal('100'), payment_date=timezone.now().date(), payment_method='cash', account=account
+                )
+            cls.clubs[club.slug] = (account, member, payment)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_club_users_only_see_their_own_club(self):
+        main_account, main_member, main_payment = self.clubs['main']
+        account, member, payment = self.clubs['kampala-central']
+        # Numbers and unique fields only need to be unique within a club
+        self.assertEqual(main_payment.receipt_number, payment.receipt_number)
+        self.assertEqual(PaymentIn.all_clubs.count(), 2)
+
+        self.client.force_login(self.treasurer)
+        response = self.client.get(reverse('member_list'))
+        self.assertContains(response, member.name)
+        self.assertNotContains(response, main_member.name)
+        self.assertEqual(self.client.get(reverse('payment_in_detail', args=[main_payment.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('payment_in_detail', args=[payment.pk])).status_code, 200)
+
+        # Another club's account is not a valid choice, and a repeated RID is caught by the form
+        response = self.client.post(reverse('payment_in_create'), {
+            'payer_name': 'Walk-in', 'revenue_type': self.revenue_type.pk, 'amount': '10',
+            'payment_date': timezone.now().date(), 'payment_method': 'cash', 'account': main_account.pk,
+        })
+        self.assertIn('account', response.context['form'].errors)
+        response = self.client.post(reverse('member_create'), {
+            'name': 'Copy', 'rid': 'RID-0001', 'contact': '0700000000', 'email': 'new@example.com',
+            'residence': 'Kampala', 'club': 'rotaract',
+        })
+        self.assertIn('Member with this Club and RID already exists.', response.context['form'].non_field_errors())
+        self.assertEqual(Member.all_clubs.filter(tenant=self.other).count(), 1)
+
+        # Switching is for district users only
+        self.client.post(reverse('club_switch'), {'club': self.main.pk})
+        self.assertEqual(self.client.get(reverse('payment_in_list')).context['total_count'], 1)
+        self.assertEqual(Account.all_clubs.get(pk=account.pk).balance, Decimal('100'))
+
+    def test_users_without_a_club_are_not_district_officers(self):
+        treasurer = User.objects.create_user(username='plain', password='secret', role='treasurer')
+        self.assertEqual(treasurer.club, self.main)
+        self.client.force_login(treasurer)
+        self.client.post(reverse('club_switch'), {'club': self.other.pk})
+        response = self.client.get(reverse('member_list'))
+        self.assertContains(response, self.clubs['main'][1].name)
+        self.assertNotContains(response, self.clubs['kampala-central'][1].name)
+
+        officer = User.objects.create_user(username='officer', password='secret', role='treasurer', is_district=True)
+        self.assertIsNone(officer.club)
+        self.client.force_login(officer)
+        self.client.post(reverse('club_switch'), {'club': self.other.pk})
+        self.assertContains(self.client.get(reverse('member_list')), self.clubs['kampala-central'][1].name)
+
+    def test_district_users_switch_clubs_and_caches_stay_apart(self):
+        self.client.force_login(self.district)
+        url = reverse('payment_in_list')
+        self.assertEqual(self.client.get(url).context['current_club'], self.main)
+        self.client.post(reverse('club_switch'), {'club': self.other.pk})
+        self.assertEqual(self.client.get(url).context['current_club'], self.other)
+
+        with tenancy.scoped(self.main):
+            main_version = caching.get_version('payment_in')
+        account = self.clubs['kampala-central'][0]
+        with tenancy.scoped(self.other):
+            PaymentIn.objects.create(
+                payer_name='Walk-in', revenue_type=self.revenue_type, amount=Decimal('50'),
+                payment_date=timezone.now().date(), payment_method='cash', account=account
+            )
+        self.assertEqual(self.client.get(url).context['total_amount'], Decimal('150'))
+        with tenancy.scoped(self.main):
+            self.assertEqual(caching.get_version('payment_in'), main_version)
+
+        self.client.post(reverse('club_switch'), {'club': self.main.pk})
+        self.assertEqual(self.client.get(url).context['total_amount'], Decimal('100'))
+
+
+class PaymentApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='momo', password='secret', role='treasurer')
+        cls.token, cls.key = ApiToken.issue('MoMo callbacks', cls.user)
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash', balance=Decimal('1000'))
+        cls.mobile = Account.objects.create(name='MoMo', account_type='mobile')
+        cls.member = Member.objects.create(
+            name='Alice', rid='RID-0001', contact='0700000000', email='alice@example.com', residence='Kampala'
+        )
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    def post(self, name, body, **headers):
+        return self.client.post(
+            reverse(name), json.dumps(body), content_type='application/json',
+            headers={'Authorization': f'Bearer {self.key}', **headers},
+        )
+
+    def payments(self, count):
+        return [
+            {'member_rid': 'RID-0001', 'revenue_type': 'monthly dues', 'amount': 100 + i,
+             'payment_method': 'mobile', 'account': (self.cash if i % 2 else self.mobile).pk, 'notes': f'TX{i}'}
+            for i in range(count)
+        ]
+
+    def test_a_batch_posts_in_one_transaction_whatever_its_size(self):
+        # The first post also records the token's use and queues the email job
+        self.post('api_payment_in', self.payments(1)[0])
+        with CaptureQueriesContext(connection) as small:
+            response = self.post('api_payment_in_batch', {'payments': self.payments(4)})
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.post('api_payment_in_batch', {'payments': self.payments(60)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        # One balance UPDATE per account, not per payment
+        updates = [q for q in large.captured_queries if q['sql'].startswith('UPDATE "ledger_account"')]
+        self.assertEqual(len(updates), 2)
+
+        body = response.json()
+        self.assertEqual(body['count'], 60)
+        self.assertEqual(len({p['receipt_number'] for p in body['payments']}), 60)
+        self.assertEqual(PaymentIn.objects.filter(payer_member=self.member).count(), 65)
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.balance, Decimal('1000') + 101 + 103 + sum(range(101, 160, 2)))
+        self.assertEqual(EmailDelivery.objects.filter(kind='receipt').count(), 65)
+
+    def test_retries_with_an_idempotency_key_post_once(self):
+        payment = {'payer_name': 'Walk-in', 'revenue_type': self.revenue_type.pk, 'amount': '250',
+                   'payment_method': 'cash', 'account': self.cash.pk}
+        first = self.post('api_payment_in', payment, **{'Idempotency-Key': 'tx-1'})
+        retry = self.post('api_payment_in', payment, **{'Idempotency-Key': 'tx-1'})
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(PaymentIn.objects.count(), 1)
+
+        changed = self.post('api_payment_in', {**payment, 'amount': '300'}, **{'Idempotency-Key': 'tx-1'})
+        self.assertEqual(changed.status_code, 422)
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.balance, Decimal('1250'))
+
+    def test_an_invalid_batch_posts_nothing(self):
+        payments = self.payments(3)
+        payments[1]['amount'] = '-5'
+        payments[2]['account'] = 999
+        response = self.post('api_payment_in_batch', {'payments': payments})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+        self.assertIn('account', response.json()['errors']['2'])
+        self.assertFalse(PaymentIn.objects.exists())
+
+        # Payments out may not overdraw an account, counting earlier payments in the batch
+        out = {'payee_name': 'Venue', 'expense_type': 'Venue hire', 'reason': 'Meeting', 'amount': '600',
+               'payment_method': 'cash', 'account': self.cash.pk}
+        response = self.post('api_payment_out_batch', {'payments': [out, out]})
+        self.assertEqual(list(response.json()['errors']), ['1'])
+        self.assertFalse(ExpenseType.objects.exists())
+        response = self.post('api_payment_out_batch', {'payments': [{**out, 'amount': '100'}, {**out, 'amount': '200'}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ExpenseType.objects.get().name, 'Venue hire')
+        response = self.post('api_payment_out', out)
+        self.assertEqual((response.status_code, response.json()['receipt_number'][:3]), (201, 'PY-'))
+        self.cash.refresh_from_db()
+        self.assertEqual(self.cash.balance, Decimal('100'))
+
+        self.assertEqual(self.client.post(reverse('api_payment_out'), out).status_code, 401)
+        self.token.is_active = False
+        self.token.save()
+        self.assertEqual(self.post('api_payment_out', out).status_code, 401)
+
+
+class ReceiptCachingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.payment = PaymentIn.objects.create(
+            payer_name='Payer', revenue_type=self.revenue_type, amount=Decimal('100'),
+            payment_date=timezone.now().date(), payment_method='cash', account=self.account
+        )
+
+    def test_unchanged_receipt_answers_not_modified(self):
+        for name in ('payment_receipt', 'payment_in_print'):
+            with self.subTest(url=name):
+                url = reverse(name, kwargs={'pk': self.payment.pk})
+                response = self.client.get(url)
+                etag = response['ETag']
+                self.assertFalse(etag.startswith('W/'))
+                self.assertIn('Last-Modified', response)
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+                self.payment.amount = Decimal('120')
+                self.payment.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, '120.00')
+
+    def test_renaming_a_revenue_type_refreshes_cached_receipts(self):
+        url = reverse('payment_receipt', kwargs={'pk': self.payment.pk})
+        self.assertContains(self.client.get(url), 'Monthly Dues')
+        self.revenue_type.name = 'Annual Dues'
+        self.revenue_type.save()
+        self.assertContains(self.client.get(url), 'Annual Dues')
+
+
+class MemberImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Registration', amount_default=Decimal('50000'))
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+        Member.objects.create(name='Existing', rid='RID-0001', contact='0700000000', email='taken@example.com',
+                              residence='Kampala', created_by=cls.user)
+
+    def test_upload_imports_valid_rows_and_posts_fees_in_one_pass(self):
+        rows = [
+            'Name,RID,Contact,Email,Residence,Club,Registration Fee',
+            'Alice,RID-0002,0701000000,alice@example.com,Kampala,Rotaract Club,',
+            'Bob,RID-0003,0702000000,bob@example.com,Entebbe,rotary,30000',
+            'Carol,RID-0002,0703000000,carol@example.com,Jinja,rotaract,',
+            'Dan,RID-0004,0704000000,TAKEN@example.com,Gulu,rotaract,',
+            'Eve,RID-0005,0705000000,not-an-email,Mbale,rotaract,',
+        ]
+        upload = SimpleUploadedFile('members.csv', '\n'.join(rows).encode('utf-8'), content_type='text/csv')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('member_import'), {
+                'csv_file': upload, 'pay_registration_fee': 'on', 'revenue_type': self.revenue_type.pk,
+                'payment_method': 'cash', 'account': self.account.pk, 'payment_date': timezone.now().date(),
+            })
+        self.assertEqual(response.status_code, 200)
+
+        result = response.context['result']
+        self.assertEqual(result.rows, 5)
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6])
+        self.assertEqual(set(Member.objects.values_list('rid', flat=True)), {'RID-0001', 'RID-0002', 'RID-0003'})
+        self.assertEqual(Member.objects.get(rid='RID-0003').club, 'rotary')
+
+        fees = PaymentIn.objects.order_by('receipt_number')
+        self.assertEqual([p.amount for p in fees], [Decimal('50000'), Decimal('30000')])
+        self.assertEqual(len({p.receipt_number for p in fees}), 2)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('80000'))
+
+        # One write per table regardless of the number of rows
+        inserts = Counter(re.match(r'INSERT INTO "(\w+)"', q['sql']).group(1)
+                          for q in ctx.captured_queries if q['sql'].startswith('INSERT'))
+        self.assertEqual(inserts['ledger_member'], 1)
+        self.assertEqual(inserts['ledger_paymentin'], 1)
+
+    def test_dry_run_writes_nothing(self):
+        upload = SimpleUploadedFile('members.csv', b'name,rid,contact,email,residence\nAlice,RID-0002,0701000000,alice@example.com,Kampala\n')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('member_import'), {'csv_file': upload, 'dry_run': 'on'})
+        self.assertEqual(len(response.context['result'].members), 1)
+        self.assertEqual(Member.objects.count(), 1)
+
+
+class StatementReconciliationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Dues')
+        cls.expense_type = ExpenseType.objects.create(name='Venue')
+        cls.account = Account.objects.create(name='MoMo', account_type='mobile')
+        cls.day = timezone.now().date().replace(month=1, day=15)
+
+    def pay_in(self, amount, days=0, **extra):
+        return PaymentIn.objects.create(
+            payer_name=extra.pop('payer_name', 'Payer'), revenue_type=self.revenue_type, amount=Decimal(amount),
+            payment_date=self.day + timedelta(days=days), payment_method='mobile', account=self.account, **extra
+        )
+
+    def reconcile(self, rows, window=3):
+        from .reconciliation import reconcile_statement
+
+        return reconcile_statement(io.StringIO('\n'.join(rows)), self.account, window)
+
+    def test_lines_are_matched_by_reference_then_amount_and_date(self):
+        by_reference = self.pay_in('50000', payer_name='Alice')
+        twin_a = self.pay_in('20000', days=1, payer_name='Bob')
+        twin_b = self.pay_in('20000', days=2, payer_name='Carol')
+        unique = self.pay_in('35000', days=3, payer_name='Dan')
+        self.pay_in('10000', days=5, payer_name='Not on the statement')
+        PaymentOut.objects.create(
+            payee_name='Hall', reason='Venue', expense_type=self.expense_type, invoice_number='INV-77',
+            amount=Decimal('15000'), payment_date=self.day, payment_method='mobile', account=self.account,
+        )
+        rows = [
+            'Transaction Date,Description,Paid In,Withdrawn',
+            f"{self.day:%d/%m/%Y},Payment {by_reference.receipt_number},50000,",
+            f"{self.day + timedelta(days=1):%Y-%m-%d},Merchant payment,\"20,000\",",
+            f"{self.day + timedelta(days=1):%Y-%m-%d},Merchant payment,\"20,000\",",
+            f"{self.day + timedelta(days=4):%d %b %Y},Transfer,35000,",
+            f"{self.day + timedelta(days=5):%Y-%m-%d},Unknown deposit,99000,",
+            f"{self.day:%Y-%m-%d},Hall inv-77,,15000",
+            'yesterday,Broken,1000,',
+        ]
+        with self.assertNumQueries(2):
+            result = self.reconcile(rows)
+
+        matched = {line.line: (entry.pk, how) for line, entry, how in result.matched}
+        self.assertEqual(matched[2], (by_reference.pk, 'reference'))
+        self.assertEqual(matched[5][0], unique.pk)
+        self.assertEqual(matched[7][1], 'reference')
+        # Two identical lines a day apart from two identical payments: one settles on the exact date,
+        # the other is left with one candidate on the second pass
+        self.assertEqual({matched[3][0], matched[4][0]}, {twin_a.pk, twin_b.pk})
+        self.assertEqual([line.line for line in result.unmatched], [6])
+        self.assertEqual([entry.name for entry in result.missing], ['Not on the statement'])
+        self.assertEqual(result.errors[0][0], 8)
+
+    def test_identical_payments_with_nothing_to_tell_them_apart_are_ambiguous(self):
+        first = self.pay_in('20000', days=-1)
+        second = self.pay_in('20000', days=1)
+        result = self.reconcile(['date,amount', f"{self.day:%Y-%m-%d},20000"])
+        self.assertEqual(result.matched, [])
+        line, candidates = result.ambiguous[0]
+        self.assertEqual({entry.pk for entry in candidates}, {first.pk, second.pk})
+
+    def test_a_year_of_lines_matches_in_well_under_a_second(self):
+        from .reconciliation import LedgerEntry, StatementLine, match
+
+        entries, lines = [], []
+        for n in range(20000):
+            day = self.day + timedelta(days=n % 365)
+            amount = Decimal(1000 * (n % 400 + 1))
+            entries.append(LedgerEntry('in', n, day, amount, f"RC-{n:06d}", 'Payer'))
+            lines.append(StatementLine(n + 2, day + timedelta(days=n % 2), amount, ''))
+        started = time.perf_counter()
+        result = match(lines, entries)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(result.matched) + len(result.ambiguous), len(lines))
+        self.assertEqual(result.unmatched, [])
+
+    def test_upload_from_the_reports_page(self):
+        payment = self.pay_in('50000')
+        upload = SimpleUploadedFile(
+            'statement.csv', f"Date,Amount,Reference\n{self.day:%Y-%m-%d},50000,{payment.receipt_number}\n".encode()
+        )
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('statement_reconcile'), {
+            'account': self.account.pk, 'csv_file': upload, 'window': 3,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['result'].matched), 1)
+        self.assertContains(response, payment.receipt_number)
+
+
+class DuplicatePaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Dues')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+        cls.day = timezone.now().date()
+        cls.first = PaymentIn.objects.create(
+            payer_name='Alice  Nambi', revenue_type=cls.revenue_type, amount=Decimal('20000'),
+            payment_date=cls.day, payment_method='cash', account=cls.account,
+        )
+
+    def post_payment(self, **extra):
+        self.client.force_login(self.user)
+        return self.client.post(reverse('payment_in_create'), {
+            'manual_payer_name': 'alice nambi', 'revenue_type': self.revenue_type.pk, 'amount': '20000.00',
+            'payment_date': self.day, 'payment_method': 'cash', 'account': self.account.pk, **extra,
+        })
+
+    def test_entry_form_warns_until_the_duplicate_is_confirmed(self):
+        response = self.post_payment()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.first.receipt_number)
+        self.assertContains(response, 'id_confirm_duplicate')
+        self.assertEqual(PaymentIn.objects.count(), 1)
+
+        self.assertEqual(self.post_payment(amount='25000').status_code, 302)
+        self.assertEqual(self.post_payment(confirm_duplicate='on').status_code, 302)
+        self.assertEqual(PaymentIn.objects.count(), 3)
+
+    def test_command_reports_clusters_from_one_query(self):
+        PaymentIn.objects.bulk_create([
+            PaymentIn(payer_name='ALICE NAMBI.', revenue_type=self.revenue_type, amount=Decimal('20000'),
+                      payment_date=self.day, payment_method='cash', account=self.account, receipt_number='RC-X-1'),
+            PaymentIn(payer_name='Bob', revenue_type=self.revenue_type, amount=Decimal('20000'),
+                      payment_date=self.day, payment_method='cash', account=self.account, receipt_number='RC-X-2'),
+        ])
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command('find_duplicate_payments', stdout=out)
+        self.assertIn(f"{self.first.receipt_number}, RC-X-1", out.getvalue())
+        self.assertIn('1 duplicate cluster(s), 1 receipt(s)', out.getvalue())
+
+
+class CachedLayoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.revenue_type = RevenueType.objects.create(name='Dues')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+
+    def render(self, form, helper=None):
+        template = Template('{% load crispy_forms_tags %}{% crispy form helper %}' if helper
+                            else '{% load crispy_forms_tags %}{% crispy form %}')
+        return template.render(Context({'form': form, 'helper': helper}))
+
+    def uncached(self, form):
+        helper = FormHelper()
+        for name, value in form.helper_attrs.items():
+            setattr(helper, name, value)
+        helper.layout = form.build_layout(form.layout_variant())
+        return self.render(form, helper)
+
+    def test_skeleton_is_reused_and_renders_what_crispy_would(self):
+        data = {'manual_payer_name': '<b>Alice</b>', 'revenue_type': self.revenue_type.pk, 'amount': 'lots'}
+        for _ in range(2):
+            for form in (PaymentInForm(), PaymentInForm(data), MemberForm(), MemberForm({'name': 'Bob'})):
+                if form.is_bound:
+                    form.is_valid()
+                self.assertEqual(self.render(form), self.uncached(form))
+        self.assertIs(PaymentInForm().helper, PaymentInForm(data).helper)
+        self.assertEqual(len(PaymentInForm().helper.skeletons), 1)
+
+        form = PaymentInForm(data)
+        self.assertIn('&lt;b&gt;Alice&lt;/b&gt;', self.render(form))
+        self.assertIn('Enter a number.', self.render(form))
+
+    def test_duplicate_confirmation_uses_its_own_layout(self):
+        form = PaymentInForm()
+        form.confirming_duplicate = True
+        self.assertIsNot(form.helper, PaymentInForm().helper)
+        self.assertIn('id_confirm_duplicate', self.render(form))
+        self.assertNotIn('id_confirm_duplicate', self.render(PaymentInForm()))
+
+
+class RevenueTrendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.dues = RevenueType.objects.create(name='Dues')
+        cls.events = RevenueType.objects.create(name='Events')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+        cls.today = timezone.now().date()
+        this_month = cls.today.replace(day=1)
+        payments = [
+            # 100 every month since January eleven years ago, and 50 for events each December
+            (cls.dues, this_month - relativedelta(months=i), 100) for i in range(11 * 12 + cls.today.month)
+        ] + [(cls.events, date(year, 12, 5), 50) for year in range(cls.today.year - 11, cls.today.year)]
+        PaymentIn.objects.bulk_create([
+            PaymentIn(payer_name='Alice', revenue_type=revenue_type, amount=Decimal(amount), payment_date=day,
+                      payment_method='cash', account=cls.account, receipt_number=f'RC-T-{i}')
+            for i, (revenue_type, day, amount) in enumerate(payments)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_trends_cover_the_history_in_one_query(self):
+        with self.assertNumQueries(1):
+            trends = revenue_trends(self.today)
+        self.assertEqual(trends['origin'], date(self.today.year - 11, 1, 1))
+        self.assertEqual(trends['monthly'][-1], 100)
+        self.assertEqual(trends['month']['change'], 0)
+        self.assertEqual(trends['rolling'][3][-1], 100)
+        self.assertEqual(trends['yearly'][-2], 1250)
+        self.assertEqual(trends['year_to_date']['change_pct'], 0)
+
+        dues, events = trends['breakdown']
+        self.assertEqual((dues['name'], dues['current'], events['current']), ('Dues', 1200, 50))
+        self.assertAlmostEqual(dues['share'] + events['share'], 100)
+
+        december = trends['seasonality'][11]
+        self.assertEqual(december['average'], 150)
+        self.assertAlmostEqual(december['index'], 150 / (1250 / 12))
+
+    def test_rolling_mean_uses_what_history_there_is(self):
+        self.assertEqual(rolling_mean([2, 4, 6, 8], 3), [2, 3, 4, 6])
+
+    def test_dashboard_views_share_the_cached_trends(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as cold:
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Revenue by Type')
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse('dashboard'), {'view': 'years', 'compare': 1})
+        trend_queries = lambda context: [q for q in context.captured_queries if 'SUBSTR' in q['sql']]
+        self.assertEqual((len(trend_queries(cold)), len(trend_queries(warm))), (1, 0))
+        self.assertEqual(json.loads(response.context['chart_data'])[-2], 1250)
+        self.assertEqual(len(json.loads(response.context['compare_data'])), 5)
+
+        self.dues.name = 'Annual Dues'
+        self.dues.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['trends']['breakdown'][0]['name'], 'Annual Dues')
+
+
+class BalanceHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        revenue_type = RevenueType.objects.create(name='Dues')
+        expense_type = ExpenseType.objects.create(name='Venue')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash', opening_balance=Decimal('1000'))
+        cls.momo = Account.objects.create(name='MoMo', account_type='mobile')
+        payments_in = [(cls.cash, date(2025, 12, 20), 500), (cls.cash, date(2026, 1, 2), 300),
+                       (cls.cash, date(2026, 1, 2), 200), (cls.momo, date(2026, 1, 5), 50)]
+        PaymentIn.objects.bulk_create([
+            PaymentIn(payer_name='Alice', revenue_type=revenue_type, amount=Decimal(amount), payment_date=day,
+                      payment_method='cash', account=account, receipt_number=f'RC-B-{i}')
+            for i, (account, day, amount) in enumerate(payments_in)
+        ])
+        PaymentOut.objects.create(
+            payee_name='Hall', expense_type=expense_type, amount=Decimal('900'), payment_date=date(2026, 1, 4),
+            payment_method='cash', account=cls.cash, reason='Venue hire', receipt_number='PY-B-1',
+        )
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    def test_daily_closing_balances_from_one_query(self):
+        with self.assertNumQueries(1):
+            history = balance_history([self.cash, self.momo], date(2026, 1, 1), date(2026, 1, 6))
+        cash, momo = history['accounts']
+        self.assertEqual(history['step_days'], 1)
+        self.assertEqual([point['balance'] for point in cash['points']], [1500, 2000, 2000, 1100, 1100, 1100])
+        self.assertEqual([point['balance'] for point in momo['points']], [0, 0, 0, 0, 50, 50])
+        self.assertEqual(cash['points'][0]['date'], date(2026, 1, 1))
+
+    def test_long_ranges_are_downsampled_with_the_swing_kept(self):
+        history = balance_history([self.cash], date(2025, 12, 1), date(2026, 1, 6), points=4)
+        self.assertEqual(history['step_days'], 10)
+        points = history['accounts'][0]['points']
+        self.assertEqual([point['date'] for point in points],
+                         [date(2025, 12, 10), date(2025, 12, 20), date(2025, 12, 30), date(2026, 1, 6)])
+        self.assertEqual([(p['balance'], p['low'], p['high']) for p in points][-1], (1100, 1100, 2000))
+
+    def test_json_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse('account_balance_history_data')
+        response = self.client.get(url, {'start_date': '2026-01-01', 'end_date': '2026-01-06',
+                                         'account': self.cash.pk})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([account['name'] for account in body['accounts']], ['Main Cash'])
+        self.assertEqual(body['accounts'][0]['balance'][-1], 1100.0)
+        self.assertEqual(body['accounts'][0]['dates'][0], '2026-01-01')
+
+        response = self.client.get(url, {'start_date': '2026-01-06', 'end_date': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('end_date', response.json()['errors'])
+
+
+class IncomeStatementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.dues = RevenueType.objects.create(name='Monthly Dues')
+        cls.events = RevenueType.objects.create(name='Events')
+        venue = ExpenseType.objects.create(name='Venue')
+        cash = Account.objects.create(name='Main Cash', account_type='cash')
+        bank = Account.objects.create(name='Stanbic', account_type='bank')
+        for revenue_type, account, method, amount, day in [
+            (cls.dues, cash, 'cash', '70', date(2024, 12, 20)),
+            (cls.dues, cash, 'cash', '100', date(2025, 1, 15)),
+            (cls.events, bank, 'bank', '200', date(2025, 2, 10)),
+            (cls.dues, bank, 'mobile', '50', date(2025, 5, 1)),
+        ]:
+            PaymentIn.objects.create(
+                payer_name='Alice', revenue_type=revenue_type, amount=Decimal(amount), payment_date=day,
+                payment_method=method, account=account,
+            )
+        PaymentOut.objects.create(
+            payee_name='Hall', expense_type=venue, amount=Decimal('30'), payment_date=date(2025, 2, 20),
+            payment_method='cash', account=cash, reason='Venue hire',
+        )
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    @staticmethod
+    def lines(table):
+        return {line['label']: line['values'] for line in table['lines']}
+
+    def test_monthly_columns_sum_each_month(self):
+        statement = income_statement(date(2025, 1, 1), date(2025, 6, 30))
+        self.assertEqual(statement['granularity'], 'month')
+        self.assertEqual(statement['columns'], ['Jan 2025', 'Feb 2025', 'Mar 2025', 'Apr 2025', 'May 2025', 'Jun 2025'])
+        self.assertEqual(statement['total_income']['values'], [100, 200, 0, 0, 50, 0])
+        self.assertEqual(statement['total_expenditure']['values'], [0, 30, 0, 0, 0, 0])
+        self.assertEqual(statement['surplus']['values'], [100, 170, 0, 0, 50, 0])
+
+        by_type, by_account, by_method = statement['income']
+        self.assertEqual(self.lines(by_type), {'Events': [0, 200, 0, 0, 0, 0], 'Monthly Dues': [100, 0, 0, 0, 50, 0]})
+        self.assertEqual(self.lines(by_account), {'Main Cash': [100, 0, 0, 0, 0, 0], 'Stanbic': [0, 200, 0, 0, 50, 0]})
+        self.assertEqual(set(self.lines(by_method)), {'Cash', 'Bank Transfer', 'Mobile Money'})
+
+        # The previous period is the same length, ending the day before
+        total = statement['total_income']
+        self.assertEqual((total['total'], total['previous'], total['change']), (350, 70, 280))
+        self.assertEqual(total['change_pct'], Decimal('400'))
+
+    def test_quarterly_and_yearly_columns(self):
+        statement = income_statement(date(2025, 1, 1), date(2025, 6, 30), 'quarter')
+        self.assertEqual(statement['columns'], ['Q1 2025', 'Q2 2025'])
+        self.assertEqual(statement['total_income']['values'], [300, 50])
+        self.assertEqual(self.lines(statement['expenditure'][0]), {'Venue': [30, 0]})
+
+        statement = income_statement(date(2024, 7, 1), date(2025, 6, 30), 'year')
+        self.assertEqual(statement['columns'], ['2024', '2025'])
+        self.assertEqual(statement['total_income']['values'], [70, 350])
+        self.assertEqual(statement['surplus']['total'], 390)
+
+        # Six years of months is too many columns, so they are coarsened
+        statement = income_statement(date(2020, 1, 1), date(2025, 12, 31), 'month')
+        self.assertEqual(statement['granularity'], 'quarter')
+        self.assertEqual(len(statement['columns']), 24)
+        self.assertEqual(income_statement(date(2020, 1, 1), date(2025, 12, 31))['granularity'], 'year')
+
+    def test_csv_export_matches_the_statement(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('income_statement'), {
+            'start_date': '2025-01-01', 'end_date': '2025-06-30', 'granularity': 'quarter', 'export': 'csv',
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('income-expenditure-20250101-20250630.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(response.content.decode())))
+        self.assertEqual(rows[0], ['Section', 'Line', 'Q1 2025', 'Q2 2025', 'Total', 'Previous Period', 'Change'])
+
+        def amounts(section, label):
+            [row] = [row for row in rows if row[:2] == [section, label]]
+            return [Decimal(value) for value in row[2:]]
+
+        self.assertEqual(amounts('Income By Revenue Type', 'Monthly Dues'), [100, 50, 150, 70, 80])
+        self.assertEqual(amounts('Income By Payment Method', 'Mobile Money'), [0, 50, 50, 0, 50])
+        self.assertEqual(amounts('Income', 'Total Income'), [300, 50, 350, 70, 280])
+        self.assertEqual(amounts('Expenditure', 'Total Expenditure'), [30, 0, 30, 0, 30])
+        self.assertEqual(amounts('', 'Surplus / (Deficit)'), [270, 50, 320, 70, 250])
+
+
+class BudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.dues = RevenueType.objects.create(name='Dues')
+        cls.gifts = RevenueType.objects.create(name='Gifts')
+        cls.venue = ExpenseType.objects.create(name='Venue')
+        cls.cash = Account.objects.create(name='Main Cash', account_type='cash', opening_balance=Decimal('5000'))
+        Budget.objects.create(period_type='year', start_date=date(2026, 6, 15), revenue_type=cls.dues,
+                              amount=Decimal('1200'))
+        Budget.objects.create(period_type='month', start_date=date(2026, 3, 1), revenue_type=cls.dues,
+                              amount=Decimal('300'))
+        Budget.objects.create(period_type='month', start_date=date(2026, 3, 1), expense_type=cls.venue,
+                              amount=Decimal('400'))
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+
+    def receive(self, amount, day, revenue_type=None):
+        return PaymentIn.objects.create(
+            payer_name='Alice', revenue_type=revenue_type or self.dues, amount=Decimal(amount), payment_date=day,
+            payment_method='cash', account=self.cash,
+        )
+
+    def totals(self):
+        return {(row.kind, row.category_id, row.month): row.total for row in CategoryTotal.objects.all()}
+
+    def test_category_totals_follow_every_write(self):
+        payment = self.receive('100', date(2026, 3, 5))
+        self.receive('50', date(2026, 3, 20))
+        PaymentOut.objects.create(
+            payee_name='Hall', expense_type=self.venue, amount=Decimal('450'), payment_date=date(2026, 3, 9),
+            payment_method='cash', account=self.cash, reason='Venue hire',
+        )
+        self.assertEqual(self.totals(), {
+            ('revenue_type', self.dues.pk, date(2026, 3, 1)): Decimal('150'),
+            ('expense_type', self.venue.pk, date(2026, 3, 1)): Decimal('450'),
+        })
+
+        payment.revenue_type, payment.payment_date, payment.amount = self.gifts, date(2026, 4, 1), Decimal('80')
+        payment.save()
+        self.assertEqual(self.totals()['revenue_type', self.dues.pk, date(2026, 3, 1)], Decimal('50'))
+        self.assertEqual(self.totals()['revenue_type', self.gifts.pk, date(2026, 4, 1)], Decimal('80'))
+
+        payment.delete()
+        self.assertEqual(self.totals()['revenue_type', self.gifts.pk, date(2026, 4, 1)], Decimal('0'))
+
+    def test_month_report_reads_totals_not_payments(self):
+        self.receive('100', date(2026, 3, 5))
+        self.receive('70', date(2026, 3, 6), self.gifts)
+        self.receive('999', date(2026, 4, 1))
+        with CaptureQueriesContext(connection) as queries:
+            report = budget_report('month', 2026, 3)
+        self.assertLessEqual(len(queries), 3)
+        self.assertFalse([q for q in queries.captured_queries if 'ledger_paymentin' in q['sql']])
+
+        dues, gifts = report['income']['lines']
+        self.assertEqual((dues['budget'], dues['actual'], dues['difference']),
+                         (Decimal('300'), Decimal('100'), Decimal('-200')))
+        self.assertEqual((gifts['name'], gifts['budget'], gifts['actual']), ('Gifts', None, Decimal('70')))
+        venue, = report['expenses']['lines']
+        self.assertEqual((venue['budget'], venue['actual'], venue['used_pct']), (Decimal('400'), 0, 0))
+        self.assertEqual(report['net']['actual'], Decimal('170'))
+
+    def test_months_without_a_budget_get_a_twelfth_of_the_year(self):
+        dues, = budget_report('month', 2026, 5)['income']['lines']
+        self.assertEqual((dues['budget'], dues['prorated']), (Decimal('100'), True))
+        year = budget_report('year', 2026)
+        self.assertEqual(year['income']['total']['budget'], Decimal('1200'))
+        # No annual venue budget, so the year adds up the monthly ones
+        self.assertEqual(year['expenses']['total']['budget'], Decimal('400'))
+
+    def test_budget_needs_exactly_one_category(self):
+        budget = Budget(period_type='year', start_date=date(2026, 1, 1), revenue_type=self.dues,
+                        expense_type=self.venue, amount=Decimal('1'))
+        with self.assertRaises(ValidationError):
+            budget.full_clean()
+        self.assertEqual(Budget.objects.get(period_type='year').start_date, date(2026, 1, 1))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.receive('100', date(2026, 3, 5))
+        CategoryTotal.objects.update(total=Decimal('1'))
+        out = StringIO()
+        call_command('rebuild_category_totals', stdout=out)
+        self.assertIn('fixed 1 drifted', out.getvalue())
+        self.assertEqual(list(self.totals().values()), [Decimal('100')])
+
+    def test_report_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('budget_report'), {'year': 2026, 'month': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Venue')
+        self.assertEqual(response.context['report']['start'], date(2026, 3, 1))
+
+
+class LedgerExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        account = Account.objects.create(name='Main Cash', account_type='cash')
+        PaymentIn.objects.bulk_create([
+            PaymentIn(payer_name=f'Payer {i}', revenue_type=revenue_type, amount=Decimal('100'),
+                      payment_date=timezone.now().date(), payment_method='cash', account=account,
+                      receipt_number=f'RC-TEST-{i:04d}')
+            for i in range(25)
+        ])
+        AuditLog.objects.create(user=cls.user, action='login', object_type='User', description='Logged in')
+
+    def setUp(self):
+        self.export_dir = temporary_directory(self)
+        use_settings(self, LEDGER_EXPORT_DIR=self.export_dir)
+        self.client.force_login(self.user)
+
+    def test_export_streams_every_table_in_chunks(self):
+        from . import exports
+
+        job = ExportJob.objects.create(requested_by=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            exports.run_export(job, chunk_size=10)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.rows_written, job.rows_total)
+        self.assertEqual(list(Path(self.export_dir).iterdir()), [Path(self.export_dir, job.file_name)])
+
+        with zipfile.ZipFile(Path(self.export_dir, job.file_name)) as archive:
+            self.assertEqual(archive.getinfo('payments_in.csv').compress_type, zipfile.ZIP_DEFLATED)
+            with archive.open('payments_in.csv') as member:
+                rows = list(csv.reader(io.TextIOWrapper(member, encoding='utf-8')))
+            manifest = archive.read('manifest.json').decode()
+        self.assertEqual(rows[0][:3], ['id', 'tenant_id', 'payer_member_id'])
+        self.assertEqual(len(rows), 26)
+        self.assertIn('"audit_log.csv": 1', manifest)
+
+        # Progress is written back once per chunk of rows, not once per row
+        updates = [q for q in ctx.captured_queries if 'rows_written' in q['sql'] and q['sql'].startswith('UPDATE')]
+        self.assertLess(len(updates), 15)
+
+    def test_start_and_download_from_the_ui(self):
+        response = self.client.post(reverse('export_list'))
+        self.assertRedirects(response, reverse('export_list'))
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(Job.objects.get().kwargs, {'export_job_id': job.pk})
+
+        # A second request while one is in progress does not queue another
+        self.client.post(reverse('export_list'))
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        call_command('run_worker', '--once', '--no-scheduler', stdout=StringIO())
+        status = self.client.get(reverse('export_list'), {'format': 'json'}).json()
+        self.assertEqual(status['jobs'][0]['status'], 'done')
+
+        response = self.client.get(reverse('export_download', kwargs={'pk': job.pk}))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+
+RAN = []
+
+
+@jobs.task('tests.record', max_attempts=2)
+def record_task(label, fail=False):
+    RAN.append(label)
+    if fail:
+        raise RuntimeError(f'{label} failed')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        RAN.clear()
+
+    def drain(self):
+        jobs.work('test-worker', threading.Event(), once=True)
+
+    def test_jobs_run_by_priority_then_age(self):
+        jobs.enqueue('tests.record', label='normal')
+        jobs.enqueue('tests.record', priority=jobs.PRIORITY_LOW, label='low')
+        jobs.enqueue('tests.record', priority=jobs.PRIORITY_HIGH, label='high')
+        jobs.enqueue('tests.record', run_after=timezone.now() + timedelta(hours=1), label='later')
+        self.drain()
+        self.assertEqual(RAN, ['high', 'normal', 'low'])
+        self.assertEqual(Job.objects.filter(status='queued').get().kwargs, {'label': 'later'})
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = jobs.enqueue('tests.record', label='flaky', fail=True)
+        with self.assertLogs('ledger.jobs', 'ERROR'):
+            self.drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('flaky failed', job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=jobs.RETRY_BACKOFF - 5))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('ledger.jobs', 'ERROR'):
+            self.drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(RAN, ['flaky', 'flaky'])
+
+    def test_a_job_is_claimed_once(self):
+        jobs.enqueue('tests.record', label='only')
+        self.assertIsNotNone(jobs.claim('worker-a'))
+        self.assertIsNone(jobs.claim('worker-b'))
+
+    def test_abandoned_jobs_are_requeued(self):
+        job = jobs.enqueue('tests.record', label='orphan')
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(days=1))
+        self.drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+
+    def test_an_export_whose_worker_died_is_rebuilt_then_failed(self):
+        use_settings(self, LEDGER_EXPORT_DIR=temporary_directory(self))
+        long_ago = timezone.now() - timedelta(days=1)
+        export = ExportJob.objects.create(status='running')
+        job = jobs.enqueue('export_ledger', export_job_id=export.pk)
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=long_ago)
+        self.drain()
+        export.refresh_from_db()
+        self.assertEqual(export.status, 'done')
+
+        export = ExportJob.objects.create(status='running')
+        job = jobs.enqueue('export_ledger', export_job_id=export.pk)
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=2, locked_at=long_ago)
+        self.drain()
+        export.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((job.status, export.status), ('failed', 'failed'))
+        self.assertFalse(export.is_active)
+
+    def test_due_schedules_enqueue_once_and_advance(self):
+        schedule = Schedule.objects.create(
+            name='test', cron='*/5 * * * *', task='tests.record', kwargs={'label': 'tick'},
+            next_run_at=timezone.now() - timedelta(hours=3),
+        )
+        self.assertEqual(len(jobs.run_due_schedules()), 1)
+        self.assertEqual(jobs.run_due_schedules(), [])
+        schedule.refresh_from_db()
+        self.assertGreater(schedule.next_run_at, timezone.now())
+        self.drain()
+        self.assertEqual(RAN, ['tick'])
+
+    def test_only_allowed_management_commands_run_as_jobs(self):
+        job = jobs.enqueue('call_command', command='flush', options={'interactive': False}, max_attempts=1)
+        RevenueType.objects.create(name='Dues')
+        with self.assertLogs('ledger.jobs', 'ERROR'):
+            self.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('not in LEDGER_JOB_COMMANDS', job.last_error)
+        self.assertTrue(RevenueType.objects.exists())
+
+        schedule = Schedule(name='wipe', cron='0 4 * * *', task='call_command', kwargs={'command': 'flush'})
+        with self.assertRaises(ValidationError):
+            schedule.full_clean()
+
+        job = jobs.enqueue('call_command', command='clearsessions')
+        self.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+    def test_cron_next_run(self):
+        start = timezone.make_aware(datetime(2026, 10, 19, 3, 0))  # a Monday
+        cases = [
+            ('30 2 * * *', datetime(2026, 10, 20, 2, 30)),
+            ('*/15 * * * *', datetime(2026, 10, 19, 3, 15)),
+            ('30 3 * * 0', datetime(2026, 10, 25, 3, 30)),
+            ('0 9 1 * 5', datetime(2026, 10, 23, 9, 0)),  # the 1st or a Friday
+            ('@monthly', datetime(2026, 11, 1, 0, 0)),
+            ('0 0 29 2 *', datetime(2028, 2, 29, 0, 0)),
+        ]
+        for expression, expected in cases:
+            with self.subTest(cron=expression):
+                self.assertEqual(Cron(expression).next_after(start), timezone.make_aware(expected))
+        for bad in ('* * *', '61 * * * *', 'a b c d e'):
+            with self.subTest(cron=bad), self.assertRaises(ValidationError):
+                Cron(bad)
+
+
+
+@jobs.task('tests.slow')
+def slow_task(seconds):
+    time.sleep(seconds)
+    # Another worker looking for abandoned jobs while this one is still busy
+    jobs.requeue_stale(timezone.now())
+    RAN.append(Job.objects.get(task='tests.slow').status)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread, so the job rows must be committed
+    serialized_rollback = True
+
+    def setUp(self):
+        RAN.clear()
+
+    @override_settings(LEDGER_JOB_STALE_AFTER=0.2)
+    def test_a_job_running_past_the_stale_limit_is_not_requeued(self):
+        job = jobs.enqueue('tests.slow', seconds=0.5)
+        jobs.work('test-worker', threading.Event(), once=True)
+        job.refresh_from_db()
+        self.assertEqual(RAN, ['running'])
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+
+class RefusingBackend(locmem.EmailBackend):
+    """Locmem backend whose server refuses one domain, and counts the connections opened."""
+    opened = 0
+
+    def open(self):
+        RefusingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].endswith('@refused.example'):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='ledger.tests.RefusingBackend', LEDGER_EMAIL_RATE_PER_MINUTE=0)
+class EmailDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        cls.revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        cls.account = Account.objects.create(name='Main Cash', account_type='cash')
+        cls.members = Member.objects.bulk_create([
+            Member(name=f'Member {i}', rid=f'RID-{i:04d}', contact='0700000000', residence='Kampala',
+                   email='bounce@refused.example' if i == 4 else f'member{i}@example.com')
+            for i in range(5)
+        ])
+        cls.payment = PaymentIn.objects.create(
+            payer_member=cls.members[0], payer_name='Member 0', revenue_type=cls.revenue_type,
+            amount=Decimal('25000'), payment_date=datetime(2026, 9, 15).date(), payment_method='cash',
+            account=cls.account,
+        )
+
+    def setUp(self):
+        RefusingBackend.opened = 0
+
+    def test_receipt_is_queued_then_sent_by_the_worker(self):
+        self.client.force_login(self.user)
+        url = reverse('payment_in_email', kwargs={'pk': self.payment.pk})
+        self.assertRedirects(self.client.post(url), reverse('payment_receipt', kwargs={'pk': self.payment.pk}))
+        self.client.post(url)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(EmailDelivery.objects.filter(status='queued').count(), 2)
+        self.assertEqual(Job.objects.filter(task='send_emails').count(), 1)
+
+        call_command('run_worker', '--once', '--no-scheduler', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['member0@example.com'])
+        self.assertIn(self.payment.receipt_number, message.subject)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        name, content, mimetype = message.attachments[0]
+        self.assertEqual(mimetype, 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(RefusingBackend.opened, 1)
+
+    def test_statements_go_out_in_batches_over_one_connection_each(self):
+        start, end = datetime(2026, 9, 1).date(), datetime(2026, 9, 30).date()
+        PaymentIn.objects.create(
+            payer_member=self.members[0], payer_name='Member 0', revenue_type=self.revenue_type,
+            amount=Decimal('1000'), payment_date=datetime(2026, 10, 1).date(), payment_method='cash',
+            account=self.account,
+        )
+        self.assertEqual(ledger_mail.queue_statements(start, end), 5)
+
+        with CaptureQueriesContext(connection) as ctx:
+            sent, failed = ledger_mail.send_pending(batch_size=2)
+        self.assertEqual((sent, failed), (4, 1))
+        self.assertEqual(RefusingBackend.opened, 3)
+        # Claim, load and record per batch; never a query per message
+        self.assertLess(len(ctx.captured_queries), 30)
+
+        refused = EmailDelivery.objects.get(status='failed')
+        self.assertEqual(refused.recipient, 'bounce@refused.example')
+        self.assertIn('No such user', refused.error)
+
+        statement = next(m for m in mail.outbox if m.to == ['member0@example.com'])
+        self.assertIn('25,000.00', statement.body)
+        self.assertNotIn('1,000.00', statement.body)
+
+    def test_rate_limiter_spaces_sends(self):
+        limiter = ledger_mail.RateLimiter(per_minute=1200)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+class LoadTestTests(LiveServerTestCase):
+    # Keep the default club the migrations create across the table flushes
+    serialized_rollback = True
+
+    def setUp(self):
+        ExpenseType.objects.clear_cache()
+        cache.clear()
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        revenue_type = RevenueType.objects.create(name='Monthly Dues')
+        account = Account.objects.create(name='Main Cash', account_type='cash')
+        PaymentIn.objects.create(payer_name='Alice', revenue_type=revenue_type, amount=Decimal('100'),
+                                 payment_date=timezone.now().date(), payment_method='cash', account=account)
+
+    def test_replays_the_mix_against_a_live_server(self):
+        out = StringIO()
+        call_command('load_test', '--url', self.live_server_url, '--user', 'admin:secret', '--concurrency', '3',
+                     '--requests', '24', '--mix', 'dashboard=2,cashbook=1,receipt=1', '--seed', '1', stdout=out)
+        report = out.getvalue()
+        self.assertIn('24 request(s)', report)
+        self.assertIn('0.0% errors', report)
+        self.assertIn('Server-side database lock errors during the run (/metrics): 0', report)
+
+        out = StringIO()
+        call_command('load_test', '--url', self.live_server_url, '--user', 'admin:secret', '--concurrency', '1',
+                     '--requests', '3', '--mix', 'payment=1', stdout=out)
+        self.assertIn('0.0% errors', out.getvalue())
+        self.assertEqual(PaymentIn.objects.filter(payer_name='Load test').count(), 3)
+
+    def test_a_mix_left_without_scenarios_stops_before_the_run(self):
+        PaymentIn.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'no payments to print'):
+            call_command('load_test', '--url', self.live_server_url, '--user', 'admin:secret',
+                         '--mix', 'receipt=1', stdout=StringIO())
+
+    def test_wrong_password_stops_before_the_run(self):
+        with self.assertRaisesMessage(CommandError, 'Could not log in as admin'):
+            call_command('load_test', '--url', self.live_server_url, '--user', 'admin:wrong', stdout=StringIO())
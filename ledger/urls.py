@@ -1,44 +1,107 @@
 # ledger/urls.py
+"""Ledger URLs.
+
+Views are named by dotted path and imported on their first request rather
+than when the URLconf loads. Every web worker and every `manage.py` command
+(the system checks load the URLconf) would otherwise import all of
+ledger.views, ledger.api and the forms, crispy_forms and templates behind
+them before doing any work.
+"""
+from importlib import import_module
+
 from django.urls import path
-from .views import * 
+
+from .tenancy import scoped
+
+
+class LazyView:
+    """A view callable that imports `dotted` (a function or a View class) on its first call."""
+
+    def __init__(self, dotted, csrf_exempt=False, **initkwargs):
+        self.dotted = dotted
+        self.initkwargs = initkwargs
+        self.view = None
+        self.__module__, self.__name__ = dotted.rsplit('.', 1)
+        self.__qualname__ = self.__name__
+        # CsrfViewMiddleware reads this before the view is called, so it can't come from the real view
+        self.csrf_exempt = csrf_exempt
+
+    def __call__(self, request, *args, **kwargs):
+        if self.view is None:
+            # Import with no club active: querysets built at import time, like the choices of form
+            # fields, must stay unscoped so each request's copy picks up that request's club
+            with scoped(None):
+                target = getattr(import_module(self.__module__), self.__name__)
+            self.view = target.as_view(**self.initkwargs) if isinstance(target, type) else target
+        return self.view(request, *args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyView {self.dotted}>"
+
+
+def view(name, **kwargs):
+    """`name` in ledger.views, or 'api.Name' for the JSON API, loaded on first use."""
+    return LazyView(f"ledger.{name}" if '.' in name else f"ledger.views.{name}", **kwargs)
 
 urlpatterns = [
     # Dashboard
-    path('', dashboard, name='dashboard'),
+    path('', view('dashboard'), name='dashboard'),
+    path('clubs/switch/', view('ClubSwitchView'), name='club_switch'),
 
     # Members URLs
-    path('members/', MemberListView.as_view(), name='member_list'),
-    path('members/create/', MemberCreateView.as_view(), name='member_create'),
-    path('members/<int:pk>/', MemberDetailView.as_view(), name='member_detail'),
-    path('members/<int:pk>/edit/', MemberUpdateView.as_view(), name='member_update'),
-    path('members/<int:pk>/delete/', MemberDeleteView.as_view(), name='member_delete'),
-    path('members/<int:pk>/cashbook/', MemberCashbookView.as_view(), name='member_cashbook'),
-
-    # path('members/<int:pk>/payments/', MemberPaymentHistoryView.as_view(), name='member_payment_history'),
+    path('members/', view('MemberListView'), name='member_list'),
+    path('members/create/', view('MemberCreateView'), name='member_create'),
+    path('members/import/', view('MemberImportView'), name='member_import'),
+    path('members/<int:pk>/', view('MemberDetailView'), name='member_detail'),
+    path('members/<int:pk>/edit/', view('MemberUpdateView'), name='member_update'),
+    path('members/<int:pk>/delete/', view('MemberDeleteView'), name='member_delete'),
+    path('members/<int:pk>/cashbook/', view('MemberCashbookView'), name='member_cashbook'),
+
+    # path('members/<int:pk>/payments/', view('MemberPaymentHistoryView'), name='member_payment_history'),
     
 
     # Suppliers URLs
-    path('suppliers/', SupplierListView.as_view(), name='supplier_list'),
-    path('suppliers/create/', SupplierCreateView.as_view(), name='supplier_create'),
-    path('suppliers/<int:pk>/', SupplierDetailView.as_view(), name='supplier_detail'),
-    path('suppliers/<int:pk>/edit/', SupplierUpdateView.as_view(), name='supplier_update'),
-    path('suppliers/<int:pk>/delete/', SupplierDeleteView.as_view(), name='supplier_delete'),
+    path('suppliers/', view('SupplierListView'), name='supplier_list'),
+    path('suppliers/create/', view('SupplierCreateView'), name='supplier_create'),
+    path('suppliers/<int:pk>/', view('SupplierDetailView'), name='supplier_detail'),
+    path('suppliers/<int:pk>/edit/', view('SupplierUpdateView'), name='supplier_update'),
+    path('suppliers/<int:pk>/delete/', view('SupplierDeleteView'), name='supplier_delete'),
 
     # Payment In URLs
-    path('payments/', PaymentInListView.as_view(), name='payment_in_list'),
-    path('payments/create/', PaymentInCreateView.as_view(), name='payment_in_create'),
-    path('payments/<int:pk>/', PaymentInDetailView.as_view(), name='payment_in_detail'),
-    path('payments/<int:pk>/delete/', PaymentInDeleteView.as_view(), name='payment_in_delete'),
-    path('payments/<int:pk>/receipt/', PaymentReceiptView.as_view(), name='payment_receipt'),
-    path('payments/<int:pk>/print/', PaymentInPrintView.as_view(), name='payment_in_print'),
+    path('payments/', view('PaymentInListView'), name='payment_in_list'),
+    path('payments/create/', view('PaymentInCreateView'), name='payment_in_create'),
+    path('payments/<int:pk>/', view('PaymentInDetailView'), name='payment_in_detail'),
+    path('payments/<int:pk>/delete/', view('PaymentInDeleteView'), name='payment_in_delete'),
+    path('payments/<int:pk>/receipt/', view('PaymentReceiptView'), name='payment_receipt'),
+    path('payments/<int:pk>/print/', view('PaymentInPrintView'), name='payment_in_print'),
+    path('payments/<int:pk>/email/', view('PaymentReceiptEmailView'), name='payment_in_email'),
 
     # Payment Out URLs
-    path('payment-out/', PaymentOutListView.as_view(), name='payment_out_list'),
-    path('payment-out/add/', PaymentOutCreateView.as_view(), name='payment_out_create'),
-    path('payment-out/<int:pk>/edit/', PaymentOutUpdateView.as_view(), name='payment_out_edit'),
-    path('payment-out/<int:pk>/', PaymentOutDetailView.as_view(), name='payment_out_detail'),
-    path('payment-out/<int:pk>/receipt/', payment_out_receipt_view, name='payment_out_receipt'),
+    path('payment-out/', view('PaymentOutListView'), name='payment_out_list'),
+    path('payment-out/add/', view('PaymentOutCreateView'), name='payment_out_create'),
+    path('payment-out/<int:pk>/edit/', view('PaymentOutUpdateView'), name='payment_out_edit'),
+    path('payment-out/<int:pk>/', view('PaymentOutDetailView'), name='payment_out_detail'),
+    path('payment-out/<int:pk>/receipt/', view('payment_out_receipt_view'), name='payment_out_receipt'),
 
     # Cashbook
-    path('cashbook/', cashbook_view, name='cashbook'),
+    path('cashbook/', view('cashbook_view'), name='cashbook'),
+
+    # Reports
+    path('reports/income-expenditure/', view('IncomeStatementView'), name='income_statement'),
+    path('reports/exports/', view('ExportJobListView'), name='export_list'),
+    path('reports/exports/<int:pk>/download/', view('ExportJobDownloadView'), name='export_download'),
+    path('reports/reconcile/', view('StatementReconcileView'), name='statement_reconcile'),
+    path('reports/balance-history/', view('AccountBalanceHistoryView'), name='account_balance_history'),
+    path('reports/balance-history/data/', view('AccountBalanceHistoryView', data=True),
+         name='account_balance_history_data'),
+    path('reports/budget/', view('BudgetReportView'), name='budget_report'),
+
+    # Payment API (token authenticated JSON)
+    path('api/payments/in/', view('api.PaymentApiView', csrf_exempt=True), name='api_payment_in'),
+    path('api/payments/in/batch/', view('api.PaymentApiView', csrf_exempt=True, batch=True), name='api_payment_in_batch'),
+    path('api/payments/out/', view('api.PaymentOutApiView', csrf_exempt=True), name='api_payment_out'),
+    path('api/payments/out/batch/', view('api.PaymentOutApiView', csrf_exempt=True, batch=True), name='api_payment_out_batch'),
+
+    # Monitoring
+    path('metrics', view('metrics_view'), name='metrics'),
 ]
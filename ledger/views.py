@@ -4,20 +4,32 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
 from datetime import timedelta, datetime
-from dateutil.relativedelta import relativedelta
-from django.db.models.functions import TruncMonth, TruncYear
+import csv
+import io
 import json
 from decimal import Decimal
-from .models import PaymentIn, PaymentOut, Account, Member, Supplier, RevenueType, ExpenseType
+from .models import PaymentIn, PaymentOut, Account, Member, Supplier, RevenueType, ExpenseType, ExportJob, Club
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, View, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.db import transaction
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.template.loader import render_to_string
 from django.contrib import messages
 from .forms import PaymentOutForm
+from .permissions import is_ledger_staff
+from .periods import balances_as_of
+from .analytics import revenue_trends
+from django.core.exceptions import ValidationError
+from . import caching, metrics, tenancy
+from django.conf import settings
+import calendar
+import hashlib
+import hmac
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.middleware.csrf import get_token
 from itertools import chain
 
 # JSON Encoder for Decimals
@@ -36,68 +48,23 @@ def dashboard(request):
     accounts = Account.objects.filter(is_active=True)
     total_balance = sum(account.balance for account in accounts)
 
-    chart_labels, chart_data, chart_title = [], [], ""
-
+    # Recomputed on the first dashboard hit after a payment is posted (or the next day)
+    trends = caching.cached('payment_in', ('revenue_trends', today), lambda: revenue_trends(today))
+    compare_data = compare_labels = None
     if view_type == 'years':
-        # Last 5 years
-        start_year = today.year - 4
-        yearly_data = PaymentIn.objects.filter(
-            payment_date__year__gte=start_year
-        ).annotate(
-            year=TruncYear('payment_date')
-        ).values('year').annotate(
-            total=Sum('amount')
-        ).order_by('year')
-
-        for y in range(start_year, today.year + 1):
-            chart_labels.append(str(y))
-            data = next((item for item in yearly_data if item['year'].year == y), None)
-            chart_data.append(float(data['total'] or 0) if data else 0.0)
-
+        # Last 5 years, optionally against the 5 before
+        chart_labels = [str(year) for year in trends['years'][-5:]]
+        chart_data = trends['yearly'][-5:]
         chart_title = 'Yearly Revenue (Last 5 Years)'
-
-        # Optional comparison (previous 5 years)
-        compare_data = None
-        compare_labels = None
         if 'compare' in request.GET:
-            compare_start_year = start_year - 5
-            comparison_data = PaymentIn.objects.filter(
-                payment_date__year__gte=compare_start_year,
-                payment_date__year__lt=start_year
-            ).annotate(
-                year=TruncYear('payment_date')
-            ).values('year').annotate(
-                total=Sum('amount')
-            ).order_by('year')
-
-            compare_labels = [str(y) for y in range(compare_start_year, start_year)]
-            compare_data = []
-            for y in range(compare_start_year, start_year):
-                data = next((item for item in comparison_data if item['year'].year == y), None)
-                compare_data.append(float(data['total'] or 0) if data else 0.0)
+            compare_labels = [str(year) for year in trends['years'][-10:-5]]
+            compare_data = trends['yearly'][-10:-5]
+        rolling_data = None
     else:
-        # Last 12 months
+        chart_labels = trends['month_labels'][-12:]
+        chart_data = trends['monthly'][-12:]
         chart_title = 'Monthly Revenue (Last 12 Months)'
-        current_month = today.replace(day=1)
-        start_month = current_month - relativedelta(months=11)
-
-        monthly_data = PaymentIn.objects.filter(
-            payment_date__gte=start_month
-        ).annotate(
-            month=TruncMonth('payment_date')
-        ).values('month').annotate(
-            total=Sum('amount')
-        ).order_by('month')
-
-        for i in range(12):
-            month_date = start_month + relativedelta(months=i)
-            label = month_date.strftime('%b %Y')
-            chart_labels.append(label)
-            data = next((item for item in monthly_data if item['month'].year == month_date.year and item['month'].month == month_date.month), None)
-            chart_data.append(float(data['total'] or 0) if data else 0.0)
-
-        compare_data = None
-        compare_labels = None
+        rolling_data = trends['rolling'][3][-12:]
 
     avg_monthly = sum(chart_data) / len(chart_data) if chart_data else 0
     current_month_revenue = chart_data[-1] if chart_data else 0
@@ -113,9 +80,27 @@ def dashboard(request):
         'accounts': accounts,
         'avg_monthly': avg_monthly,
         'current_month_revenue': current_month_revenue,
+        'rolling_data': json.dumps(rolling_data) if rolling_data else 'null',
+        'trends': trends,
+        'trend_cards': [
+            ('This Month vs a Year Ago', trends['month']),
+            ('Year to Date vs Last Year', trends['year_to_date']),
+            ('12-Month Average vs a Year Ago', trends['rolling_12']),
+        ],
+        'seasonality_data': json.dumps([month['average'] for month in trends['seasonality']]),
+        'seasonality_labels': json.dumps([month['label'] for month in trends['seasonality']]),
     }
     return render(request, 'ledger/dashboard.html', context)
 
+# Prometheus metrics
+def metrics_view(request):
+    token = settings.LEDGER_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    scraper = bool(token) and hmac.compare_digest(authorization, f"Bearer {token}")
+    if not scraper and not is_ledger_staff(request.user):
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Debug view to check user permissions
 class UserStatusView(LoginRequiredMixin, View):
     def get(self, request):
@@ -129,27 +114,32 @@ class UserStatusView(LoginRequiredMixin, View):
             'has_perm_add_member': user.has_perm('ledger.add_member'),
         })
 
+class ClubSwitchView(LoginRequiredMixin, View):
+    """District officers choose whose books they are working on."""
+
+    def get(self, request):
+        return redirect('dashboard')
+
+    def post(self, request):
+        if not request.user.can_switch_clubs:
+            messages.error(request, "Your account belongs to one club and cannot switch clubs.")
+            return redirect('dashboard')
+        choice = request.POST.get('club', '')
+        club = Club.objects.cached().get(int(choice)) if choice.isdigit() else None
+        if club is None or not club.is_active:
+            messages.error(request, "Please choose an active club.")
+            return redirect('dashboard')
+        request.session[tenancy.SESSION_KEY] = club.pk
+        messages.success(request, f"You are now working on {club}.")
+        # Whatever page the user was on belongs to the previous club
+        return redirect('dashboard')
+
 # Permission Mixin
 class StaffRequiredMixin(UserPassesTestMixin):
     """Mixin to allow superusers and staff users with specific roles"""
     
     def test_func(self):
-        user = self.request.user
-        
-        # Superusers always have access
-        if user.is_superuser:
-            return True
-            
-        # Check if user is active
-        if not user.is_active:
-            return False
-            
-        # If using CustomUser with role field, check specific roles
-        if hasattr(user, 'role'):
-            return user.role in ['admin', 'treasurer', 'registrar']
-            
-        # For regular staff users without role field, allow access
-        return True
+        return is_ledger_staff(self.request.user)
     
     def handle_no_permission(self):
         """Custom message for permission denied"""
@@ -157,15 +147,66 @@ class StaffRequiredMixin(UserPassesTestMixin):
         return redirect('dashboard')
 
 # Payment Receipt View
+# Receipts
+def receipt_response(request, payment, template_name, context, *, per_viewer=True, extra=()):
+    """Render a receipt, or answer 304 Not Modified when the browser's copy is current.
+
+    The strong ETag covers the payment's updated_at and the shared 'receipts'
+    cache version, which is bumped when a name printed on receipts changes,
+    plus any `extra` values the page depends on. Receipts drawn inside
+    base.html also show who is signed in, so unless `per_viewer` is False
+    their tag includes the user and the CSRF cookie too. The receipt body
+    itself is cached by the templates under the same versions.
+    """
+    version = caching.get_version('receipts')
+    parts = [template_name, payment.pk, payment.updated_at.isoformat(), version, *extra]
+    if per_viewer:
+        user = request.user
+        get_token(request)  # make sure the CSRF secret exists so the tag is stable from the first response
+        parts += [user.pk, getattr(user, 'role', ''), request.META['CSRF_COOKIE']]
+    etag = '"%s"' % hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    last_modified = calendar.timegm(payment.updated_at.utctimetuple())
+
+    # A pending flash message would be lost on a 304, so render instead
+    response = None
+    if not len(messages.get_messages(request)):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render(request, template_name, {**context, 'receipt_version': version})
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
 class PaymentReceiptView(LoginRequiredMixin, DetailView):
     model = PaymentIn
     template_name = 'ledger/payments/payment_receipt.html'
     context_object_name = 'payment'
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Add any additional context data needed for the receipt
-        return context
+
+    def get_queryset(self):
+        return PaymentIn.objects.select_related('revenue_type', 'created_by')
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return receipt_response(request, self.object, self.template_name, {'payment': self.object})
+
+class PaymentReceiptEmailView(LoginRequiredMixin, View):
+    """Queue the receipt for (re)sending to the payer."""
+
+    def get(self, request, pk):
+        return redirect('payment_receipt', pk=pk)
+
+    def post(self, request, pk):
+        from .mail import queue_receipts, receipt_recipient
+
+        payment = get_object_or_404(PaymentIn.objects.select_related('payer_member'), pk=pk)
+        if queue_receipts([payment]):
+            messages.success(request, f"Receipt {payment.receipt_number} will be emailed to {receipt_recipient(payment)}.")
+        else:
+            messages.warning(request, "This payment has no email address to send the receipt to.")
+        return redirect('payment_receipt', pk=pk)
 
 # Member Views
 class MemberListView(LoginRequiredMixin, ListView):
@@ -227,12 +268,43 @@ class MemberCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
                     created_by=self.request.user
                 )
                 payment.save()
+                if settings.LEDGER_EMAIL_RECEIPTS:
+                    from .mail import queue_receipts
+                    queue_receipts([payment])
 
         return super().form_valid(form)
 
     def get_success_url(self):
         return reverse_lazy('member_list')
 
+class MemberImportView(LoginRequiredMixin, StaffRequiredMixin, View):
+    template_name = 'ledger/members/member_import.html'
+
+    def get(self, request):
+        from .forms import MemberImportForm
+        return render(request, self.template_name, {'form': MemberImportForm()})
+
+    def post(self, request):
+        from .forms import MemberImportForm
+        from .imports import import_members, read_rows
+
+        form = MemberImportForm(request.POST, request.FILES)
+        result = None
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_members(
+                    read_rows(stream), user=request.user, fee=form.fee(), dry_run=form.cleaned_data['dry_run']
+                )
+            except UnicodeDecodeError:
+                form.add_error('csv_file', 'The file must be a UTF-8 encoded CSV export.')
+            except ValidationError as exc:
+                form.add_error(None, exc)
+
+        if result is not None and not form.cleaned_data['dry_run'] and result.members:
+            messages.success(request, f"Imported {len(result.members)} member(s).")
+        return render(request, self.template_name, {'form': form, 'result': result})
+
 class MemberUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
     model = Member
     template_name = 'ledger/members/member_form.html'
@@ -252,7 +324,9 @@ class MemberDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['payments'] = PaymentIn.objects.filter(payer_member=self.object)
+        context['payments'] = PaymentIn.objects.filter(
+            payer_member=self.object
+        ).select_related('revenue_type')
         return context
 
 def member_detail(request, pk):
@@ -343,7 +417,9 @@ class SupplierDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['payments'] = PaymentOut.objects.filter(payee_supplier=self.object)
+        context['payments'] = PaymentOut.objects.filter(
+            payee_supplier=self.object
+        ).select_related('account')
         context['total_paid'] = PaymentOut.objects.filter(
             payee_supplier=self.object
         ).aggregate(Sum('amount'))['amount__sum'] or 0
@@ -356,70 +432,94 @@ class SupplierDeleteView(LoginRequiredMixin, StaffRequiredMixin, SuccessMessageM
     success_message = "Supplier was deleted successfully."
 
 # Payment In Views
+def payment_date_filter(payment_date_range, start_date=None, end_date=None):
+    """Q for the date range choices shared by the payment search forms."""
+    today = timezone.now().date()
+    if payment_date_range == 'today':
+        return Q(payment_date=today)
+    if payment_date_range == 'week':
+        return Q(payment_date__gte=today - timedelta(days=today.weekday()))
+    if payment_date_range == 'month':
+        return Q(payment_date__gte=today.replace(day=1))
+    if payment_date_range == 'year':
+        return Q(payment_date__gte=today.replace(month=1, day=1))
+    if payment_date_range == 'custom' and start_date and end_date:
+        return Q(payment_date__gte=start_date, payment_date__lte=end_date)
+    return Q()
+
+
 class PaymentInListView(LoginRequiredMixin, ListView):
     model = PaymentIn
     template_name = 'ledger/payments/payment_in_list.html'
     context_object_name = 'payments'
     paginate_by = 20
 
-    def get_queryset(self):
-        queryset = PaymentIn.objects.select_related(
-            'payer_member', 'revenue_type', 'account'
-        ).order_by('-payment_date', '-created_at')
-        
-        # Filters
-        payer_name = self.request.GET.get('payer_name')
-        receipt_number = self.request.GET.get('receipt_number')
-        revenue_type = self.request.GET.get('revenue_type')
-        payment_date_range = self.request.GET.get('payment_date_range')
-        start_date = self.request.GET.get('start_date')
-        end_date = self.request.GET.get('end_date')
+    def get_filters(self):
+        from .forms import PaymentInSearchForm
+
+        self.search_form = PaymentInSearchForm(self.request.GET)
+        # Normalized filter values; these (not the raw query string) key the cached summary
+        self.filter_params = {}
+        filters = Q()
+        if not self.search_form.is_valid():
+            return filters
 
+        data = self.search_form.cleaned_data
+        payer_name = ' '.join(data['payer_name'].split())
+        receipt_number = data['receipt_number'].strip()
         if payer_name:
-            queryset = queryset.filter(payer_name__icontains=payer_name)
+            filters &= Q(payer_name__icontains=payer_name)
+            self.filter_params['payer_name'] = payer_name.casefold()
         if receipt_number:
-            queryset = queryset.filter(receipt_number__icontains=receipt_number)
-        if revenue_type:
-            queryset = queryset.filter(revenue_type_id=revenue_type)
-
-        today = timezone.now().date()
-        if payment_date_range:
-            if payment_date_range == 'today':
-                queryset = queryset.filter(payment_date=today)
-            elif payment_date_range == 'week':
-                start_of_week = today - timedelta(days=today.weekday())
-                queryset = queryset.filter(payment_date__gte=start_of_week)
-            elif payment_date_range == 'month':
-                start_of_month = today.replace(day=1)
-                queryset = queryset.filter(payment_date__gte=start_of_month)
-            elif payment_date_range == 'year':
-                start_of_year = today.replace(month=1, day=1)
-                queryset = queryset.filter(payment_date__gte=start_of_year)
-            elif payment_date_range == 'custom' and start_date and end_date:
-                queryset = queryset.filter(
-                    payment_date__gte=start_date,
-                    payment_date__lte=end_date
-                )
+            filters &= Q(receipt_number__icontains=receipt_number)
+            self.filter_params['receipt_number'] = receipt_number.casefold()
+        if data['revenue_type']:
+            filters &= Q(revenue_type=data['revenue_type'])
+            self.filter_params['revenue_type'] = data['revenue_type'].pk
+
+        date_filter = payment_date_filter(data['payment_date_range'], data['start_date'], data['end_date'])
+        if date_filter:
+            filters &= date_filter
+            self.filter_params['payment_date_range'] = data['payment_date_range']
+            if data['payment_date_range'] == 'custom':
+                self.filter_params['start_date'] = data['start_date']
+                self.filter_params['end_date'] = data['end_date']
+        return filters
 
-        return queryset
+    def get_queryset(self):
+        self.filters = self.get_filters()
+        return PaymentIn.objects.filter(self.filters).select_related(
+            'payer_member', 'revenue_type', 'account'
+        ).order_by('-payment_date', '-created_at')
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        from .forms import PaymentInSearchForm
+    def get_summary(self):
+        """Filtered totals and the unfiltered month-to-date, cached until the next payment write."""
+        today = timezone.now().date()
+        this_month = Q(payment_date__gte=today.replace(day=1))
 
-        queryset = self.get_queryset()
-        context['search_form'] = PaymentInSearchForm(self.request.GET)
+        def compute():
+            payments = PaymentIn.objects.filter(self.filters | this_month) if self.filters else PaymentIn.objects.all()
+            return payments.aggregate(
+                total_amount=Sum('amount', filter=self.filters),
+                total_count=Count('id', filter=self.filters),
+                month_total=Sum('amount', filter=this_month),
+            )
 
-        # Totals
-        context['total_amount'] = queryset.aggregate(Sum('amount'))['amount__sum'] or 0
-        context['total_count'] = queryset.count()
+        # Relative ranges ("this week") and the month total move with the date, so it is part of the key
+        return caching.cached('payment_in', ('list_summary', today, self.filter_params), compute)
 
-        # Monthly total
-        today = timezone.now().date()
-        start_of_month = today.replace(day=1)
-        month_total = PaymentIn.objects.filter(payment_date__gte=start_of_month).aggregate(Sum('amount'))['amount__sum'] or 0
-        context['month_total'] = month_total
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        self.summary = self.get_summary()
+        paginator.count = self.summary['total_count']
+        return paginator
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_form'] = self.search_form
+        context['total_amount'] = self.summary['total_amount'] or 0
+        context['total_count'] = self.summary['total_count']
+        context['month_total'] = self.summary['month_total'] or 0
         return context
 
 class PaymentInCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -437,9 +537,13 @@ class PaymentInCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         
         # Generate receipt number if not provided
         if not payment.receipt_number:
-            payment.receipt_number = self.generate_receipt_number()
+            with metrics.timer('ledger_receipt_allocation_seconds', kind='in'):
+                payment.receipt_number = self.generate_receipt_number()
         
         payment.save()
+        if settings.LEDGER_EMAIL_RECEIPTS:
+            from .mail import queue_receipts
+            queue_receipts([payment])
         return super().form_valid(form)
     
     def generate_receipt_number(self):
@@ -486,6 +590,13 @@ class PaymentInDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     success_url = reverse_lazy('payment_in_list')
     success_message = "Payment was deleted successfully."
 
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ValidationError as e:
+            messages.error(self.request, ' '.join(e.messages))
+            return redirect('payment_in_detail', pk=self.object.pk)
+
 # Payment Out Views
 class PaymentOutListView(LoginRequiredMixin, ListView):
     model = PaymentOut
@@ -493,17 +604,59 @@ class PaymentOutListView(LoginRequiredMixin, ListView):
     context_object_name = 'payments'
     paginate_by = 20
 
+    def get_filters(self):
+        from .forms import PaymentOutSearchForm
+
+        self.search_form = PaymentOutSearchForm(self.request.GET or None)
+        filters = Q()
+        if not self.search_form.is_bound or not self.search_form.is_valid():
+            return filters
+
+        data = self.search_form.cleaned_data
+        if data['supplier']:
+            filters &= Q(payee_supplier=data['supplier'])
+        if data['expense_type']:
+            filters &= Q(expense_type_id=data['expense_type'])
+        if data['account']:
+            filters &= Q(account=data['account'])
+        if data['payment_method']:
+            filters &= Q(payment_method=data['payment_method'])
+        filters &= payment_date_filter(data['payment_date_range'], data['start_date'], data['end_date'])
+        return filters
+
     def get_queryset(self):
-        queryset = PaymentOut.objects.select_related(
-            'payee_supplier', 'account'
+        self.filters = self.get_filters()
+        return PaymentOut.objects.filter(self.filters).select_related(
+            'payee_supplier', 'account', 'expense_type'
         ).order_by('-payment_date', '-created_at')
-        
-        # Add filters similar to PaymentInListView
-        return queryset
+
+    def get_summary(self):
+        """Totals for the filtered list and the unfiltered month-to-date in one query."""
+        this_month = Q(payment_date__gte=timezone.now().date().replace(day=1))
+        payments = PaymentOut.objects.filter(self.filters | this_month) if self.filters else PaymentOut.objects.all()
+        return payments.aggregate(
+            total_amount=Sum('amount', filter=self.filters),
+            total_count=Count('id', filter=self.filters),
+            month_total=Sum('amount', filter=this_month),
+        )
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        # The summary already counted the filtered rows; spare the paginator its COUNT(*)
+        self.summary = self.get_summary()
+        paginator.count = self.summary['total_count']
+        return paginator
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add totals and other context data
+        context['search_form'] = self.search_form
+        context['total_amount'] = self.summary['total_amount'] or 0
+        context['total_count'] = self.summary['total_count']
+        context['month_total'] = self.summary['month_total'] or 0
+        # The filters, URL-encoded, for the pagination links to carry along
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context['page_query'] = query.urlencode()
         return context
 
 class PaymentOutCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -552,6 +705,9 @@ class PaymentOutDetailView(LoginRequiredMixin, DetailView):
     template_name = 'ledger/payments/payment_out_detail.html'
     context_object_name = 'payment'
 
+    def get_queryset(self):
+        return PaymentOut.objects.select_related('expense_type', 'account', 'payee_supplier')
+
 class PaymentOutUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
     model = PaymentOut
     template_name = 'ledger/payments/payment_out_form.html'
@@ -570,6 +726,13 @@ class PaymentOutDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     success_url = reverse_lazy('payment_out_list')
     success_message = "Payment out was deleted successfully."
 
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ValidationError as e:
+            messages.error(self.request, ' '.join(e.messages))
+            return redirect('payment_out_detail', pk=self.object.pk)
+
 # Account Views
 class AccountListView(LoginRequiredMixin, ListView):
     model = Account
@@ -615,8 +778,12 @@ class AccountDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['payments_in'] = PaymentIn.objects.filter(account=self.object)
-        context['payments_out'] = PaymentOut.objects.filter(account=self.object)
+        context['payments_in'] = PaymentIn.objects.filter(
+            account=self.object
+        ).select_related('payer_member', 'revenue_type')
+        context['payments_out'] = PaymentOut.objects.filter(
+            account=self.object
+        ).select_related('payee_supplier')
         return context
 
 
@@ -624,21 +791,27 @@ class PaymentInPrintView(View):
     template_name = "ledger/payments/payment_in_receipt.html"
 
     def get(self, request, pk):
-        payment = get_object_or_404(PaymentIn, pk=pk)
+        payment = get_object_or_404(PaymentIn.objects.select_related('revenue_type'), pk=pk)
         context = {
             "payment": payment,
+            "receipt_day": timezone.now().date(),
         }
-        return render(request, self.template_name, context)
+        # Standalone page: the same for every viewer, but it prints the current date
+        return receipt_response(
+            request, payment, self.template_name, context, per_viewer=False, extra=(context['receipt_day'],)
+        )
     
 
  #payment out receipt view
 @login_required 
 def payment_out_receipt_view(request, pk):
-    payment = get_object_or_404(PaymentOut, pk=pk)
+    payment = get_object_or_404(
+        PaymentOut.objects.select_related('expense_type', 'account', 'payee_supplier'), pk=pk
+    )
     context = {
         'payment': payment
     }
-    return render(request, "ledger/payments/payment_out_receipt.html", context)
+    return receipt_response(request, payment, "ledger/payments/payment_out_receipt.html", context)
 
 # ledger/views.py - Add after other views
 
@@ -647,7 +820,9 @@ class MemberCashbookView(View):
         member = get_object_or_404(Member, pk=pk)
 
         # Filter payments linked to this member
-        payments = PaymentIn.objects.filter(payer_member=member).order_by('payment_date')
+        payments = PaymentIn.objects.filter(
+            payer_member=member
+        ).select_related('revenue_type', 'account').order_by('payment_date')
 
         total_paid = payments.aggregate(total=Sum('amount'))['total'] or 0
         payment_count = payments.count()
@@ -727,24 +902,9 @@ def cashbook_view(request):
     if isinstance(end_date, str):
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    # Get opening balance (balance before start_date)
-    opening_balance = 0
-    try:
-        # Sum of all accounts' balances at the start of the period
-        # Note: This assumes your account balances are current. For a real system, 
-        # you'd calculate balance up to the day before start_date
-        accounts = Account.objects.filter(is_active=True)
-        opening_balance = sum(account.balance for account in accounts)
-        
-        # Adjust for transactions that haven't been recorded in the period
-        # This is a simplified approach - in a real system, you'd track historical balances
-        pre_period_payments_in = PaymentIn.objects.filter(payment_date__lt=start_date).aggregate(Sum('amount'))['amount__sum'] or 0
-        pre_period_payments_out = PaymentOut.objects.filter(payment_date__lt=start_date).aggregate(Sum('amount'))['amount__sum'] or 0
-        opening_balance = pre_period_payments_in - pre_period_payments_out
-        
-    except Exception as e:
-        # If there's any error calculating opening balance, default to 0
-        opening_balance = 0
+    # Opening balance: closing balances at the end of the day before start_date.
+    # Closed periods are read from their frozen totals; only later payments are summed.
+    opening_balance = sum(balances_as_of(start_date - timedelta(days=1)).values(), Decimal('0'))
     
     # Get all transactions in the date range, ordered by date
     payments_in = PaymentIn.objects.filter(
@@ -819,4 +979,187 @@ def cashbook_view(request):
         'net_movement': net_movement,
         'transaction_count': len(all_transactions),
     }
-    return render(request, 'ledger/cashbook/cashbook.html', context)
\ No newline at end of file
+    return render(request, 'ledger/cashbook/cashbook.html', context)
+
+# Reports
+class ReportsRequiredMixin(StaffRequiredMixin):
+    """Users holding the can_view_reports permission, plus admins and treasurers"""
+
+    def test_func(self):
+        user = self.request.user
+        if user.has_perm('accounts.can_view_reports'):
+            return True
+        return is_ledger_staff(user) and getattr(user, 'role', '') in ['admin', 'treasurer']
+
+
+class IncomeStatementView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    template_name = 'ledger/reports/income_statement.html'
+
+    def get(self, request):
+        from .forms import IncomeStatementForm
+        from .reports import income_statement, statement_rows
+
+        today = timezone.now().date()
+        form = IncomeStatementForm(request.GET or None, initial={
+            'start_date': today.replace(month=1, day=1),
+            'end_date': today,
+            'granularity': 'auto',
+        })
+        if form.is_bound and form.is_valid():
+            start_date = form.cleaned_data['start_date']
+            end_date = form.cleaned_data['end_date']
+            granularity = form.cleaned_data['granularity'] or 'auto'
+        else:
+            start_date, end_date, granularity = today.replace(month=1, day=1), today, 'auto'
+
+        statement = income_statement(start_date, end_date, granularity)
+
+        if request.GET.get('export') == 'csv':
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = (
+                f'attachment; filename="income-expenditure-{start_date:%Y%m%d}-{end_date:%Y%m%d}.csv"'
+            )
+            csv.writer(response).writerows(statement_rows(statement))
+            return response
+
+        context = {
+            'form': form,
+            'statement': statement,
+            'sections': [
+                ('Income', statement['income'], statement['total_income'], 'text-success'),
+                ('Expenditure', statement['expenditure'], statement['total_expenditure'], 'text-danger'),
+            ],
+            'column_span': len(statement['columns']) + 4,
+            'export_query': request.GET.urlencode(),
+        }
+        return render(request, self.template_name, context)
+
+
+class BudgetReportView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    """Budgeted against actual income and spending per category for a month or a year."""
+    template_name = 'ledger/reports/budget_report.html'
+
+    def get(self, request):
+        from .budgets import budget_report
+        from .forms import BudgetReportForm
+
+        today = timezone.now().date()
+        form = BudgetReportForm(request.GET or None, initial={'year': today.year})
+        year, month = today.year, None
+        if form.is_bound and form.is_valid():
+            year, month = form.cleaned_data['year'], form.cleaned_data['month']
+
+        report = budget_report('month' if month else 'year', year, month)
+        context = {
+            'form': form,
+            'report': report,
+            'sections': [
+                ('Income', report['income'], 'text-success'),
+                ('Expenditure', report['expenses'], 'text-danger'),
+            ],
+        }
+        return render(request, self.template_name, context)
+
+
+class ExportJobListView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    """Start a full-ledger archive export and follow its progress."""
+    template_name = 'ledger/reports/export_list.html'
+
+    def get(self, request):
+        jobs = list(ExportJob.objects.select_related('requested_by')[:20])
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'jobs': [
+                {'id': job.pk, 'status': job.status, 'progress': job.progress, 'current_table': job.current_table,
+                 'rows_written': job.rows_written, 'rows_total': job.rows_total}
+                for job in jobs
+            ]})
+        context = {'jobs': jobs, 'active': any(job.is_active for job in jobs)}
+        return render(request, self.template_name, context)
+
+    def post(self, request):
+        from .jobs import enqueue
+
+        if ExportJob.objects.filter(status__in=['pending', 'running']).exists():
+            messages.warning(request, "An export is already in progress.")
+            return redirect('export_list')
+        with transaction.atomic():
+            job = ExportJob.objects.create(requested_by=request.user)
+            enqueue('export_ledger', export_job_id=job.pk)
+        messages.success(request, f"Export #{job.pk} started. The archive will be ready to download here shortly.")
+        return redirect('export_list')
+
+
+class ExportJobDownloadView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    def get(self, request, pk):
+        from .exports import archive_path
+
+        job = get_object_or_404(ExportJob, pk=pk, status='done')
+        file_path = archive_path(job)
+        if not file_path.is_file():
+            raise Http404("The archive is no longer on disk.")
+        return FileResponse(file_path.open('rb'), as_attachment=True, filename=job.file_name,
+                            content_type='application/zip')
+
+
+class StatementReconcileView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    """Match an uploaded bank or mobile-money statement against an account's payments."""
+    template_name = 'ledger/reports/statement_reconcile.html'
+
+    def get(self, request):
+        from .forms import StatementReconcileForm
+        return render(request, self.template_name, {'form': StatementReconcileForm()})
+
+    def post(self, request):
+        from .forms import StatementReconcileForm
+        from .reconciliation import reconcile_statement
+
+        form = StatementReconcileForm(request.POST, request.FILES)
+        result = None
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = reconcile_statement(stream, form.cleaned_data['account'], form.cleaned_data['window'])
+            except UnicodeDecodeError:
+                form.add_error('csv_file', 'The file must be a UTF-8 encoded CSV export.')
+            except ValidationError as exc:
+                form.add_error(None, exc)
+        return render(request, self.template_name, {'form': form, 'result': result})
+
+
+class AccountBalanceHistoryView(LoginRequiredMixin, ReportsRequiredMixin, View):
+    """Daily closing balances per account: the chart page, or with data=True the JSON series it plots."""
+    template_name = 'ledger/reports/balance_history.html'
+    data = False
+
+    def get(self, request):
+        from .balances import balance_history
+        from .forms import BalanceHistoryForm
+
+        today = timezone.now().date()
+        defaults = {'start_date': today.replace(month=1, day=1), 'end_date': today}
+        form = BalanceHistoryForm(request.GET or None, initial=defaults)
+        if not self.data:
+            return render(request, self.template_name, {'form': form, 'query': request.GET.urlencode()})
+        if form.is_bound and not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        options = form.cleaned_data if form.is_bound else {}
+        accounts = options.get('account') or Account.objects.filter(is_active=True).order_by('name')
+        history = balance_history(
+            accounts, options.get('start_date') or defaults['start_date'],
+            options.get('end_date') or defaults['end_date'], options.get('points') or 366,
+        )
+        # Columns rather than one object per point keep multi-year responses small
+        return JsonResponse({
+            'start': history['start'].isoformat(),
+            'end': history['end'].isoformat(),
+            'step_days': history['step_days'],
+            'accounts': [{
+                'id': account['id'],
+                'name': account['name'],
+                'dates': [point['date'].isoformat() for point in account['points']],
+                'balance': [float(point['balance']) for point in account['points']],
+                'low': [float(point['low']) for point in account['points']],
+                'high': [float(point['high']) for point in account['points']],
+            } for account in history['accounts']],
+        })
@@ -24,7 +24,6 @@ INSTALLED_APPS = [
     "django.contrib.humanize",
     'crispy_forms',
     'crispy_bootstrap5',
-    'django_tables2',
     'accounts',
     'ledger',
 ]
@@ -35,13 +34,17 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Middleware
 MIDDLEWARE = [
+    'ledger.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ledger.middleware.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ledger.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'rotaract_ledger.urls'
@@ -58,28 +61,137 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ledger.context_processors.clubs',
             ],
         },
     },
 ]
 
 # Database
+# WAL lets readers carry on while a payment batch is written. Transactions take
+# the write lock when they begin, so concurrent writers queue on `timeout`
+# instead of failing with "database is locked" when a read turns into a write.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+        },
+    }
+}
+
+# Cache
+# List totals and rendered receipts are cached here and invalidated on writes.
+# Every worker process must share it, or a write invalidates only the cache of
+# the worker that handled it and the others keep serving stale totals; the
+# default is a directory on local disk, memcached or redis suit larger sites.
+# Never set a per-process backend such as LocMemCache with several workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
     }
 }
+# Django's own backends cull a third of the entries once they hold MAX_ENTRIES
+# (300 by default), and the cull can take the version keys of ledger.caching
+# with it. A lost version restarts from the clock, so nothing stale is served,
+# but every entry of that family misses again; keep the limit well above the
+# number of cached lists and receipts. Memcached and redis evict by memory.
+if CACHES['default']['BACKEND'] in (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.db.DatabaseCache',
+):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=50000, cast=int)}
 
 # Static files
+# Bootstrap, Font Awesome and Chart.js are vendored under static/vendor/.
+# Outside DEBUG, collectstatic writes content-hashed copies plus .gz and .br
+# versions, and WhiteNoise serves the hashed names with a ten-year max-age.
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': config(
+            'STATICFILES_BACKEND',
+            default='django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# On-demand request profiles (?profile=1 for staff users)
+LEDGER_PROFILE_DIR = config('LEDGER_PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+
+# Per-process metric snapshots merged by the /metrics endpoint
+LEDGER_METRICS_DIR = config('LEDGER_METRICS_DIR', default=str(BASE_DIR / 'metrics'))
+# Snapshots untouched this long are archived even if their PID is running again
+LEDGER_METRICS_MAX_AGE = config('LEDGER_METRICS_MAX_AGE', default=86400, cast=int)
+# Bearer token Prometheus must send to scrape /metrics; staff sessions can always read it
+LEDGER_METRICS_TOKEN = config('LEDGER_METRICS_TOKEN', default='')
+
+# Full-ledger archives built by export jobs, offered for download from /exports/
+LEDGER_EXPORT_DIR = config('LEDGER_EXPORT_DIR', default=str(BASE_DIR / 'exports'))
+
+# Background jobs (manage.py run_worker): a running job whose worker hasn't refreshed its lock for this many
+# seconds is assumed abandoned (workers refresh it every quarter of this while the job runs)
+LEDGER_JOB_STALE_AFTER = config('LEDGER_JOB_STALE_AFTER', default=3600, cast=int)
+LEDGER_WORKER_PROCESSES = config('LEDGER_WORKER_PROCESSES', default=2, cast=int)
+# The only management commands the call_command task may run; Schedule and Job rows are editable in the admin
+LEDGER_JOB_COMMANDS = [
+    'reconcile_balances', 'rebuild_category_totals', 'find_duplicate_payments', 'clearsessions',
+]
+# Recurring tasks, kept in sync with the Schedule table when a worker starts; cron times are in TIME_ZONE
+LEDGER_SCHEDULES = [
+    {'name': 'nightly-reconciliation', 'cron': '30 2 * * *', 'task': 'call_command',
+     'kwargs': {'command': 'reconcile_balances'}},
+    {'name': 'weekly-full-reconciliation', 'cron': '30 3 * * 0', 'task': 'call_command',
+     'kwargs': {'command': 'reconcile_balances', 'options': {'full': True}}},
+    {'name': 'nightly-session-cleanup', 'cron': '0 4 * * *', 'task': 'call_command',
+     'kwargs': {'command': 'clearsessions'}},
+    {'name': 'nightly-idempotency-cleanup', 'cron': '15 4 * * *', 'task': 'purge_idempotency_keys'},
+    # Picks up receipts whose send job was lost; normally a send is queued as soon as an email is
+    {'name': 'email-outbox', 'cron': '*/10 * * * *', 'task': 'send_emails'},
+    # Last month's statements to every member on the 1st; enable it in the admin once email is configured
+    {'name': 'monthly-statements', 'cron': '0 6 1 * *', 'task': 'queue_statements', 'enabled': False},
+]
+
+# Email: receipts and statements are queued and sent by the worker in batches over one connection
+EMAIL_BACKEND = config(
+    'EMAIL_BACKEND',
+    default='django.core.mail.backends.console.EmailBackend' if DEBUG
+    else 'django.core.mail.backends.smtp.EmailBackend'
+)
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='ledger@localhost')
+LEDGER_ORGANISATION_NAME = config('LEDGER_ORGANISATION_NAME', default='Rotary Financial Ledger')
+# Messages per SMTP connection, and the most the worker sends per minute
+LEDGER_EMAIL_BATCH_SIZE = config('LEDGER_EMAIL_BATCH_SIZE', default=100, cast=int)
+LEDGER_EMAIL_RATE_PER_MINUTE = config('LEDGER_EMAIL_RATE_PER_MINUTE', default=600, cast=int)
+# Email a receipt to the payer whenever a payment in is recorded
+LEDGER_EMAIL_RECEIPTS = config('LEDGER_EMAIL_RECEIPTS', default=True, cast=bool)
+
+# Payment API (/api/payments/...): the most payments one batch request may post, and how long
+# a response is kept for replay to a retry with the same Idempotency-Key
+LEDGER_API_BATCH_LIMIT = config('LEDGER_API_BATCH_LIMIT', default=500, cast=int)
+LEDGER_API_IDEMPOTENCY_HOURS = config('LEDGER_API_IDEMPOTENCY_HOURS', default=24, cast=int)
+
 # Authentication
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGIN_URL = 'login'
@@ -91,4 +203,7 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Tests get throwaway cache and metrics directories; see ledger/test_runner.py
+TEST_RUNNER = 'ledger.test_runner.LedgerTestRunner'